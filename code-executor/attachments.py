@@ -0,0 +1,108 @@
+"""
+Data Attachments - Arrow datasets handed to sandboxed code
+Decodes CodeExecutionRequest attachments into pandas DataFrames
+"""
+import sys
+sys.path.append('/app')
+
+import os
+import base64
+import hashlib
+import keyword
+from typing import Dict, Any, List
+
+from shared.config import settings
+from shared.models import DataAttachment
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Names the sandbox already binds (pre-imported modules)
+RESERVED_NAMES = {'pd', 'np', 'plt', 'go', 'px', 'math', 'stats', 'result'}
+
+
+class AttachmentError(Exception):
+    """Raised when an attachment cannot be loaded"""
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        return pyarrow
+    except ImportError:
+        logger.error("pyarrow not installed. Run: pip install pyarrow")
+        raise
+
+
+def _check_name(name: str):
+    if not name.isidentifier() or keyword.iskeyword(name) or name.startswith('_') or name in RESERVED_NAMES:
+        raise AttachmentError(f"Invalid attachment name '{name}'")
+
+
+def _artifact_path(handle: str) -> str:
+    """Resolve an artifact handle inside the shared attachment directory"""
+    root = os.path.realpath(settings.CODE_EXECUTOR_ATTACHMENT_DIR)
+    path = os.path.realpath(os.path.join(root, handle))
+    if os.path.dirname(path) != root:
+        raise AttachmentError(f"Artifact '{handle}' is outside the attachment directory")
+    if not os.path.isfile(path):
+        raise AttachmentError(f"Artifact '{handle}' not found")
+    return path
+
+
+def attachment_key(attachment: DataAttachment) -> str:
+    """Content identity of an attachment (artifact handles are already content hashes)"""
+    if attachment.format == "artifact":
+        return f"artifact:{attachment.artifact}"
+    return "arrow:" + hashlib.sha1((attachment.data or "").encode("ascii")).hexdigest()
+
+
+def attachment_bytes(attachment: DataAttachment) -> int:
+    """Payload size of an attachment (decoded Arrow bytes), 0 if it cannot be resolved"""
+    if attachment.format == "arrow":
+        data = attachment.data or ""
+        return len(data) * 3 // 4 - data[-2:].count("=")
+    try:
+        return os.path.getsize(_artifact_path(attachment.artifact or ""))
+    except (AttachmentError, OSError):
+        return 0
+
+
+def load_attachment(attachment: DataAttachment):
+    """
+    Decode one attachment into a pandas DataFrame
+
+    Args:
+        attachment: Inline Arrow IPC stream or artifact handle
+
+    Returns:
+        pandas DataFrame
+    """
+    _check_name(attachment.name)
+    pa = _pyarrow()
+    if attachment.format == "arrow":
+        if not attachment.data:
+            raise AttachmentError(f"Attachment '{attachment.name}' has no data")
+        table = pa.ipc.open_stream(pa.py_buffer(base64.b64decode(attachment.data))).read_all()
+    else:
+        if not attachment.artifact:
+            raise AttachmentError(f"Attachment '{attachment.name}' has no artifact handle")
+        with pa.memory_map(_artifact_path(attachment.artifact), 'r') as source:
+            table = pa.ipc.open_stream(source).read_all()
+    return table.to_pandas()
+
+
+def load_attachments(attachments: List[DataAttachment]) -> Dict[str, Any]:
+    """
+    Decode all attachments into name → DataFrame
+
+    Returns:
+        Variables to inject into the sandbox globals
+    """
+    frames = {}
+    for attachment in attachments or []:
+        frames[attachment.name] = load_attachment(attachment)
+        logger.info(f"📎 Attachment '{attachment.name}' ({attachment.format}): {len(frames[attachment.name])} rows")
+    return frames
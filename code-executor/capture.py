@@ -0,0 +1,139 @@
+"""
+Output Capture - Per-execution stdout/stderr inside a worker
+Replaces contextlib.redirect_stdout/redirect_stderr (a process-global swap per job)
+
+Each worker installs stream proxies as sys.stdout/sys.stderr once, at
+start-up. While a job runs, the proxies write to that job's JobOutput: a
+bounded buffer per stream (CODE_EXECUTOR_MAX_OUTPUT_BYTES) whose new text
+is also sent to the server in chunks as it is produced, so long-running
+jobs can stream partial output. Sandboxed code additionally gets a `print`
+bound to its own JobOutput, so its output never depends on sys.stdout.
+"""
+import sys
+sys.path.append('/app')
+
+import io
+import time
+import threading
+import builtins
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from limits import BoundedOutput
+
+STREAMS = ("stdout", "stderr")
+# Pending text is sent once it reaches this size, or on a newline after CHUNK_INTERVAL seconds
+CHUNK_CHARS = 4096
+CHUNK_INTERVAL = 0.1
+
+_current: Optional["JobOutput"] = None
+_emit: Optional[Callable[[str, str], None]] = None
+
+
+class JobOutput:
+    """Bounded stdout/stderr of one execution, with chunked streaming of new text"""
+
+    def __init__(self, limit: int, emit: Optional[Callable[[str, str], None]] = None):
+        self.buffers: Dict[str, BoundedOutput] = {name: BoundedOutput(limit) for name in STREAMS}
+        self._emit = emit
+        self._pending = {name: [] for name in STREAMS}
+        self._pending_chars = {name: 0 for name in STREAMS}
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+
+    def write(self, stream: str, text: str) -> int:
+        with self._lock:
+            buffer = self.buffers[stream]
+            kept = buffer.fit(text)
+            try:
+                return buffer.write(text)
+            finally:
+                # Stream what was kept, including the part before an overflow
+                self._queue(stream, kept)
+
+    def _queue(self, stream: str, text: str):
+        if not self._emit or not text:
+            return
+        self._pending[stream].append(text)
+        self._pending_chars[stream] += len(text)
+        due = "\n" in text and time.time() - self._flushed_at >= CHUNK_INTERVAL
+        if due or self._pending_chars[stream] >= CHUNK_CHARS:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        for stream in STREAMS:
+            if self._pending[stream]:
+                # Cleared before sending: a limit raised right after the send must not resend it
+                text = "".join(self._pending[stream])
+                self._pending[stream] = []
+                self._pending_chars[stream] = 0
+                self._emit(stream, text)
+        self._flushed_at = time.time()
+
+    def flush(self):
+        with self._lock:
+            if self._emit:
+                self._flush_locked()
+
+    def getvalue(self, stream: str) -> str:
+        return self.buffers[stream].getvalue()
+
+    def print(self, *args, sep: Optional[str] = " ", end: Optional[str] = "\n", file=None, flush: bool = False):
+        """print() for sandboxed code: this execution's stdout/stderr, whatever sys.stdout is"""
+        if file is None or file is sys.stdout:
+            stream = "stdout"
+        elif file is sys.stderr:
+            stream = "stderr"
+        else:
+            return builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+        text = (" " if sep is None else sep).join(str(arg) for arg in args)
+        self.write(stream, text + ("\n" if end is None else end))
+
+
+class StreamProxy(io.TextIOBase):
+    """sys.stdout/sys.stderr of a worker: the running job's capture, else the original stream"""
+
+    def __init__(self, name: str, original):
+        self.name = name
+        self._original = original
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        job = _current
+        if job is not None:
+            return job.write(self.name, text)
+        return self._original.write(text)
+
+    def flush(self):
+        if _current is None:
+            self._original.flush()
+
+
+def install(emit: Optional[Callable[[str, str], None]] = None):
+    """
+    Install the stream proxies in this (worker) process
+
+    Args:
+        emit: Called with (stream, text) for each chunk of new output
+    """
+    global _emit
+    _emit = emit
+    if not isinstance(sys.stdout, StreamProxy):
+        sys.stdout = StreamProxy("stdout", sys.stdout)
+    if not isinstance(sys.stderr, StreamProxy):
+        sys.stderr = StreamProxy("stderr", sys.stderr)
+
+
+@contextmanager
+def job_output(limit: int):
+    """Capture one execution's output (streamed when the worker was installed with an emitter)"""
+    global _current
+    output = JobOutput(limit, _emit)
+    previous, _current = _current, output
+    try:
+        yield output
+    finally:
+        _current = previous
+        output.flush()
@@ -0,0 +1,138 @@
+"""
+Resource Limits - Per-job CPU, memory and output caps inside a worker
+Turns CODE_EXECUTOR_CPU_LIMIT / CODE_EXECUTOR_MEMORY_LIMIT into enforced rlimits
+
+Limits are applied as soft rlimits around each job and lifted afterwards,
+so a long-lived worker can run many jobs:
+
+- CPU: RLIMIT_CPU at the CPU time used so far plus the job's budget
+  (CODE_EXECUTOR_CPU_SECONDS, or CODE_EXECUTOR_CPU_LIMIT cores x 80% of the
+  wall-clock timeout), rounded down to whole seconds so the job never gets
+  more than its budget; SIGXCPU raises CpuLimitExceeded in the job (it is
+  blocked while the worker writes to its pipe, see worker_pool.py)
+- memory: RLIMIT_AS at the current address space plus
+  CODE_EXECUTOR_MEMORY_LIMIT; allocations beyond it raise MemoryError
+- output: stdout/stderr captures stop at CODE_EXECUTOR_MAX_OUTPUT_BYTES
+
+The wall-clock limit is enforced by the pool, which kills the worker.
+"""
+import sys
+sys.path.append('/app')
+
+import io
+import os
+import re
+import math
+import signal
+import resource
+
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+class LimitExceeded(BaseException):
+    """
+    A resource limit was hit
+
+    Derives from BaseException so `except Exception` in generated code
+    cannot swallow it.
+    """
+    reason = "exception"
+
+
+class CpuLimitExceeded(LimitExceeded):
+    reason = "cpu_limit"
+
+
+class OutputLimitExceeded(LimitExceeded):
+    reason = "output_limit"
+
+
+def parse_size(value: str) -> int:
+    """Docker-style size ('1g', '512m', '1048576') in bytes"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)b?\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _on_sigxcpu(signum, frame):
+    raise CpuLimitExceeded("CPU time limit exceeded")
+
+
+class ResourceLimits:
+    """Context manager applying per-job soft rlimits in the current (worker) process"""
+
+    def __init__(self, cpu_seconds: float, memory_bytes: int):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self._applied = []
+
+    def _set_soft(self, kind: int, soft: int):
+        original, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        try:
+            resource.setrlimit(kind, (soft, hard))
+            self._applied.append((kind, original))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not set rlimit {kind}: {e}")
+
+    def __enter__(self):
+        if self.cpu_seconds > 0:
+            signal.signal(signal.SIGXCPU, _on_sigxcpu)
+            # RLIMIT_CPU counts whole seconds: round down, but leave the job at least part of one
+            used = _cpu_seconds()
+            self._set_soft(resource.RLIMIT_CPU, max(math.floor(used + self.cpu_seconds), math.floor(used) + 1))
+        if self.memory_bytes > 0:
+            base = _address_space_bytes()
+            if base:
+                self._set_soft(resource.RLIMIT_AS, base + self.memory_bytes)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Soft limits may be raised back up to the (untouched) hard limit
+        for kind, original in self._applied:
+            _, hard = resource.getrlimit(kind)
+            resource.setrlimit(kind, (original, hard))
+        self._applied = []
+        return False
+
+
+class BoundedOutput(io.StringIO):
+    """Capture buffer that keeps at most `limit` bytes (UTF-8), then raises OutputLimitExceeded"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.size = 0
+
+    def fit(self, s: str) -> str:
+        """The longest prefix of s that still fits (whole characters only)"""
+        data = s.encode("utf-8", "replace")
+        room = max(self.limit - self.size, 0)
+        return s if len(data) <= room else data[:room].decode("utf-8", "ignore")
+
+    def write(self, s: str) -> int:
+        kept = self.fit(s)
+        super().write(kept)
+        self.size += len(kept.encode("utf-8", "replace"))
+        if len(kept) < len(s):
+            raise OutputLimitExceeded(f"Output exceeded {self.limit} bytes")
+        return len(s)
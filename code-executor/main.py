@@ -5,8 +5,11 @@ Safely executes Python code in a sandboxed environment
 import sys
 sys.path.append('/app')
 
+import json
+import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 
 from shared.config import settings
@@ -18,6 +21,7 @@ from shared.models import (
 from shared.utils import get_logger
 
 from sandbox import CodeSandbox
+from profiling import profile_stats
 
 logger = get_logger(__name__)
 
@@ -47,6 +51,12 @@ async def startup_event():
     logger.info(f"Timeout: {settings.CODE_EXECUTOR_TIMEOUT}s")
     logger.info(f"Memory Limit: {settings.CODE_EXECUTOR_MEMORY_LIMIT}")
     logger.info(f"CPU Limit: {settings.CODE_EXECUTOR_CPU_LIMIT}")
+    sandbox.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the worker pool"""
+    await sandbox.close()
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -58,33 +68,51 @@ async def health_check():
         details={
             "timeout": settings.CODE_EXECUTOR_TIMEOUT,
             "memory_limit": settings.CODE_EXECUTOR_MEMORY_LIMIT,
-            "cpu_limit": settings.CODE_EXECUTOR_CPU_LIMIT
+            "cpu_limit": settings.CODE_EXECUTOR_CPU_LIMIT,
+            "cpu_seconds": sandbox.cpu_seconds(),
+            "workers": sandbox.pool.stats()["workers"]
         }
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Worker pool, session and execution profile metrics (queue depth, utilisation, time and memory breakdown)"""
+    return {
+        "pool": sandbox.pool.stats(),
+        "sessions": sandbox.sessions.stats(),
+        "executions": profile_stats.stats()
+    }
+
 @app.post("/execute", response_model=CodeExecutionResult)
 async def execute_code(request: CodeExecutionRequest):
     """
     Execute Python code in sandbox
     
     Args:
-        request: CodeExecutionRequest with code, timeout, context
+        request: CodeExecutionRequest with code, timeout, context, attachments
         
     Returns:
         CodeExecutionResult with success, stdout, stderr, result, error
     """
     try:
-        logger.info(f"Executing code ({len(request.code)} chars)")
+        logger.info(f"Executing code ({len(request.code)} chars, {len(request.attachments)} attachment(s))")
         logger.debug(f"Code:\n{request.code}")
         
         result = await sandbox.execute(
             code=request.code,
             timeout=request.timeout,
-            context=request.context or {}
+            context=request.context or {},
+            attachments=request.attachments,
+            session_id=request.session_id,
+            profile_top=request.profile_top
         )
         
         if result.success:
             logger.info(f"Execution succeeded in {result.execution_time:.2f}s")
+            if result.profile:
+                p = result.profile
+                logger.info(f"⏱️  queue {p.queue_wait or 0:.3f}s, load {p.load_time:.3f}s, compile {p.compile_time:.3f}s, "
+                            f"run {p.run_time:.3f}s, cpu {p.cpu_time:.3f}s, peak +{p.peak_rss_delta // (1024 * 1024)} MB")
         else:
             logger.warning(f"Execution failed: {result.error}")
         
@@ -94,6 +122,58 @@ async def execute_code(request: CodeExecutionRequest):
         logger.error(f"Execution error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/execute/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    """
+    Execute Python code in sandbox, streaming output as it is produced
+    
+    Server-sent events: {"type": "stdout"|"stderr", "content": "..."} chunks
+    while the code runs, then {"type": "result", "result": CodeExecutionResult}
+    and [DONE]. The result carries the complete (bounded) stdout/stderr.
+    """
+    logger.info(f"Executing code with streaming ({len(request.code)} chars, {len(request.attachments)} attachment(s))")
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_output(stream: str, text: str):
+        events.put_nowait({"type": stream, "content": text})
+    
+    async def run():
+        try:
+            result = await sandbox.execute(
+                code=request.code,
+                timeout=request.timeout,
+                context=request.context or {},
+                attachments=request.attachments,
+                on_output=on_output,
+                session_id=request.session_id,
+                profile_top=request.profile_top
+            )
+            events.put_nowait({"type": "result", "result": result.model_dump()})
+        except Exception as e:
+            logger.error(f"Execution error: {e}", exc_info=True)
+            events.put_nowait({"type": "error", "error": str(e)})
+    
+    async def event_generator():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+                if event["type"] in ("result", "error"):
+                    break
+            yield "data: [DONE]\n\n"
+        finally:
+            # Client went away: cancelling the job kills and replaces its worker
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    """End a conversation's analysis session and free its worker"""
+    return {"session_id": session_id, "ended": sandbox.sessions.end(session_id)}
+
 @app.post("/validate")
 async def validate_code(code: str):
     """
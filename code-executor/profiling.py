@@ -0,0 +1,184 @@
+"""
+Execution Profiling - Where an execution's time, CPU and memory went
+Measures each job in its worker and aggregates the results for /metrics
+
+A slow analytics turn used to report a single execution_time. Every result
+now carries an ExecutionProfile:
+
+- queue_wait: submission until a worker started the job (pool or session queue)
+- load / compile / run phases, the job's wall time and the worker's CPU time
+  (user + system; CPU well below wall means waiting, not computing)
+- peak_rss_delta: the kernel's peak-RSS mark is reset before the job
+  (/proc/self/clear_refs), so this is the job's own peak above its starting
+  RSS; without that, growth of the process's lifetime peak is reported
+- input (code + attachments) and output (stdout + stderr) sizes
+- optionally the top-N functions by cumulative time, from cProfile
+"""
+import sys
+sys.path.append('/app')
+
+import time
+import resource
+import cProfile
+import pstats
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from shared.models import ExecutionProfile
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Upper bound on profile_top, to keep results small
+MAX_PROFILE_FUNCTIONS = 50
+TIMED_FIELDS = ("queue_wait", "load_time", "compile_time", "run_time", "wall_time", "cpu_time")
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _memory_status() -> Dict[str, int]:
+    """VmRSS and VmHWM (peak RSS) of this process in bytes"""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, amount = line.split(":", 1)
+                    values[name] = int(amount.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    return values
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS mark of this process to its current RSS (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class JobProfiler:
+    """Measurements of one job, taken inside the worker"""
+
+    def __init__(self, submitted: Optional[float] = None, top: int = 0):
+        """
+        Args:
+            submitted: time.time() at which the server submitted the job
+            top: Number of functions to report from cProfile (0 = don't profile)
+        """
+        self.started = time.time()
+        self.queue_wait = max(self.started - submitted, 0.0) if submitted else None
+        self.top = min(max(top, 0), MAX_PROFILE_FUNCTIONS)
+        self.phases = {"load": 0.0, "compile": 0.0, "run": 0.0}
+        self._profiler: Optional[cProfile.Profile] = None
+        self._peak_reset = _reset_peak_rss()
+        self._rss_start = _memory_status().get("VmRSS", 0)
+        self._maxrss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self._cpu_start = _cpu_seconds()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase (load, compile, run); the run phase is also cProfiled when requested"""
+        if name == "run" and self.top:
+            self._profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if self._profiler is not None:
+                with self._profiler:
+                    yield
+            else:
+                yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def _functions(self) -> Optional[List[Dict[str, Any]]]:
+        if self._profiler is None:
+            return None
+        stats = pstats.Stats(self._profiler).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        return [
+            {
+                "function": f"{filename}:{line}({name})" if line else name,
+                "calls": calls,
+                "total_time": round(total, 6),
+                "cumulative_time": round(cumulative, 6),
+            }
+            for (filename, line, name), (_, calls, total, cumulative, _) in ranked
+        ]
+
+    def finish(self, input_bytes: int, output_bytes: int) -> ExecutionProfile:
+        """Stop measuring and build the job's profile"""
+        cpu_time = _cpu_seconds() - self._cpu_start
+        if self._peak_reset:
+            peak = _memory_status().get("VmHWM", 0)
+            peak_delta = max(peak - self._rss_start, 0)
+        else:
+            peak_delta = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - self._maxrss_start, 0)
+        return ExecutionProfile(
+            queue_wait=self.queue_wait,
+            load_time=self.phases["load"],
+            compile_time=self.phases["compile"],
+            run_time=self.phases["run"],
+            wall_time=time.time() - self.started,
+            cpu_time=cpu_time,
+            peak_rss_delta=peak_delta,
+            input_bytes=input_bytes,
+            output_bytes=output_bytes,
+            functions=self._functions()
+        )
+
+
+class ProfileStats:
+    """Aggregates execution profiles in the server for /metrics"""
+
+    def __init__(self):
+        self.executions = 0
+        self.profiled = 0
+        self.failures: Dict[str, int] = {}
+        self.totals = {name: 0.0 for name in TIMED_FIELDS}
+        self.maxima = {name: 0.0 for name in TIMED_FIELDS}
+        self.max_peak_rss_delta = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+
+    def record(self, result):
+        """Add one CodeExecutionResult (with or without a profile)"""
+        self.executions += 1
+        if result.failure_reason:
+            self.failures[result.failure_reason] = self.failures.get(result.failure_reason, 0) + 1
+        profile = result.profile
+        if profile is None:
+            return
+        self.profiled += 1
+        for name in TIMED_FIELDS:
+            value = getattr(profile, name) or 0.0
+            self.totals[name] += value
+            self.maxima[name] = max(self.maxima[name], value)
+        self.max_peak_rss_delta = max(self.max_peak_rss_delta, profile.peak_rss_delta)
+        self.input_bytes += profile.input_bytes
+        self.output_bytes += profile.output_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        count = self.profiled
+        return {
+            "executions": self.executions,
+            "profiled": count,
+            "failures": dict(self.failures),
+            "average": {name: round(total / count, 4) if count else None for name, total in self.totals.items()},
+            "max": {name: round(value, 4) for name, value in self.maxima.items()},
+            "cpu_utilisation": round(self.totals["cpu_time"] / self.totals["wall_time"], 3)
+            if self.totals["wall_time"] else None,
+            "max_peak_rss_delta_mb": round(self.max_peak_rss_delta / (1024 * 1024), 1),
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+        }
+
+
+# Global instance
+profile_stats = ProfileStats()
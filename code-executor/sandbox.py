@@ -5,21 +5,33 @@ Implements security restrictions and resource limits
 import sys
 sys.path.append('/app')
 
-import io
+import ast
 import time
+import builtins
 import signal
+import importlib
 import traceback
 from types import ModuleType
-from contextlib import redirect_stdout, redirect_stderr
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Callable
 import asyncio
 
+from shared import sandbox_policy
 from shared.config import settings
-from shared.models import CodeExecutionResult
+from shared.models import CodeExecutionResult, DataAttachment
 from shared.utils import get_logger
 
+from attachments import load_attachment, load_attachments, attachment_key, attachment_bytes
+from worker_pool import WorkerPool, WorkerCrashed
+from sessions import SessionManager, SessionsFull
+from limits import ResourceLimits, LimitExceeded, parse_size
+import capture
+from profiling import JobProfiler, profile_stats
+
 logger = get_logger(__name__)
 
+# Share of the wall-clock timeout given to the default CPU budget
+CPU_HEADROOM = 0.8
+
 class TimeoutError(Exception):
     """Raised when code execution times out"""
     pass
@@ -40,97 +52,92 @@ class CodeSandbox:
 
     def _limited_import(name, globals=None, locals=None, fromlist=(), level=0):
         """Controlled import: only allow whitelisted modules (including submodules)."""
-        root_name = name.split('.')[0]
-        allowed = CodeSandbox.ALLOWED_IMPORTS
-        if name in allowed or root_name in {m.split('.')[0] for m in allowed}:
+        if level == 0 and sandbox_policy.import_allowed(name):
             return CodeSandbox._ORIGINAL_IMPORT(name, globals, locals, fromlist, level)
         raise ImportError(f"Module '{name}' is not permitted in sandbox")
 
-    SAFE_BUILTINS = {
-        'abs': abs,
-        'all': all,
-        'any': any,
-        'bool': bool,
-        'dict': dict,
-        'enumerate': enumerate,
-        'filter': filter,
-        'float': float,
-        'int': int,
-        'len': len,
-        'list': list,
-        'map': map,
-        'max': max,
-        'min': min,
-        'print': print,
-        'range': range,
-        'round': round,
-        'set': set,
-        'sorted': sorted,
-        'str': str,
-        'sum': sum,
-        'tuple': tuple,
-        'type': type,
-        'zip': zip,
-        'isinstance': isinstance,
-        'getattr': getattr,
-        'hasattr': hasattr,
-        'setattr': setattr,
-        '__import__': _limited_import,
-        # Exception classes needed for error handling
-        'Exception': Exception,
-        'KeyError': KeyError,
-        'ValueError': ValueError,
-        'TypeError': TypeError,
-        'IndexError': IndexError,
-        'AttributeError': AttributeError,
-    }
+    # Policy (builtins, import whitelist/blacklist) lives in shared.sandbox_policy so the
+    # orchestrator can pre-validate generated code against exactly the same rules
+    SAFE_BUILTINS = {name: getattr(builtins, name) for name in sandbox_policy.SAFE_BUILTIN_NAMES}
+    SAFE_BUILTINS['__import__'] = _limited_import
     
     # Allowed imports - whitelist approach
-    ALLOWED_IMPORTS = {
-        'pandas',
-        'numpy',
-        'matplotlib',
-        'matplotlib.pyplot',
-        'seaborn',
-        'plotly',
-        'plotly.graph_objects',
-        'plotly.express',
-        'datetime',
-        'json',
-        'math',
-        'time',
-        'statistics',
-        'collections',
-        'itertools',
-    }
+    ALLOWED_IMPORTS = sandbox_policy.ALLOWED_IMPORTS
     
     # Forbidden imports - blacklist (extra safety)
-    FORBIDDEN_IMPORTS = {
-        'os',
-        'sys',
-        'subprocess',
-        'socket',
-        'requests',
-        'urllib',
-        'pickle',
-        'shelve',
-        '__import__',
-        'eval',
-        'exec',
-        'compile',
-        'open',  # File I/O
-        'file',
-    }
+    FORBIDDEN_IMPORTS = sandbox_policy.FORBIDDEN_IMPORTS
+    
+    # Pre-imported modules by alias, loaded once per process (see warm())
+    _MODULES: Dict[str, ModuleType] = {}
     
     def __init__(self):
         """Initialize sandbox"""
         self.default_timeout = settings.CODE_EXECUTOR_TIMEOUT
+        self.memory_bytes = parse_size(settings.CODE_EXECUTOR_MEMORY_LIMIT)
+        self.pool = WorkerPool(self._run_code, initializer=capture.install)
+        self.sessions = SessionManager(self._run_cell, initializer=capture.install)
+        # State of the session this process serves (set in session workers only)
+        self._session: Optional[Dict[str, Any]] = None
+    
+    def cpu_seconds(self, timeout: Optional[int] = None) -> float:
+        """
+        CPU-time budget of one job
+        
+        CODE_EXECUTOR_CPU_SECONDS when set, else CODE_EXECUTOR_CPU_LIMIT cores over
+        CPU_HEADROOM of the wall-clock timeout: a single busy thread reports
+        cpu_limit instead of always reaching the timeout first.
+        """
+        if settings.CODE_EXECUTOR_CPU_SECONDS > 0:
+            return settings.CODE_EXECUTOR_CPU_SECONDS
+        return CPU_HEADROOM * settings.CODE_EXECUTOR_CPU_LIMIT * (timeout or self.default_timeout)
+    
+    @classmethod
+    def warm(cls):
+        """
+        Import the scientific stack and build the matplotlib font cache
+        
+        Called in the server process before the workers are forked, so
+        every worker inherits the loaded modules.
+        """
+        start = time.time()
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+        except Exception as e:
+            logger.warning(f"matplotlib unavailable: {e}")
+        for mod_name, alias in sandbox_policy.PREIMPORTS.items():
+            try:
+                cls._MODULES[alias] = importlib.import_module(mod_name)
+            except Exception as e:
+                logger.warning(f"Pre-import of {mod_name} failed: {e}")
+        plt = cls._MODULES.get('plt')
+        if plt is not None:
+            # First text rendering loads the font cache; do it once here, not per job
+            fig = plt.figure(figsize=(1, 1))
+            fig.text(0.5, 0.5, "warm")
+            fig.canvas.draw()
+            plt.close(fig)
+        logger.info(f"🔥 Sandbox warmed in {time.time() - start:.2f}s ({', '.join(cls._MODULES)})")
+    
+    def start(self):
+        """Warm the stack and fork the worker pool (from the running event loop)"""
+        self.warm()
+        self.pool.start()
+        self.sessions.start()
+    
+    async def close(self):
+        await self.sessions.close()
+        await self.pool.close()
     
     async def execute(
         self,
         code: str,
         timeout: Optional[int] = None,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        attachments: Optional[List[DataAttachment]] = None,
+        on_output: Optional[Callable[[str, str], None]] = None,
+        session_id: Optional[str] = None,
+        profile_top: int = 0
     ) -> CodeExecutionResult:
         """
         Execute Python code safely
@@ -139,6 +146,10 @@ class CodeSandbox:
             code: Python code to execute
             timeout: Execution timeout in seconds
             context: Variables to inject into execution context
+            attachments: Arrow datasets bound as DataFrames (never part of the source)
+            on_output: Called with (stream, text) as partial output arrives
+            session_id: Conversation ID: run as the next cell of its persistent session
+            profile_top: Include the N functions with the most cumulative time in the profile
             
         Returns:
             CodeExecutionResult
@@ -148,134 +159,216 @@ class CodeSandbox:
         
         # Validate code first
         if not self._validate_code(code):
-            return CodeExecutionResult(
+            result = CodeExecutionResult(
                 success=False,
                 stdout="",
                 stderr="",
                 error="Code contains forbidden operations",
-                execution_time=0.0
+                execution_time=0.0,
+                failure_reason="forbidden_operation"
             )
+            profile_stats.record(result)
+            return result
         
-        # Run in subprocess with timeout
+        # Run on a warm worker process; a job that overruns is killed with its worker
         try:
-            # Use asyncio to run with timeout
-            result = await asyncio.wait_for(
-                self._execute_in_sandbox(code, context or {}),
-                timeout=timeout
-            )
-            return result
+            args = (code, context or {}, attachments or [], timeout, time.time(), profile_top)
+            result = None
+            if session_id and self.sessions.enabled:
+                try:
+                    result = await self.sessions.run(session_id, args, timeout, on_output)
+                except SessionsFull as e:
+                    # No session can be opened: run the cell with fresh globals rather than wait
+                    logger.warning(f"Session {session_id} not opened ({e}), running statelessly")
+            if result is None:
+                result = await self.pool.run(args, timeout, on_output)
             
         except asyncio.TimeoutError:
             logger.warning(f"Code execution timed out after {timeout}s")
-            return CodeExecutionResult(
+            result = CodeExecutionResult(
                 success=False,
                 stdout="",
                 stderr="",
                 error=f"Execution timed out after {timeout} seconds",
-                execution_time=timeout
+                execution_time=timeout,
+                failure_reason="timeout"
+            )
+        except WorkerCrashed as e:
+            result = CodeExecutionResult(
+                success=False,
+                stdout="",
+                stderr="",
+                error=f"Execution worker crashed: {e}",
+                execution_time=0.0,
+                failure_reason="worker_crashed"
             )
         except Exception as e:
             logger.error(f"Sandbox execution error: {e}", exc_info=True)
-            return CodeExecutionResult(
+            result = CodeExecutionResult(
                 success=False,
                 stdout="",
                 stderr="",
                 error=str(e),
-                execution_time=0.0
+                execution_time=0.0,
+                failure_reason="exception"
             )
+        
+        profile_stats.record(result)
+        return result
     
-    async def _execute_in_sandbox(
+    def _run_cell(
         self,
         code: str,
-        context: Dict[str, Any]
+        context: Dict[str, Any],
+        attachments: Optional[List[DataAttachment]] = None,
+        timeout: Optional[int] = None,
+        submitted: Optional[float] = None,
+        profile_top: int = 0
     ) -> CodeExecutionResult:
         """
-        Execute code in sandboxed environment
-        This runs in a separate thread to allow timeout
-        """
-        import concurrent.futures
-        
-        # Run in thread pool executor
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            result = await loop.run_in_executor(
-                executor,
-                self._run_code,
-                code,
-                context
-            )
+        Run the next cell of this worker's session (called in a session worker)
         
+        Globals persist from cell to cell; decoded attachments are kept by
+        content key and rebound on every cell, so 'df' always holds the
+        attached data even if an earlier cell reassigned it. The result
+        lists the variables later cells can use (session_variables).
+        """
+        if self._session is None:
+            self._session = {"globals": {}, "frames": {}, "cells": 0}
+        self._session["cells"] += 1
+        result = self._run_code(code, context, attachments, timeout, submitted, profile_top, session=self._session)
+        result.session_cell = self._session["cells"]
+        result.session_variables = self._session_variables()
         return result
     
-    def _run_code(self, code: str, context: Dict[str, Any]) -> CodeExecutionResult:
+    def _session_variables(self) -> List[str]:
+        """Names later cells can use: the session's globals minus attachments, modules and internals"""
+        hidden = set(self._session["frames"]) | {"result"}
+        return sorted(
+            name for name, value in self._session["globals"].items()
+            if not name.startswith("_") and name not in hidden and not isinstance(value, ModuleType)
+        )
+    
+    def _load_frames(
+        self,
+        attachments: List[DataAttachment],
+        session: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Decode attachments, reusing a session's frames whose content is unchanged"""
+        if session is None:
+            return load_attachments(attachments)
+        frames = session["frames"]
+        for attachment in attachments:
+            key = attachment_key(attachment)
+            if attachment.name not in frames or frames[attachment.name][0] != key:
+                frames[attachment.name] = (key, load_attachment(attachment))
+                logger.info(f"📎 Session attachment '{attachment.name}': {len(frames[attachment.name][1])} rows")
+        # Shallow copies: a cell adding columns does not change the cached frame
+        return {name: frame.copy(deep=False) for name, (_, frame) in frames.items()}
+    
+    def _run_code(
+        self,
+        code: str,
+        context: Dict[str, Any],
+        attachments: Optional[List[DataAttachment]] = None,
+        timeout: Optional[int] = None,
+        submitted: Optional[float] = None,
+        profile_top: int = 0,
+        session: Optional[Dict[str, Any]] = None
+    ) -> CodeExecutionResult:
         """
-        Actually run the code (called in thread)
+        Actually run the code (called in a worker process, under per-job rlimits)
+        
+        Args:
+            submitted: When the server submitted the job (for the queue wait)
+            profile_top: Number of functions to report from cProfile (0 = off)
+            session: Session state to run in (its globals persist); None for fresh globals
         """
         start_time = time.time()
-        
-        # Prepare execution environment
-        # Restricted builtins
-        safe_globals = {
-            '__builtins__': self.SAFE_BUILTINS,
-        }
-        
-        # Add allowed imports
-        # Pre-import common libs (optional; failures are non-fatal)
-        preimport_map = {
-            'pandas': 'pd',
-            'numpy': 'np',
-            'matplotlib.pyplot': 'plt',
-            'plotly.graph_objects': 'go',
-            'plotly.express': 'px',
-            'math': 'math',
-            'statistics': 'stats'
-        }
-        for mod_name, alias in preimport_map.items():
-            try:
-                module = CodeSandbox._ORIGINAL_IMPORT(mod_name)
-                safe_globals[alias] = module
-            except Exception:
-                continue
-        
-        # Inject context variables
-        safe_globals.update(context)
-        
-        # Capture stdout and stderr
-        stdout_capture = io.StringIO()
-        stderr_capture = io.StringIO()
+        profiler = JobProfiler(submitted, profile_top)
+        input_bytes = len(code.encode("utf-8")) + sum(attachment_bytes(a) for a in attachments or [])
+        limits = ResourceLimits(self.cpu_seconds(timeout), self.memory_bytes)
         
         result_value = None
         error_msg = None
+        failure_reason = None
         success = False
         
-        try:
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # Compile code
-                compiled_code = compile(code, '<sandbox>', 'exec')
-                
-                # Execute
-                exec(compiled_code, safe_globals)
-                
-                # Try to get result from last expression or 'result' variable
-                if 'result' in safe_globals:
-                    result_value = safe_globals['result']
-                
-                success = True
-                
-        except Exception as e:
-            error_msg = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-            logger.debug(f"Execution error: {error_msg}")
+        # Output goes to this execution's own bounded buffers (streamed to the server as it is
+        # written) - sys.stdout is never swapped, so concurrent executions cannot mix output
+        with capture.job_output(settings.CODE_EXECUTOR_MAX_OUTPUT_BYTES) as output:
+            try:
+                with limits:
+                    # Decode attachments before compiling: data never passes through compile()
+                    try:
+                        with profiler.phase("load"):
+                            frames = self._load_frames(attachments or [], session)
+                    except Exception as e:
+                        logger.warning(f"Attachment load failed: {e}")
+                        return CodeExecutionResult(
+                            success=False,
+                            stdout="",
+                            stderr="",
+                            error=f"Attachment error: {e}",
+                            execution_time=time.time() - start_time,
+                            failure_reason="attachment_error",
+                            profile=profiler.finish(input_bytes, 0)
+                        )
+                    
+                    # Prepare execution environment (a session's globals carry over between cells)
+                    safe_globals = session["globals"] if session is not None else {}
+                    # Restricted builtins, with print bound to this execution's output
+                    safe_globals['__builtins__'] = dict(self.SAFE_BUILTINS, print=output.print)
+                    # 'result' is this execution's own, never an earlier cell's
+                    safe_globals.pop('result', None)
+                    
+                    # Pre-imported common libs (loaded once by warm(); failures there are non-fatal)
+                    for alias, module in self._MODULES.items():
+                        safe_globals.setdefault(alias, module)
+                    
+                    # Inject context variables and attached DataFrames
+                    safe_globals.update(context)
+                    safe_globals.update(frames)
+                    
+                    # Compile code
+                    with profiler.phase("compile"):
+                        compiled_code = compile(code, '<sandbox>', 'exec')
+                    
+                    # Execute
+                    with profiler.phase("run"):
+                        exec(compiled_code, safe_globals)
+                    
+                    # Try to get result from last expression or 'result' variable
+                    if 'result' in safe_globals:
+                        result_value = safe_globals['result']
+                    
+                    success = True
+                    
+            except LimitExceeded as e:
+                error_msg = f"{type(e).__name__}: {e}"
+                failure_reason = e.reason
+            except MemoryError:
+                error_msg = f"MemoryError: memory limit of {settings.CODE_EXECUTOR_MEMORY_LIMIT} exceeded"
+                failure_reason = "memory_limit"
+            except Exception as e:
+                error_msg = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
+                failure_reason = "exception"
+                logger.debug(f"Execution error: {error_msg}")
         
         end_time = time.time()
         execution_time = end_time - start_time
+        stdout = output.getvalue("stdout")
+        stderr = output.getvalue("stderr")
         
         return CodeExecutionResult(
             success=success,
-            stdout=stdout_capture.getvalue(),
-            stderr=stderr_capture.getvalue(),
+            stdout=stdout,
+            stderr=stderr,
             result=result_value,
             error=error_msg,
-            execution_time=execution_time
+            execution_time=execution_time,
+            failure_reason=failure_reason,
+            profile=profiler.finish(input_bytes, len(stdout.encode("utf-8")) + len(stderr.encode("utf-8")))
         )
     
     def _validate_code(self, code: str) -> bool:
@@ -288,31 +381,13 @@ class CodeSandbox:
         Returns:
             True if code is safe, False otherwise
         """
-        import re
-        
-        # Check for forbidden imports
-        for forbidden in self.FORBIDDEN_IMPORTS:
-            # Check for "import forbidden" or "from forbidden"
-            # Use regex to match whole words only
-            if re.search(rf'^\s*import\s+{re.escape(forbidden)}\b', code, re.MULTILINE) or \
-               re.search(rf'^\s*from\s+{re.escape(forbidden)}\b', code, re.MULTILINE):
-                logger.warning(f"Forbidden import detected: {forbidden}")
-                return False
-        
-        # Check for forbidden builtins usage
-        forbidden_patterns = [
-            r'\b__import__\b',
-            r'\beval\s*\(',
-            r'\bexec\s*\(',
-            r'\bcompile\s*\(',
-            r'\bopen\s*\(',
-            r'\bfile\s*\(',
-        ]
-        
-        for pattern in forbidden_patterns:
-            match = re.search(pattern, code)
-            if match:
-                logger.warning(f"Forbidden operation detected: {pattern} (Match: {match.group(0)})")
-                return False
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            # Let compile() report the syntax error with its location
+            return True
         
-        return True
+        violations = sandbox_policy.policy_violations(tree)
+        for violation in violations:
+            logger.warning(f"Forbidden operation detected: {violation}")
+        return not violations
@@ -0,0 +1,223 @@
+"""
+Analysis Sessions - Persistent per-conversation sandbox workers
+Keeps a conversation's DataFrames and variables alive between code cells
+
+Follow-up questions in a conversation ("now show the max", "plot that by
+hour") used to run in a fresh globals dict, decoding the same data again on
+every turn. A request with a session_id (the conversation ID) instead runs
+as the next cell in that conversation's session:
+
+- each session owns a dedicated worker process, forked warm like the pool's,
+  whose globals persist from cell to cell; cells run one at a time
+- attachments are decoded once and rebound on later cells while their
+  content is unchanged (artifact handles are content hashes)
+- a session ends after CODE_EXECUTOR_SESSION_TTL seconds idle, when its
+  worker's RSS exceeds CODE_EXECUTOR_SESSION_MAX_MB, or when a cell times
+  out, crashes the worker or runs out of memory
+- at most CODE_EXECUTOR_MAX_SESSIONS are kept; opening another evicts the
+  least recently used idle session, and when every session is busy the
+  cell runs statelessly on the pool instead (session_cell is None)
+
+A cell that lands in a new session reports session_cell=1, so callers know
+earlier variables are gone; every cell's result lists the variables the
+session holds (session_variables), for the next cell's code generation.
+"""
+import sys
+sys.path.append('/app')
+
+import time
+import asyncio
+import multiprocessing
+from typing import Dict, Any, Callable, Optional
+
+from shared.config import settings
+from shared.utils import get_logger
+
+from worker_pool import Worker, WorkerCrashed, receive, stop_worker
+
+logger = get_logger(__name__)
+
+
+class SessionsFull(Exception):
+    """CODE_EXECUTOR_MAX_SESSIONS sessions exist and all of them are busy"""
+
+
+class Session:
+    """One conversation's dedicated worker"""
+
+    def __init__(self, session_id: str, worker: Worker):
+        self.id = session_id
+        self.worker = worker
+        self.lock = asyncio.Lock()
+        self.cells = 0
+        self.rss = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.closed = False
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+class SessionManager:
+    """Per-conversation workers with idle TTL, memory cap and LRU eviction"""
+
+    def __init__(self, runner: Callable, initializer: Optional[Callable] = None):
+        """
+        Args:
+            runner: Function run in a session's worker for each cell
+            initializer: Called once in each worker (see WorkerPool)
+        """
+        self.runner = runner
+        self.initializer = initializer
+        self._ctx = multiprocessing.get_context("fork")
+        self._sessions: Dict[str, Session] = {}
+        self._next_index = 0
+        self._reaper: Optional[asyncio.Task] = None
+        self.metrics = {
+            "opened": 0, "cells": 0, "expired": 0, "evicted": 0, "over_memory": 0, "failed": 0, "closed": 0, "full": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CODE_EXECUTOR_SESSIONS
+
+    # ==================== Lifecycle ====================
+
+    def start(self):
+        """Start expiring idle sessions (call once, from the running event loop)"""
+        if self.enabled:
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def close(self):
+        """End all sessions"""
+        if self._reaper:
+            self._reaper.cancel()
+        for session in list(self._sessions.values()):
+            self._end(session, "closed", kill=session.busy)
+
+    async def _reap(self):
+        interval = min(settings.CODE_EXECUTOR_SESSION_TTL, 60)
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.time() - settings.CODE_EXECUTOR_SESSION_TTL
+            for session in list(self._sessions.values()):
+                if not session.busy and session.last_used < cutoff:
+                    self._end(session, "expired")
+
+    def _open(self, session_id: str) -> Session:
+        # Make room first: the least recently used idle sessions go
+        idle = sorted((s for s in self._sessions.values() if not s.busy), key=lambda s: s.last_used)
+        while idle and len(self._sessions) >= settings.CODE_EXECUTOR_MAX_SESSIONS:
+            self._end(idle.pop(0), "evicted")
+        if len(self._sessions) >= settings.CODE_EXECUTOR_MAX_SESSIONS:
+            # Every session is running a cell: never fork past the cap
+            self.metrics["full"] += 1
+            raise SessionsFull(f"all {len(self._sessions)} sessions are busy")
+
+        worker = Worker(
+            self._ctx, self.runner, self.initializer, self._next_index,
+            name=f"sandbox-session-{self._next_index}"
+        )
+        self._next_index += 1
+        session = Session(session_id, worker)
+        self._sessions[session_id] = session
+        self.metrics["opened"] += 1
+        logger.info(f"🧪 Opened session {session_id} (worker {worker.pid}, {len(self._sessions)} active)")
+        return session
+
+    def _end(self, session: Session, reason: str, kill: bool = False):
+        """Close a session and stop its worker"""
+        if session.closed:
+            return
+        session.closed = True
+        if self._sessions.get(session.id) is session:
+            del self._sessions[session.id]
+        self.metrics[reason] += 1
+        stop_worker(session.worker, kill)
+        logger.info(f"Ended session {session.id} ({reason}, {session.cells} cells)")
+
+    def end(self, session_id: str) -> bool:
+        """
+        End a conversation's session (e.g. when the conversation is deleted)
+
+        Returns:
+            Whether the session existed
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        self._end(session, "closed", kill=session.busy)
+        return True
+
+    # ==================== Cells ====================
+
+    async def run(
+        self,
+        session_id: str,
+        args: tuple,
+        timeout: float,
+        on_output: Optional[Callable[[str, str], None]] = None
+    ):
+        """
+        Run one cell in a conversation's session, opening the session if needed
+
+        Args:
+            session_id: Conversation ID
+            args: Arguments for the runner
+            timeout: Wall-clock limit in seconds
+            on_output: Called with (stream, text) for partial output while the cell runs
+
+        Returns:
+            The runner's result
+
+        Raises:
+            asyncio.TimeoutError: the cell exceeded the timeout (the session ends)
+            WorkerCrashed: the session's worker died (the session ends)
+            SessionsFull: a new session is needed but every session is busy
+        """
+        while True:
+            session = self._sessions.get(session_id) or self._open(session_id)
+            async with session.lock:
+                # Ended while this cell waited for the previous one: open a fresh session
+                if session.closed:
+                    continue
+                try:
+                    try:
+                        session.worker.conn.send(args)
+                    except (OSError, ValueError) as e:
+                        raise WorkerCrashed(f"worker unavailable: {e}") from e
+                    result, session.rss = await receive(session.worker, timeout, on_output)
+                except BaseException:
+                    # Timed out, crashed or cancelled mid-cell: the worker's state is unknown
+                    self.metrics["failed"] += 1
+                    self._end(session, "closed", kill=True)
+                    raise
+                session.cells += 1
+                session.last_used = time.time()
+                self.metrics["cells"] += 1
+
+                if getattr(result, "failure_reason", None) == "memory_limit":
+                    self._end(session, "over_memory")
+                elif session.rss > settings.CODE_EXECUTOR_SESSION_MAX_MB * 1024 * 1024:
+                    logger.info(f"Session {session_id} uses {session.rss // (1024 * 1024)} MB, ending it")
+                    self._end(session, "over_memory")
+                if session.closed:
+                    # The next cell starts a fresh session: nothing carries over
+                    result.session_variables = []
+                return result
+
+    # ==================== Metrics ====================
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "enabled": self.enabled,
+            "max": settings.CODE_EXECUTOR_MAX_SESSIONS,
+            "active": len(self._sessions),
+            "busy": sum(1 for s in self._sessions.values() if s.busy),
+            "rss_mb": round(sum(s.rss for s in self._sessions.values()) / (1024 * 1024), 1),
+            "oldest_idle_s": round(max((now - s.last_used for s in self._sessions.values()), default=0.0), 1),
+            **self.metrics,
+        }
@@ -0,0 +1,299 @@
+"""
+Worker Pool - Pre-forked, warm processes that run sandboxed code
+Replaces the per-request thread: jobs go to idle worker processes over pipes
+
+The scientific stack (pandas, numpy, matplotlib with the Agg backend and a
+built font cache, plotly) is imported once in the server process before the
+workers are forked, so every worker - including replacements - starts warm.
+Each job runs in its own process, so executions use all cores instead of
+sharing one GIL, and a worker is replaced after a configurable number of
+jobs, when its memory has grown past the recycle threshold, when a job hit
+a resource limit (see limits.py), or when it died or timed out (SIGKILL).
+"""
+import sys
+sys.path.append('/app')
+
+import os
+import time
+import signal
+import pickle
+import asyncio
+import threading
+import multiprocessing
+from typing import Dict, Any, Callable, Optional
+
+from shared.config import settings
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Failure reasons after which a worker is replaced rather than reused
+LIMIT_REASONS = {"cpu_limit", "memory_limit", "output_limit"}
+
+
+class WorkerCrashed(Exception):
+    """Raised when a worker process exits while running a job"""
+    pass
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn, runner: Callable, initializer: Optional[Callable]):
+    """Worker loop: receive a job, run it, send back ("result", result, rss)"""
+    # Shutdown is driven by the parent; don't die on the terminal's Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    lock = threading.Lock()
+
+    def send(message: tuple):
+        # SIGXCPU raises in the job (limits.py); arriving mid-send it would leave a half-written
+        # frame on the pipe, so it is held until the message is out and delivered after
+        with lock:
+            blocked = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGXCPU})
+            try:
+                conn.send(message)
+            finally:
+                signal.pthread_sigmask(signal.SIG_SETMASK, blocked)
+
+    if initializer is not None:
+        # Partial output goes to the parent as ("output", stream, text) while the job runs
+        initializer(lambda stream, text: send(("output", stream, text)))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        result = runner(*job)
+        try:
+            send(("result", result, _rss_bytes()))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # 'result' holds an object that cannot leave the process
+            result.result = repr(result.result)
+            send(("result", result, _rss_bytes()))
+    conn.close()
+
+
+class Worker:
+    """One forked worker process and the parent's end of its pipe"""
+
+    def __init__(self, ctx, runner: Callable, initializer: Optional[Callable], index: int, name: Optional[str] = None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, runner, initializer),
+            name=name or f"sandbox-worker-{index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.index = index
+        self.jobs = 0
+        self.rss = 0
+        self.started_at = time.time()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+
+def stop_worker(worker: Worker, kill: bool = False):
+    """Stop a worker (politely when idle, SIGKILL when stuck or broken)"""
+    try:
+        if kill:
+            worker.process.kill()
+        else:
+            worker.conn.send(None)
+    except (OSError, ValueError):
+        worker.process.kill()
+    worker.conn.close()
+    # Reap without blocking the event loop
+    asyncio.get_running_loop().run_in_executor(None, worker.process.join, 5)
+
+
+async def receive(
+    worker: Worker,
+    timeout: float,
+    on_output: Optional[Callable[[str, str], None]] = None
+):
+    """
+    Wait for a worker's job result without blocking the event loop, relaying partial output
+
+    Returns:
+        (result, rss) sent by the worker
+
+    Raises:
+        asyncio.TimeoutError: no result within the timeout
+        WorkerCrashed: the worker's pipe closed
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    fd = worker.conn.fileno()
+    while True:
+        if not worker.conn.poll():
+            ready = loop.create_future()
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, max(deadline - loop.time(), 0))
+            finally:
+                loop.remove_reader(fd)
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerCrashed(f"worker exited with code {worker.process.exitcode}") from e
+        if message[0] == "result":
+            return message[1], message[2]
+        if on_output is not None:
+            on_output(message[1], message[2])
+
+
+class WorkerPool:
+    """Fixed-size pool of warm worker processes with idle-worker dispatch"""
+
+    def __init__(self, runner: Callable, size: Optional[int] = None, initializer: Optional[Callable] = None):
+        """
+        Args:
+            runner: Function run in the worker for each job (called with the job's arguments)
+            size: Number of workers (default: CODE_EXECUTOR_WORKERS, 0 = one per CPU)
+            initializer: Called once in each worker with an emit(stream, text) function
+                for streaming partial output to the server
+        """
+        self.runner = runner
+        self.initializer = initializer
+        self.size = size or settings.CODE_EXECUTOR_WORKERS or os.cpu_count() or 1
+        self._ctx = multiprocessing.get_context("fork")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: Dict[int, Worker] = {}
+        self._next_index = 0
+        self._waiting = 0
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at: Optional[float] = None
+        self.metrics = {
+            "jobs": 0, "recycled_jobs": 0, "recycled_memory": 0, "recycled_limits": 0, "timeouts": 0, "crashes": 0
+        }
+
+    # ==================== Lifecycle ====================
+
+    def start(self):
+        """Fork the workers (call once, from the running event loop)"""
+        self._idle = asyncio.Queue()
+        self._started_at = time.time()
+        for _ in range(self.size):
+            self._idle.put_nowait(self._spawn())
+        logger.info(f"⚙️  Started {self.size} sandbox workers")
+
+    def _spawn(self) -> Worker:
+        worker = Worker(self._ctx, self.runner, self.initializer, self._next_index)
+        self._next_index += 1
+        self._workers[worker.index] = worker
+        return worker
+
+    def _retire(self, worker: Worker, kill: bool = False):
+        self._workers.pop(worker.index, None)
+        stop_worker(worker, kill)
+
+    def _replace(self, worker: Worker, kill: bool = False):
+        self._retire(worker, kill)
+        self._idle.put_nowait(self._spawn())
+
+    async def close(self):
+        """Stop all workers"""
+        for worker in list(self._workers.values()):
+            self._retire(worker)
+        logger.info("Stopped sandbox workers")
+
+    # ==================== Dispatch ====================
+
+    async def run(
+        self,
+        args: tuple,
+        timeout: float,
+        on_output: Optional[Callable[[str, str], None]] = None
+    ):
+        """
+        Run one job on the next idle worker
+
+        Args:
+            args: Arguments for the runner
+            timeout: Wall-clock limit in seconds
+            on_output: Called with (stream, text) for partial output while the job runs
+
+        Returns:
+            The runner's result
+
+        Raises:
+            asyncio.TimeoutError: the job exceeded the timeout (its worker is replaced)
+            WorkerCrashed: the worker died during the job (it is replaced)
+        """
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        self._busy += 1
+        started = time.time()
+        try:
+            try:
+                worker.conn.send(args)
+            except (OSError, ValueError) as e:
+                raise WorkerCrashed(f"worker unavailable: {e}") from e
+            result, worker.rss = await receive(worker, timeout, on_output)
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            logger.warning(f"Worker {worker.pid} timed out after {timeout}s, replacing it")
+            self._replace(worker, kill=True)
+            raise
+        except WorkerCrashed as e:
+            self.metrics["crashes"] += 1
+            logger.warning(f"Worker {worker.pid} crashed ({e}), replacing it")
+            self._replace(worker, kill=True)
+            raise
+        except BaseException:
+            # Cancelled mid-job: the worker may still be running it
+            self._replace(worker, kill=True)
+            raise
+        finally:
+            self._busy -= 1
+            self._busy_seconds += time.time() - started
+
+        worker.jobs += 1
+        self.metrics["jobs"] += 1
+        if getattr(result, "failure_reason", None) in LIMIT_REASONS:
+            # The job was stopped mid-way: start the next one from a clean process
+            self.metrics["recycled_limits"] += 1
+            self._replace(worker)
+        elif worker.jobs >= settings.CODE_EXECUTOR_MAX_JOBS_PER_WORKER:
+            self.metrics["recycled_jobs"] += 1
+            self._replace(worker)
+        elif worker.rss > settings.CODE_EXECUTOR_WORKER_RECYCLE_MB * 1024 * 1024:
+            self.metrics["recycled_memory"] += 1
+            logger.info(f"♻️  Recycling worker {worker.pid} (RSS {worker.rss // (1024 * 1024)} MB)")
+            self._replace(worker)
+        else:
+            self._idle.put_nowait(worker)
+        return result
+
+    # ==================== Metrics ====================
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.time() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": len(self._workers),
+            "busy": self._busy,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "queue_depth": self._waiting,
+            "utilisation": round(self._busy / self.size, 3) if self.size else None,
+            "average_utilisation": round(self._busy_seconds / (uptime * self.size), 3) if uptime else None,
+            "worker_rss_mb": {w.pid: round(w.rss / (1024 * 1024), 1) for w in self._workers.values() if w.rss},
+            **self.metrics,
+        }
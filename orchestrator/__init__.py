@@ -3,12 +3,15 @@
 __version__ = "2.0.0"
 
 from .redis_manager import RedisManager
+from .mysql_manager import MySQLManager, mysql_manager
 from .llm_manager import LLMManager, llm_manager
 from .workflow import WorkflowOrchestrator
 from . import agents
 
 __all__ = [
     "RedisManager",
+    "MySQLManager",
+    "mysql_manager",
     "LLMManager",
     "llm_manager",
     "WorkflowOrchestrator",
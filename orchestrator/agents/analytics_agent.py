@@ -7,11 +7,19 @@ sys.path.append('/app')
 import httpx
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from shared.models import ConversationState
 from shared.utils import get_logger, extract_code_from_llm_response
 from shared.config import settings
 from orchestrator.llm_manager import llm_manager
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.analytics_engine import analytics_engine
+from orchestrator.services.result_renderer import result_renderer
+from orchestrator.services.code_attachments import attachment_store
+from orchestrator.services.code_cache import code_cache
+from orchestrator.services.code_validator import code_validator, free_names
+from orchestrator.services.media_store import media_store
+from orchestrator.services.downsampling import downsampler
 
 logger = get_logger(__name__)
 
@@ -22,6 +30,8 @@ class AnalyticsAgent:
     
     def __init__(self):
         self.max_retries = 3
+        # Variables each conversation's executor session holds, from its last cell's result
+        self._session_variables: Dict[str, List[str]] = {}
     
     async def analyze(
         self,
@@ -87,15 +97,40 @@ class AnalyticsAgent:
                 for uuid, meta in sensor_metadata.items():
                     logger.info(f"   - {uuid[:20]}... → {meta.get('label', 'N/A')}")
             
-            # Step 1: Generate Python code
-            logger.info("\n🤖 Step 1: Generating Python analytics code...")
-            code = await self._generate_code(user_query, data, sensor_metadata, data_filename, user_id=state.user_id)
-            logger.info(f"✅ Code generated ({len(code)} chars)")
+            # Columnar data, built once: the frame the SQL step fetched, else from the records
+            frame = state.query_frame
+            if frame is None:
+                frame = SeriesFrame.from_records(data.get("data", []))
             
-            # Step 2: Execute code with retries
-            logger.info("\n⚙️  Step 2: Executing code...")
-            # Provide data context so fallback code can still access raw_data_json if needed
-            result = await self._execute_with_retries(code, user_query, data, sensor_metadata, data_filename)
+            # Common statistics are answered in-process; code generation is for novel analyses
+            native = await self._answer_natively(state, user_query, frame, sensor_metadata)
+            if native:
+                return native
+            
+            # Reuse validated code generated earlier for the same analysis on same-shaped data
+            result = await self._execute_cached(
+                user_query, frame, sensor_metadata, state.user_id, state.conversation_id
+            )
+            
+            if result is None:
+                # Step 1: Generate Python code
+                logger.info("\n🤖 Step 1: Generating Python analytics code...")
+                code = await self._generate_code(
+                    user_query, data, sensor_metadata, data_filename, user_id=state.user_id,
+                    session_variables=self._session_variables.get(state.conversation_id)
+                )
+                logger.info(f"✅ Code generated ({len(code)} chars)")
+                
+                # Step 2: Execute code with retries
+                logger.info("\n⚙️  Step 2: Executing code...")
+                # Data is attached to the request as the DataFrame 'df', not pasted into the code
+                session_names = set(self._session_variables.get(state.conversation_id, []))
+                result = await self._execute_with_retries(
+                    code, user_query, frame, sensor_metadata, data_filename, session_id=state.conversation_id
+                )
+                # Code reading an earlier cell's variables only works in this conversation's session
+                if result.get("success") and not free_names(result.get("code") or "") & session_names:
+                    await code_cache.store(user_query, frame, sensor_metadata, result.get("code"))
             
             if result.get("success"):
                 logger.info(f"✅ Execution successful")
@@ -127,156 +162,100 @@ class AnalyticsAgent:
                 "output": None
             }
     
-    def _get_template_code(
-        self, 
-        user_query: str, 
-        sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None,
-        data_filename: str = "current_data.json"
-    ) -> Optional[str]:
-        """
-        Try to match user query to a pre-defined analytics template.
-        Returns Python code if matched, None otherwise.
+    async def _answer_natively(
+        self,
+        state: ConversationState,
+        user_query: str,
+        frame: SeriesFrame,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        import json
-        query_lower = user_query.lower()
+        Answer recognised statistics questions with the in-process analytics engine
         
-        # Build sensor map for the code
-        sensor_map_str = "{}"
-        if sensor_metadata:
-            # Create a simple dict string: {'uuid': 'label', ...}
-            simple_map = {k: v.get('label', k) for k, v in sensor_metadata.items()}
-            sensor_map_str = json.dumps(simple_map)
-
-        # Common setup code for all templates
+        Returns:
+            Analysis result in the same shape as analyze(), or None to fall back to code generation
+        """
+        if not settings.ANALYTICS_NATIVE_ENGINE:
+            return None
         try:
-            setup_code = f"""
-import pandas as pd
-import json
-
-# Sensor Metadata
-sensor_map = {sensor_map_str}
-
-def get_label(uuid):
-    return sensor_map.get(uuid, uuid)
-
-# Initialize empty DataFrame
-df = pd.DataFrame(columns=['uuid', 'value', 'timestamp'])
-
-# Load data
-try:
-    # Read data from standard local file
-    # Using pandas to read JSON to bypass potential sandbox restrictions
-    full_data = pd.read_json('/app/outputs/data/{data_filename}', typ='series')
-    
-    if 'data' in full_data:
-        temp_df = pd.DataFrame(full_data['data'])
-        if not temp_df.empty:
-            df = temp_df
-
-    if not df.empty:
-        # Data preparation
-        df['value'] = pd.to_numeric(df['value'], errors='coerce')
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        df = df.dropna(subset=['value', 'timestamp'])
+            result = analytics_engine.answer(user_query, frame)
+        except Exception as e:
+            logger.warning(f"Analytics engine failed, falling back to code generation: {e}")
+            return None
+        if result is None:
+            return None
         
-except Exception as e:
-    print(f"Error processing data: {{e}}")
+        structured = result.to_dict()
+        table = result_renderer.render_analytics(structured, sensor_metadata)
+        if settings.DETERMINISTIC_RENDERING and not result_renderer.needs_narrative(state.persona):
+            formatted = table
+        else:
+            formatted, _ = await self._format_analysis({"success": True, "output": table}, user_query, sensor_metadata)
+        logger.info(f"✅ Answered natively ({result.operation}, {result.elapsed_ms:.1f}ms)")
+        logger.info("="*80)
+        return {
+            "success": True,
+            "code": None,
+            "output": table,
+            "error": None,
+            "formatted_response": formatted,
+            "media": [],
+            "analytics": structured
+        }
 
-if df.empty:
-    print("No valid data available for analysis.")
-    # Ensure columns exist to prevent KeyError in subsequent steps
-    df = pd.DataFrame(columns=['uuid', 'value', 'timestamp'])
-"""
+    async def _execute_cached(
+        self,
+        user_query: str,
+        frame: SeriesFrame,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]],
+        user_id: str,
+        session_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Run cached code for this analysis, if any
+        
+        Returns:
+            Execution result, or None on a miss or when the cached code failed (it is then evicted)
+        """
+        cached = await code_cache.get(user_query, frame, sensor_metadata, self._plot_filename(user_id))
+        if cached is None:
+            return None
+        logger.info("\n♻️  Executing cached analytics code...")
+        try:
+            result = await self._execute_code(cached.code, self._attachments(frame), session_id)
         except Exception as e:
-            logger.error(f"Error constructing setup_code: {e}")
+            result = {"success": False, "error": str(e)}
+        await code_cache.record(cached, bool(result.get("success")))
+        if not result.get("success"):
+            logger.warning(f"Cached code failed, regenerating: {result.get('error')}")
             return None
-
-        # Template 1: Average/Mean
-        if any(w in query_lower for w in ['average', 'mean', 'avg']):
-            return setup_code + """
-# Calculate Average
-results = df.groupby('uuid')['value'].mean()
-
-print("Average Values:")
-for uuid, val in results.items():
-    print(f"Sensor: {get_label(uuid)}")
-    print(f"Average: {val:.2f}")
-    print("-" * 20)
-"""
-
-        # Template 2: Maximum/Peak
-        if any(w in query_lower for w in ['maximum', 'max', 'peak', 'highest']):
-            return setup_code + """
-# Calculate Maximum
-results = df.groupby('uuid')['value'].max()
-
-print("Maximum Values:")
-for uuid, val in results.items():
-    print(f"Sensor: {get_label(uuid)}")
-    print(f"Max: {val:.2f}")
-    print("-" * 20)
-"""
-
-        # Template 3: Minimum/Lowest
-        if any(w in query_lower for w in ['minimum', 'min', 'lowest']):
-            return setup_code + """
-# Calculate Minimum
-results = df.groupby('uuid')['value'].min()
-
-print("Minimum Values:")
-for uuid, val in results.items():
-    print(f"Sensor: {get_label(uuid)}")
-    print(f"Min: {val:.2f}")
-    print("-" * 20)
-"""
-
-        # Template 4: Latest/Current
-        if any(w in query_lower for w in ['current', 'latest', 'now', 'recent']):
-            return setup_code + """
-# Get Latest Values
-latest_indices = df.groupby('uuid')['timestamp'].idxmax()
-latest_df = df.loc[latest_indices]
-
-print("Latest Readings:")
-for _, row in latest_df.iterrows():
-    uuid = row['uuid']
-    print(f"Sensor: {get_label(uuid)}")
-    print(f"Value: {row['value']:.2f}")
-    print(f"Time: {row['timestamp']}")
-    print("-" * 20)
-"""
-
-        # Template 5: Count
-        if any(w in query_lower for w in ['count', 'how many readings', 'number of readings']):
-            return setup_code + """
-# Count Readings
-results = df.groupby('uuid').size()
-
-print("Data Point Counts:")
-for uuid, count in results.items():
-    print(f"Sensor: {get_label(uuid)}")
-    print(f"Count: {count}")
-    print("-" * 20)
-"""
-
-        return None
-
+        return {
+            "success": True,
+            "code": cached.code,
+            "output": result.get("stdout") or result.get("output") or "",
+            "error": None
+        }
+    
+    @staticmethod
+    def _plot_filename(user_id: str) -> str:
+        """Per-request plot file name (UK local timestamp)"""
+        try:
+            now = datetime.now(ZoneInfo("Europe/London"))
+        except Exception:
+            now = datetime.now()
+        return f"plot_{user_id}_{now.strftime('%Y%m%d_%H%M%S')}.png"
+    
     async def _generate_code(
         self,
         user_query: str,
         data: Optional[Dict[str, Any]] = None,
         sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None,
         data_filename: str = "current_data.json",
-        user_id: str = "default_user"
+        user_id: str = "default_user",
+        session_variables: Optional[List[str]] = None
     ) -> str:
         """Generate Python analytics code using LLM"""
         
-        # Try to use a template first
-        template_code = self._get_template_code(user_query, sensor_metadata, data_filename)
-        if template_code:
-            logger.info("✅ Using pre-defined analytics template")
-            return template_code
-            
         # We don't put the full data in the prompt to save tokens, 
         # but we describe the structure.
         data_preview = str(data)[:500] + "..." if data else "No data provided"
@@ -285,11 +264,9 @@ for uuid, count in results.items():
         try:
             uk_time = datetime.now(ZoneInfo("Europe/London"))
             current_time_str = uk_time.strftime("%A, %B %d, %Y, %H:%M %Z")
-            timestamp_str = uk_time.strftime("%Y%m%d_%H%M%S")
         except Exception:
             uk_time = datetime.now()
             current_time_str = uk_time.strftime("%A, %B %d, %Y, %H:%M (UTC)")
-            timestamp_str = uk_time.strftime("%Y%m%d_%H%M%S")
         
         # Build sensor metadata context
         metadata_context = ""
@@ -299,7 +276,14 @@ for uuid, count in results.items():
                 metadata_context += f"  - UUID: {uuid} → Label: {meta['label']}\n"
             metadata_context += "\nIMPORTANT: The 'uuid' column in the data contains these UUID values (e.g., '1e87a383-b1b9-41e2-8f8d-a4d295ebf26a'), NOT the human-readable labels. When filtering data, use the actual UUID values from the 'uuid' column, not the sensor names."
         
-        plot_filename = f"plot_{user_id}_{timestamp_str}.png"
+        session_context = ""
+        if session_variables:
+            session_context = (
+                "- Variables from earlier analyses in this conversation still exist and may be reused: "
+                + ", ".join(f"`{name}`" for name in session_variables) + "\n"
+            )
+        
+        plot_filename = self._plot_filename(user_id)
         
         code_prompt = f"""You are a Python data analytics expert. Generate code to analyze smart building data.
 Current Date and Time: {current_time_str}
@@ -307,33 +291,22 @@ Current Date and Time: {current_time_str}
 User Request: {user_query}
 
 DATA CONTEXT:
-- The data is saved locally in a standard JSON format at: `/app/outputs/data/{data_filename}`
-- Structure: {{"data": [{{"timestamp": "...", "uuid": "...", "value": ...}}, ...], "metadata": {{...}}}}
-- You MUST read the data from this file using pandas.
-{metadata_context}
+- A pandas DataFrame named `df` is already loaded before your code runs. Do NOT read any file and do NOT redefine `df`.
+- Columns: 'timestamp' (datetime64), 'uuid' (str), 'value' (float). Time-bucketed data also has 'min', 'max', 'count' and 'last' per bucket ('value' is the bucket average).
+- A second DataFrame `plot_df` holds the same series downsampled for plotting (same columns plus 'min'/'max', the envelope of the readings each row stands for). Plot from `plot_df`; compute every statistic from `df`.
+{session_context}{metadata_context}
 
 Generate Python code that:
 1. Starts with necessary import statements (pandas, json, matplotlib.pyplot, seaborn, etc.)
-2. Reads the data from file: `df = pd.read_json('/app/outputs/data/{data_filename}', typ='series')`
-   - Note: The file contains a "data" key with the list of records.
-   - Recommended approach:
-     ```python
-     import pandas as pd
-     # Read using pandas to bypass sandbox 'open' restriction
-     full_data = pd.read_json('/app/outputs/data/{data_filename}', typ='series')
-     df = pd.DataFrame(full_data['data'])
-     ```
-
-3. Ensures 'value' is numeric: `df['value'] = pd.to_numeric(df['value'], errors='coerce')`
-4. Ensures 'timestamp' is datetime: `df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')`
-5. Filter by the ACTUAL UUID value from the 'uuid' column (not by sensor label/name).
-6. Performs the requested analysis (calculate stats, aggregations, etc.).
-7. Prints results using human-readable sensor labels for clarity.
-8. Handle empty data gracefully (check if filtered DataFrame is empty).
+2. Uses the provided `df` directly ('value' is already numeric and 'timestamp' already datetime).
+3. Filter by the ACTUAL UUID value from the 'uuid' column (not by sensor label/name).
+4. Performs the requested analysis (calculate stats, aggregations, etc.).
+5. Prints results using human-readable sensor labels for clarity.
+6. Handle empty data gracefully (check if filtered DataFrame is empty).
 
 VISUALIZATION INSTRUCTIONS:
 If the user asks for a graph, chart, or plot:
-1. Use matplotlib or seaborn to create the plot.
+1. Use matplotlib or seaborn to create the plot, from `plot_df` (filtered the same way as `df`).
 2. Use a professional style (e.g., `plt.style.use('seaborn-v0_8')` or similar).
 3. Add proper titles, labels, and legends.
 4. Save the plot to: `/app/outputs/{plot_filename}`
@@ -350,14 +323,7 @@ import json
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Load data from file
-full_data = pd.read_json('/app/outputs/data/{data_filename}', typ='series')
-df = pd.DataFrame(full_data['data'])
-
-
-# Data preparation
-df['value'] = pd.to_numeric(df['value'], errors='coerce')
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+# `df` is provided: timestamp, uuid, value (`plot_df`: downsampled copy for plots)
 
 # Filter by actual UUID (e.g., 'aa1c2b1f-c59d-44bf-af24-08ced2ff7ffb')
 sensor_uuid = 'actual_uuid_here'
@@ -371,9 +337,11 @@ else:
     mean_val = filtered_df['value'].mean()
     print(f"Mean Value: {{mean_val}}")
     
-    # Visualization (if requested)
+    # Visualization (if requested) - from the downsampled plot_df
+    plot_data = plot_df[plot_df['uuid'] == sensor_uuid]
     plt.figure(figsize=(10, 6))
-    sns.lineplot(data=filtered_df, x='timestamp', y='value')
+    plt.plot(plot_data['timestamp'], plot_data['value'])
+    plt.fill_between(plot_data['timestamp'], plot_data['min'], plot_data['max'], alpha=0.2)
     plt.title('Temperature over Time')
     plt.savefig('/app/outputs/{plot_filename}')
     print("PLOT_GENERATED: {plot_filename}")
@@ -393,16 +361,29 @@ Respond with ONLY the Python code, wrapped in ```python blocks."""
         self,
         code: str,
         user_query: str,
-        data: Optional[Dict[str, Any]] = None,
+        frame: Optional[SeriesFrame] = None,
         sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None,
-        data_filename: str = "current_data.json"
+        data_filename: str = "current_data.json",
+        session_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Execute code with automatic error fixing"""
         
+        # Encoded once; every attempt sends the same attachments
+        attachments = self._attachments(frame)
+        columns = list(frame.columns) if frame is not None else None
         for attempt in range(self.max_retries):
             try:
-                # Execute code via code executor service
-                result = await self._execute_code(code, data)
+                # Check locally first: cheap fixes are applied in place, and code that is
+                # still invalid goes straight to repair without an executor round-trip
+                # Variables left by earlier cells of this conversation's session are defined too
+                provided = ["plot_df", *self._session_variables.get(session_id, [])]
+                validation = code_validator.validate(code, columns, provided=provided)
+                code = validation.code
+                if validation.ok:
+                    # Execute code via code executor service
+                    result = await self._execute_code(code, attachments, session_id)
+                else:
+                    result = {"success": False, "error": validation.error_message()}
                 
                 if result.get("success"):
                     logger.info(f"Code executed successfully on attempt {attempt + 1}")
@@ -446,35 +427,64 @@ Respond with ONLY the Python code, wrapped in ```python blocks."""
             "error": "Max retries exceeded"
         }
     
-    async def _execute_code(self, code: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Execute code via code executor service"""
+    def _attachments(self, frame: Optional[SeriesFrame]) -> List[Dict[str, Any]]:
+        """The data as attachments 'df' and 'plot_df' (downsampled to the chart's point budget)"""
+        if frame is None:
+            logger.warning("⚠️  No data provided to _execute_code - df will not be defined!")
+            return []
+        attachments = [attachment_store.attach("df", frame)]
+        plot_frame = downsampler.frame(frame) if downsampler.plottable(frame) else frame
+        attachments.append(attachment_store.attach("plot_df", plot_frame))
+        logger.info(f"✅ Attached {len(frame)} rows as 'df' ({attachments[0]['format']}), "
+                    f"{len(plot_frame)} as 'plot_df'")
+        return attachments
+    
+    async def _execute_code(
+        self,
+        code: str,
+        attachments: Optional[List[Dict[str, Any]]] = None,
+        session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Execute code via code executor service, with the data attached as DataFrames 'df' and 'plot_df'
+        (see _attachments)
         
-        # Prepend data if available
-        if data:
-            import json
-            data_json = json.dumps(data)
-            # Use triple quotes to avoid escaping issues, but be careful with triple quotes inside data
-            # A safer way is to use repr() or base64 encoding if data is complex, 
-            # but for now simple string injection should work for standard JSON.
-            data_assignment = f'raw_data_json = \'\'\'{data_json}\'\'\'\n'
-            code = data_assignment + code
-            logger.info(f"✅ Prepended data to code ({len(data_json)} chars of JSON)")
-        else:
-            logger.warning("⚠️  No data provided to _execute_code - raw_data_json will not be defined!")
-
+        With a session_id (the conversation ID) the code runs as the next cell of the
+        conversation's executor session: unchanged data is not decoded again and
+        variables from earlier turns stay available.
+        """
         try:
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
                     f"{CODE_EXECUTOR_URL}/execute",
-                    json={"code": code}
+                    json={"code": code, "attachments": attachments or [], "session_id": session_id}
                 )
                 response.raise_for_status()
-                return response.json()
+                result = response.json()
+                if session_id:
+                    self._remember_session(session_id, result.get("session_variables"))
+                profile = result.get("profile")
+                if profile:
+                    logger.info(f"⏱️  Executor: queue {profile.get('queue_wait') or 0:.3f}s, "
+                                f"load {profile['load_time']:.3f}s, compile {profile['compile_time']:.3f}s, "
+                                f"run {profile['run_time']:.3f}s (cpu {profile['cpu_time']:.3f}s), "
+                                f"in {profile['input_bytes']} B, out {profile['output_bytes']} B")
+                return result
                 
         except httpx.HTTPError as e:
             logger.error(f"Code executor service error: {e}")
             raise Exception(f"Failed to execute code: {str(e)}")
     
+    def _remember_session(self, session_id: str, variables: Optional[List[str]]):
+        """Keep the variables a session holds (None: no session, e.g. sessions disabled)"""
+        self._session_variables.pop(session_id, None)
+        if variables is None:
+            return
+        self._session_variables[session_id] = variables
+        while len(self._session_variables) > settings.CODE_EXECUTOR_MAX_SESSIONS:
+            # Least recently used first (dicts keep insertion order)
+            del self._session_variables[next(iter(self._session_variables))]
+    
     async def _fix_code(
         self,
         code: str,
@@ -503,19 +513,18 @@ Error:
 {error}
 
 Original request: {user_query}
-Data File: /app/outputs/data/{data_filename}
 {metadata_context}
 
 IMPORTANT CONTEXT:
-- A variable named 'raw_data_json' containing JSON string data will be automatically provided before your code runs.
-- Structure: {{"data": [{{"timestamp": "...", "uuid": "...", "value": ...}}, ...]}}
-- Do NOT define or mock 'raw_data_json' yourself - it is already provided.
-- If you see NameError for 'raw_data_json', the issue is elsewhere, not missing definition.
+- A pandas DataFrame named 'df' is loaded automatically before your code runs.
+- Columns: 'timestamp' (datetime64), 'uuid' (str), 'value' (float); bucketed data also has 'min', 'max', 'count', 'last'.
+- 'plot_df' is the same data downsampled for plotting (with 'min'/'max' envelope columns); plot from it, compute statistics from 'df'.
+- Do NOT read data files, and do NOT define or mock 'df' yourself - it is already provided.
 
 Fix the code to resolve the error. Common issues:
 - Import errors: Check if library is imported
 - Data type mismatches: Convert types appropriately  
-- Missing variables: Initialize before use (except raw_data_json which is pre-defined)
+- Missing variables: Initialize before use (except df which is pre-defined)
 - Index errors: Check bounds
 - Syntax errors: Fix Python syntax
 - Using sensor names instead of UUID values for filtering
@@ -550,48 +559,24 @@ Respond with ONLY the corrected Python code, wrapped in ```python blocks."""
         if plot_match:
             filename = plot_match.group(1)
             
-            # Try to embed image as base64 to avoid localhost/network issues
+            # Store the image once and reference it by content hash (never inline it)
             try:
-                import base64
-                import os
-                
-                # Check multiple possible paths
-                possible_paths = [
-                    f"/app/outputs/{filename}",  # Docker
-                    f"outputs/{filename}",       # Local relative
-                    os.path.join(os.getcwd(), "outputs", filename) # Local absolute
-                ]
-                
-                file_path = None
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        file_path = path
-                        break
-                
-                if file_path:
-                    with open(file_path, "rb") as img_file:
-                        b64_data = base64.b64encode(img_file.read()).decode('utf-8')
-                        image_url = f"data:image/png;base64,{b64_data}"
-                        logger.info(f"Embedded image {filename} as base64 from {file_path}")
-                else:
-                    # Fallback to URL if file not found
-                    logger.warning(f"Image file not found in {possible_paths}, falling back to URL")
-                    static_base = settings.STATIC_BASE_URL.rstrip('/')
-                    image_url = f"{static_base}/static/{filename}"
+                digest = media_store.put_output(filename)
             except Exception as e:
-                logger.error(f"Error embedding image: {e}")
+                logger.error(f"Error storing image: {e}")
+                digest = None
+            if digest:
+                item = media_store.media_item(digest, filename)
+            else:
                 static_base = settings.STATIC_BASE_URL.rstrip('/')
-                image_url = f"{static_base}/static/{filename}"
+                item = {"type": "image", "url": f"{static_base}/static/{filename}", "filename": filename}
+            image_url = item["url"]
 
             plot_markdown = f"\n\n![Analysis Plot]({image_url})"
             
             # Remove the marker from output to clean it up for LLM
             output = output.replace(plot_match.group(0), "")
-            media.append({
-                "type": "image",
-                "url": image_url,
-                "filename": filename
-            })
+            media.append(item)
         
         # Build sensor context for natural language generation
         sensor_context = ""
@@ -15,6 +15,7 @@ from shared.config import settings
 from orchestrator.llm_manager import llm_manager
 from orchestrator.services.context_manager import ContextManager
 from orchestrator.redis_manager import redis_manager
+from orchestrator.services.time_resolver import time_resolver
 
 logger = get_logger(__name__)
 
@@ -281,13 +282,9 @@ Your task is to analyze the user's question and return a JSON response with the
 3. "required_analytics" (list of strings): If intent="analytics", list required operations:
    - "min", "max", "avg", "count", "sum", "trend", "latest".
 
-4. "time_range" (object):
-   - "start": ISO date string or relative (e.g., "now-1d", "2023-01-01"). Default "now-1d" if not specified but analytics needed.
-   - "end": ISO date string or relative (e.g., "now").
+4. "response" (string): Direct answer if intent="general". Otherwise null.
 
-5. "response" (string): Direct answer if intent="general". Otherwise null.
-
-6. "explanation" (string): Brief reasoning for your classification.
+5. "explanation" (string): Brief reasoning for your classification.
 
 === RELEVANT CONTEXT ===
 {context_str}
@@ -328,7 +325,8 @@ Return ONLY the JSON object.
                     "intent": result.get("intent", "general"),
                     "entities": result.get("entities", []),
                     "required_analytics": result.get("required_analytics", []),
-                    "time_range": result.get("time_range", {"start": None, "end": None}),
+                    # Resolved locally (canonical UTC bounds), not by the LLM
+                    "time_range": time_resolver.resolve(user_query).to_dict(),
                     "response": result.get("response", ""),
                     "explanation": result.get("explanation", "")
                 }
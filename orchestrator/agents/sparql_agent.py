@@ -16,6 +16,8 @@ from shared.config import settings
 from orchestrator.llm_manager import llm_manager
 from orchestrator.agents.dialogue_agent import format_conversation_history
 from orchestrator.redis_manager import redis_manager
+from orchestrator.services.result_renderer import result_renderer
+from orchestrator.services.class_index import class_index
 
 logger = get_logger(__name__)
 
@@ -72,7 +74,6 @@ class SPARQLAgent:
     
     def __init__(self):
         self.max_retries = 3
-        self._instance_cache: Dict[str, List[str]] = {}
     
     async def _reason_over_ontology(
         self,
@@ -252,7 +253,7 @@ Your Answer:"""
             
             # Step 6: Standardize + Format results
             standardized = self._standardize_results(results, user_query, sparql_query)
-            formatted = await self._format_results(results, user_query, sparql_query, used_template)
+            formatted = await self._format_results(results, user_query, sparql_query, used_template, persona=state.persona)
             
             return {
                 "success": True,
@@ -774,27 +775,17 @@ SELECT ?building ?label ?comment WHERE {
         return None
 
     async def _get_instances_for_class(self, brick_class: str, limit: int = 40) -> List[str]:
-        """Query GraphDB for instances of a Brick class. Returns bldg: URIs only."""
-        if brick_class in self._instance_cache:
-            return self._instance_cache[brick_class]
-        q = f"""{self._prefix_block()}
-SELECT ?s WHERE {{ ?s rdf:type {brick_class} . FILTER(STRSTARTS(STR(?s), 'http://abacwsbuilding.cardiff.ac.uk/abacws#')) }} LIMIT {limit}"""
-        try:
-            async with httpx.AsyncClient(timeout=25.0) as client:
-                auth = (settings.GRAPHDB_USER, settings.GRAPHDB_PASSWORD) if settings.GRAPHDB_USER else None
-                resp = await client.post(GRAPHDB_QUERY_ENDPOINT, auth=auth, data={"query": q}, headers={"Accept": "application/sparql-results+json"})
-                resp.raise_for_status()
-                data = resp.json()
-                out = []
-                for b in data.get('results', {}).get('bindings', []):
-                    uri = b.get('s', {}).get('value')
-                    if uri and uri.startswith('http://abacwsbuilding.cardiff.ac.uk/abacws#'):
-                        out.append('bldg:' + uri.split('#', 1)[1])
-                self._instance_cache[brick_class] = out
-                return out
-        except Exception as e:
-            logger.warning(f"Class instance query failed for {brick_class}: {e}")
-            return []
+        """Look up instances of a Brick class (incl. subclasses) in the shared class index. Returns bldg: names only."""
+        if not class_index.is_loaded:
+            try:
+                await class_index.load()
+            except Exception as e:
+                logger.warning(f"Class index unavailable: {e}")
+        out = class_index.instances_of(brick_class, limit)
+        if not out and not class_index.has_class(brick_class):
+            # Class not in the snapshot yet - fetch it and merge into the index
+            out = await class_index.refresh_class(brick_class, limit)
+        return out
 
     async def _pattern_instance_search(self, brick_class: str, limit: int = 40) -> List[str]:
         """Fallback: search for URIs containing core type token (e.g., Humidity_Sensor) when rdf:type lookup empty."""
@@ -804,6 +795,9 @@ SELECT ?s WHERE {{ ?s rdf:type {brick_class} . FILTER(STRSTARTS(STR(?s), 'http:/
             token = m.group(1).replace('Air_Temperature', 'Air_Temperature').replace('Humidity', 'Humidity').replace('CO2', 'CO2').replace('Pressure', 'Pressure').replace('Occupancy', 'Occupancy')
         if not token:
             return []
+        indexed = class_index.search(f"{token}_Sensor", limit)
+        if indexed:
+            return indexed
         # Use regex on URI string via FILTER(CONTAINS())
         q = f"""{self._prefix_block()}
 SELECT ?s WHERE {{ ?s ?p ?o . FILTER(STRSTARTS(STR(?s),'http://abacwsbuilding.cardiff.ac.uk/abacws#') && CONTAINS(STR(?s), '{token}_Sensor')) }} LIMIT {limit}"""
@@ -1067,7 +1061,8 @@ SELECT ?sensor ?location ?uuid WHERE {{
         results: Dict[str, Any],
         user_query: str,
         sparql_query: str,
-        used_template: bool
+        used_template: bool,
+        persona: Optional[str] = None
     ) -> str:
         """Format SPARQL results into natural language"""
         
@@ -1112,6 +1107,12 @@ SELECT ?sensor ?location ?uuid WHERE {{
                     return f"The building name is: **{label}**\n\n{comment}"
                 return f"The building name is: **{label}**"
         
+        # Deterministic templates for common result shapes (no LLM round-trip)
+        rendered = result_renderer.render_sparql(bindings, user_query, persona)
+        if rendered is not None:
+            logger.info("✅ Rendered SPARQL results deterministically (LLM formatting skipped)")
+            return rendered
+        
         # Convert results to readable format
         result_text = f"Found {len(bindings)} result(s):\n\n"
         
@@ -4,16 +4,24 @@ SQL Agent - Time-series data queries for Building 1
 import sys
 sys.path.append('/app')
 
-import aiomysql
+import asyncio
 import json
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime
 from shared.models import ConversationState
 from shared.utils import get_logger
 from shared.config import settings
 from orchestrator.llm_manager import llm_manager
+from orchestrator.mysql_manager import mysql_manager
+from orchestrator.services.schema_catalog import schema_catalog
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.fetch_engine import ChunkedFetcher
+from orchestrator.services.timeseries_cache import timeseries_cache
+from orchestrator.services.storage_backends import storage_registry, FetchLog
+from orchestrator.services.time_resolver import time_resolver
+from orchestrator.services.resolution_planner import plan_resolution, wants_raw, ResolutionPlan
+from orchestrator.services.result_renderer import result_renderer
 
 logger = get_logger(__name__)
 
@@ -21,13 +29,8 @@ class SQLAgent:
     """Generates and executes SQL queries for time-series data"""
     
     def __init__(self):
-        self.db_config = {
-            'host': settings.MYSQL_HOST,
-            'port': settings.MYSQL_PORT,
-            'user': settings.MYSQL_USER,
-            'password': settings.MYSQL_PASSWORD,
-            'db': settings.MYSQL_DATABASE
-        }
+        # Connections come from the shared pool created in the app lifespan
+        self.db = mysql_manager
     
     async def generate_and_execute(
         self,
@@ -44,14 +47,16 @@ class SQLAgent:
             # Step 1: Get database schema
             schema = await self._get_schema()
             
-            # Step 2: Generate SQL query
-            sql_query = await self._generate_sql(user_query, schema)
+            # Step 2: Generate SQL query (long windows are aggregated into time buckets)
+            start, end = self._resolve_time_bounds(user_query)
+            plan = plan_resolution(start, end, force_raw=wants_raw(user_query))
+            sql_query = await self._generate_sql(user_query, schema, plan)
             
             # Step 3: Execute query
             results = await self._execute_query(sql_query)
             
             # Step 4: Format results
-            formatted = await self._format_results(results, user_query, sql_query)
+            formatted = await self._format_results(results, user_query, sql_query, persona=state.persona)
             
             return {
                 "success": True,
@@ -77,7 +82,8 @@ class SQLAgent:
         user_query: str,
         storage_map: Optional[Dict[str, str]] = None,
         start_date: Optional[str] = None,
-        end_date: Optional[str] = None
+        end_date: Optional[str] = None,
+        persona: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Fetch data for specific UUIDs, respecting storage locations.
@@ -88,6 +94,7 @@ class SQLAgent:
             storage_map: Dictionary mapping UUID -> Storage Location URI (e.g. "bldg:database1")
             start_date: Start date/time string (ISO or relative)
             end_date: End date/time string (ISO or relative)
+            persona: User persona (controls deterministic vs narrative formatting)
         """
         try:
             logger.info("="*80)
@@ -99,203 +106,156 @@ class SQLAgent:
                 storage = storage_map.get(uuid, 'N/A') if storage_map else 'N/A'
                 logger.info(f"   {i}. {uuid} (Storage: {storage})")
             
-            # Group UUIDs by storage location
-            # Default to 'default' if no map provided or storage not found
-            grouped_uuids = {"default": []}
+            # Group UUIDs by the backend their ref:storedAt IRI maps to
+            grouped_uuids = storage_registry.group(uuids, storage_map)
             
-            if storage_map:
-                for uuid in uuids:
-                    storage = storage_map.get(uuid)
-                    # Normalize storage string (remove prefixes if needed)
-                    if storage:
-                        if "database1" in storage:
-                            key = "database1"
-                        else:
-                            key = "default" # Fallback to default for now
-                    else:
-                        key = "default"
-                    
-                    if key not in grouped_uuids:
-                        grouped_uuids[key] = []
-                    grouped_uuids[key].append(uuid)
-            else:
-                grouped_uuids["default"] = uuids
+            start, end = self._resolve_time_bounds(user_query, start_date, end_date)
+            plan = plan_resolution(start, end, force_raw=wants_raw(user_query))
+            logger.info(
+                f"🕒 Time window: [{start} → {end}) "
+                + ("raw rows" if plan.is_raw else f"in {plan.bucket_seconds}s buckets")
+            )
+
+            log = FetchLog()
             
-            # OPTIMIZATION: If too many UUIDs, limit to first one to avoid SQL truncation
-            # This handles cases where user asks for specific sensor but SPARQL returns many matches
-            for key in grouped_uuids:
-                if len(grouped_uuids[key]) > 3:
-                    logger.warning(f"⚠️  Too many UUIDs ({len(grouped_uuids[key])}) from SPARQL. Limiting to first 3 to avoid SQL issues.")
-                    logger.warning(f"   User asked for specific sensor, but SPARQL returned multiple matches.")
-                    logger.warning(f"   Using UUIDs: {grouped_uuids[key][:3]}")
-                    grouped_uuids[key] = grouped_uuids[key][:3]
-
-            all_data = []
-            
-            # Process each storage group (currently only supporting MySQL/default)
-            for storage_key, group_uuids in grouped_uuids.items():
-                if not group_uuids:
-                    continue
-                    
-                logger.info(f"Fetching data for {len(group_uuids)} UUIDs from storage: {storage_key}")
-                
-                # In a fully heterogeneous system, we would switch connection configs here
-                # For now, we assume all data is in the configured MySQL DB
+            async def fetch_group(storage_key: str, group_uuids: List[str]) -> SeriesFrame:
+                backend = storage_registry.get(storage_key)
+                logger.info(f"Fetching data for {len(group_uuids)} UUIDs from storage: {storage_key} ({backend.kind})")
                 
-                schema = await self._get_schema()
+                async def fetch_range(batch: List[str], sub_plan: ResolutionPlan, row_limit: int) -> SeriesFrame:
+                    return await backend.fetch_range(batch, sub_plan, row_limit, log)
                 
-                # Format UUIDs for SQL IN clause
-                uuid_list_str = ", ".join([f"'{u}'" for u in group_uuids])
-                
-                # Construct time context
-                time_context = ""
-                if start_date:
-                    time_context += f"Start Date: {start_date}\n"
-                if end_date:
-                    time_context += f"End Date: {end_date}\n"
-                if not time_context:
-                    time_context = self._parse_time_references(user_query)
-
-                prompt = f"""You are a SQL expert. Generate a MySQL query to fetch time-series data for specific sensors.
-
-Database Schema:
-{schema}
-
-Target Sensor UUIDs ({len(group_uuids)} total): {uuid_list_str}
-
-Time Context:
-{time_context}
-
-User Request Context: "{user_query}"
-
-CRITICAL REQUIREMENTS:
-1. The schema shows UUIDs as COLUMN NAMES (wide format). You MUST unpivot them using UNION ALL.
-2. The timestamp column is called 'Datetime' (capital D), NOT 'timestamp'.
-3. For each UUID, generate a SELECT statement and combine with UNION ALL.
-4. ALWAYS use 'Datetime' as the column name in ALL clauses (SELECT, WHERE, ORDER BY).
-5. DO NOT add LIMIT clauses within individual UNION queries - apply global ORDER BY and LIMIT at the end.
-6. For multiple UUIDs, wrap in parentheses and add final ORDER BY Datetime DESC LIMIT 1000.
-
-Single UUID Template:
-SELECT 
-  Datetime AS timestamp, 
-  'uuid_value' AS uuid, 
-  `uuid_value` AS value
-FROM sensor_data
-WHERE `uuid_value` IS NOT NULL
-  AND [TIME_FILTER_USING_Datetime]
-ORDER BY Datetime DESC
-LIMIT 1000;
-
-Multiple UUIDs Template:
-(
-  SELECT Datetime AS timestamp, 'uuid1' AS uuid, `uuid1` AS value
-  FROM sensor_data
-  WHERE `uuid1` IS NOT NULL AND Datetime >= [TIME_FILTER]
-)
-UNION ALL
-(
-  SELECT Datetime AS timestamp, 'uuid2' AS uuid, `uuid2` AS value
-  FROM sensor_data
-  WHERE `uuid2` IS NOT NULL AND Datetime >= [TIME_FILTER]
-)
-ORDER BY Datetime DESC
-LIMIT 1000;
-
-Time Filter Rules:
-- If "today" in query: Datetime >= CURDATE() AND Datetime < CURDATE() + INTERVAL 1 DAY
-- If "yesterday" in query: Datetime >= CURDATE() - INTERVAL 1 DAY AND Datetime < CURDATE()
-- If "last N hours" in query: Datetime >= NOW() - INTERVAL N HOUR
-- If "last N days" in query: Datetime >= NOW() - INTERVAL N DAY
-- Otherwise (default): Datetime >= NOW() - INTERVAL 1 DAY
-
-Return ONLY the SQL query, no markdown, no explanations.
-"""
-                sql_query = await llm_manager.generate(prompt)
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-                
-                logger.info(f"\n📝 Generated SQL for UUIDs ({storage_key}):")
-                logger.info(f"   {sql_query}")
-                
-                logger.info(f"\n⚙️  Executing SQL query...")
-                results = await self._execute_query(sql_query)
+                async def fetch_batch(batch: List[str], row_limit: int) -> SeriesFrame:
+                    if backend.cacheable:
+                        # Closed historical chunks come from the cache, only the rest hits the database
+                        frame = await timeseries_cache.fetch(batch, plan, row_limit, fetch_range)
+                    else:
+                        frame = await fetch_range(batch, plan, row_limit)
+                    if plan.is_raw and len(frame) > row_limit:
+                        # Raw segments are newest-first, so the head keeps the newest readings
+                        frame = frame.head(row_limit)
+                    return frame
                 
-                if results:
-                    logger.info(f"✅ Query returned {len(results)} rows")
-                    if results:
-                        logger.info(f"📊 Sample row: {results[0]}")
-                    all_data.extend(results)
+                # Row/byte budgets are shared across storage groups in proportion to their UUIDs
+                share = len(group_uuids) / max(1, len(uuids))
+                fetcher = ChunkedFetcher(
+                    max_rows=max(1, int(settings.SQL_UUID_FETCH_LIMIT * share)),
+                    max_bytes=max(1, int(settings.SQL_FETCH_MAX_BYTES * share))
+                )
+                frame = await fetcher.fetch(group_uuids, fetch_batch)
+                if len(frame):
+                    logger.info(f"✅ Fetched {len(frame)} readings from {storage_key}")
+                else:
+                    logger.warning(f"⚠️  No results returned for storage {storage_key}")
+                return frame
+            
+            # Storage groups are fetched concurrently, each through its own backend pool
+            keys = list(grouped_uuids)
+            results = await asyncio.gather(
+                *(fetch_group(key, grouped_uuids[key]) for key in keys), return_exceptions=True
+            )
+            frames = []
+            failed_storage = {}
+            for key, result in zip(keys, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Storage {key} fetch failed: {result}")
+                    failed_storage[key] = str(result)
                 else:
-                    logger.warning(f"⚠️  No results returned from query")
+                    frames.append(result)
+            if failed_storage and not frames:
+                raise Exception("; ".join(f"{key}: {error}" for key, error in failed_storage.items()))
+            missing_uuids = list(dict.fromkeys(log.missing))
+            if missing_uuids:
+                logger.warning(f"⚠️  UUIDs not found in their storage backend: {missing_uuids}")
+            merged = SeriesFrame.concat(frames)
+            all_data = merged.to_records()
 
             # Standardize output format for Analytics Agent
             # We want a flat list of records: [{"timestamp": "...", "uuid": "...", "value": ...}, ...]
             standardized_data = {"data": all_data}
             
-            formatted = await self._format_results(all_data, user_query, "Multiple Queries")
+            # Batches that failed inside a group plus every UUID of a group whose backend failed
+            failed_uuids = merged.failed_uuids + [u for key in failed_storage for u in grouped_uuids[key]]
+            
+            formatted = await self._format_results(all_data, user_query, "Multiple Queries", persona=persona)
+            if failed_uuids:
+                logger.warning(f"⚠️  Fetch failed for UUIDs: {failed_uuids}")
+                formatted += "\n\n" + result_renderer.render_unavailable(failed_uuids)
+            elif merged.truncated:
+                formatted += "\n\n⚠️ The result was capped at the fetch limit; narrow the time window for complete data."
             
             return {
                 "success": True,
-                "query": "Multiple Queries (Storage Aware)",
+                "query": ";\n".join(log.queries) or "Multiple Queries (Storage Aware)",
                 "results": standardized_data, # Standardized JSON for Analytics
                 "formatted_response": formatted,
+                "missing_uuids": missing_uuids,
+                "failed_storage": failed_storage,
+                "truncated": merged.truncated,
+                "failed_uuids": failed_uuids,
+                "frame": merged,  # Columnar data behind the records (moved into state.query_frame)
+                "time_window": {"start": start.isoformat(), "end": end.isoformat()},
+                "resolution": plan.to_dict(),
                 "analytics_required": True
             }
         except Exception as e:
             logger.error(f"Fetch data for UUIDs failed: {e}")
             return {"success": False, "error": str(e)}
 
-    async def _get_schema(self) -> str:
-        """Get database schema information with intelligent column detection"""
+    def _resolve_time_bounds(
+        self,
+        user_query: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Tuple[datetime, datetime]:
+        """
+        Resolve the fetch window to concrete [start, end) bounds in the database time zone
+        
+        Uses the deterministic time resolver (canonical ISO bounds from upstream win,
+        then expressions in the query, then relative hints such as 'now-1d';
+        default: last 24 hours).
+        """
+        window = time_resolver.resolve(user_query, start_date, end_date)
+        return window.naive_in(settings.MYSQL_TIMEZONE)
+    
+    async def _get_schema(self, target_uuids: Optional[List[str]] = None) -> str:
+        """
+        Get database schema information from the cached schema catalog
+        
+        Args:
+            target_uuids: Sensor UUIDs of interest; wide tables only list these columns
+        """
         try:
-            conn = await aiomysql.connect(**self.db_config)
-            async with conn.cursor() as cursor:
-                # Get table names
-                await cursor.execute("SHOW TABLES")
-                tables = await cursor.fetchall()
-                
-                schema_info = "Database Schema:\n\n"
-                timestamp_col_detected = None
-                
-                for (table_name,) in tables:
-                    schema_info += f"Table: {table_name}\n"
-                    
-                    # Get column info
-                    await cursor.execute(f"DESCRIBE {table_name}")
-                    columns = await cursor.fetchall()
-                    
-                    for col in columns:
-                        col_name = col[0]
-                        col_type = col[1]
-                        schema_info += f"  - {col_name} ({col_type})\n"
-                        
-                        # Detect timestamp/datetime column
-                        if not timestamp_col_detected:
-                            col_lower = col_name.lower()
-                            type_lower = col_type.decode('utf-8').lower() if isinstance(col_type, bytes) else str(col_type).lower()
-                            if 'datetime' in col_lower or 'timestamp' in col_lower or 'date' in type_lower or 'time' in type_lower:
-                                timestamp_col_detected = col_name
-                    
-                    schema_info += "\n"
-                
-                # Add critical note about timestamp column
-                if timestamp_col_detected:
-                    schema_info += f"\n⚠️  CRITICAL: The timestamp column is named '{timestamp_col_detected}' (case-sensitive).\n"
-                    schema_info += f"    Always use '{timestamp_col_detected}' in SELECT, WHERE, and ORDER BY clauses.\n"
-                    schema_info += f"    You can alias it as 'timestamp' in SELECT (e.g., '{timestamp_col_detected} AS timestamp').\n"
-                
-                conn.close()
-                return schema_info
-                
+            return await schema_catalog.describe(target_uuids)
         except Exception as e:
             logger.error(f"Schema retrieval error: {e}")
             return "Schema unavailable"
     
-    async def _generate_sql(self, user_query: str, schema: str) -> str:
+    async def _generate_sql(self, user_query: str, schema: str, plan: Optional[ResolutionPlan] = None) -> str:
         """Generate SQL query using LLM"""
         
-        # Parse time references
-        time_context = self._parse_time_references(user_query)
+        # Canonical window with literal bounds (no NOW()/CURDATE() in generated SQL)
+        if plan is None:
+            start, end = self._resolve_time_bounds(user_query)
+            plan = plan_resolution(start, end, force_raw=wants_raw(user_query))
+        lo = plan.start.strftime("%Y-%m-%d %H:%M:%S")
+        hi = plan.end.strftime("%Y-%m-%d %H:%M:%S")
+        time_context = (
+            f"Requested window (database time, {settings.MYSQL_TIMEZONE}): {lo} to {hi}\n"
+            f"Use exactly: WHERE Datetime >= '{lo}' AND Datetime < '{hi}'"
+        )
+        
+        if not plan.is_raw:
+            n = plan.bucket_seconds
+            row_rules = f"""4. The time range is long: AGGREGATE into {n}-second buckets instead of fetching raw rows.
+   Select 'FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(Datetime) / {n}) * {n}) AS timestamp' and
+   AVG(`uuid_column`) AS value, MIN(...) AS min, MAX(...) AS max, COUNT(...) AS count.
+5. GROUP BY the bucket (GROUP BY 1); no LIMIT is needed, there are at most {plan.expected_points} buckets per sensor.
+6. Order by the bucket ascending (ORDER BY 1)."""
+        else:
+            row_rules = """4. NO AGGREGATION (no AVG, SUM, etc.) - fetch raw rows only.
+5. Limit to 1000 rows max.
+6. Order by 'Datetime DESC'."""
         
         sql_prompt = f"""You are a SQL expert for building time-series data.
 
@@ -313,23 +273,18 @@ CRITICAL RULES:
 1. The timestamp column is 'Datetime' (capital D) - use it in ALL clauses (SELECT, WHERE, ORDER BY).
 2. Select 'Datetime AS timestamp', the UUID column as 'value', and the UUID as string literal for 'uuid'.
 3. Filter by time using 'Datetime' column (NOT 'timestamp').
-4. NO AGGREGATION (no AVG, SUM, etc.) - fetch raw rows only.
-5. Limit to 1000 rows max.
-6. Order by 'Datetime DESC'.
+{row_rules}
 
-Time Filter Examples:
-- Today: WHERE Datetime >= CURDATE() AND Datetime < CURDATE() + INTERVAL 1 DAY
-- Yesterday: WHERE Datetime >= CURDATE() - INTERVAL 1 DAY AND Datetime < CURDATE()
-- Last N hours: WHERE Datetime >= NOW() - INTERVAL N HOUR
-- Default (24h): WHERE Datetime >= NOW() - INTERVAL 1 DAY
+Time Filter:
+- Use the literal bounds from the Time Context. Do NOT use NOW(), CURDATE() or INTERVAL arithmetic.
 
-Template:
+Template (raw rows):
 SELECT 
   Datetime AS timestamp,
   `uuid_column` AS value,
   'uuid_value' AS uuid
 FROM sensor_data 
-WHERE Datetime >= [TIME_CONDITION]
+WHERE Datetime >= '[START]' AND Datetime < '[END]'
   AND `uuid_column` IS NOT NULL
 ORDER BY Datetime DESC 
 LIMIT 1000;
@@ -345,43 +300,6 @@ Respond with ONLY the SQL query, no markdown, no explanations."""
         return sql
 
 
-    def _parse_time_references(self, query: str) -> str:
-        """Parse time references from natural language"""
-        query_lower = query.lower()
-        try:
-            now = datetime.now(ZoneInfo("Europe/London"))
-        except Exception:
-            now = datetime.now()
-        
-        time_info = "Current time: " + now.strftime("%Y-%m-%d %H:%M:%S %Z") + "\n"
-        
-        if "today" in query_lower:
-            start = now.replace(hour=0, minute=0, second=0)
-            time_info += f"Today starts at: {start.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        
-        if "yesterday" in query_lower:
-            yesterday = now - timedelta(days=1)
-            time_info += f"Yesterday: {yesterday.strftime('%Y-%m-%d')}\n"
-        
-        if "last week" in query_lower:
-            week_ago = now - timedelta(days=7)
-            time_info += f"One week ago: {week_ago.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        
-        if "last month" in query_lower:
-            month_ago = now - timedelta(days=30)
-            time_info += f"One month ago: {month_ago.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        
-        # Extract specific hours/days mentions
-        if "hour" in query_lower:
-            import re
-            match = re.search(r'(\d+)\s*hours?', query_lower)
-            if match:
-                hours = int(match.group(1))
-                time_ago = now - timedelta(hours=hours)
-                time_info += f"{hours} hours ago: {time_ago.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        
-        return time_info
-    
     def _extract_sql(self, response: str) -> str:
         """Extract SQL query from LLM response"""
         # Remove markdown code blocks
@@ -425,30 +343,25 @@ Respond with ONLY the SQL query, no markdown, no explanations."""
                  
         return True
 
-    async def _execute_query(self, sql: str) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results"""
+    async def _execute_query(self, sql: str, params: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """Execute SQL query (with optional bound parameters) and return results"""
         try:
             # Validate SQL before execution
             self.validate_sql(sql)
             
-            conn = await aiomysql.connect(**self.db_config)
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute(sql)
-                results = await cursor.fetchall()
-                
-                conn.close()
-                
-                # Convert Decimal to float and datetime to string for JSON serialization
-                from decimal import Decimal
-                for row in results:
-                    for key, value in row.items():
-                        if isinstance(value, Decimal):
-                            row[key] = float(value)
-                        elif isinstance(value, datetime):
-                            row[key] = value.isoformat()
-                
-                logger.info(f"SQL query returned {len(results)} rows")
-                return results
+            results = await self.db.fetch_all(sql, params)
+            
+            # Convert Decimal to float and datetime to string for JSON serialization
+            from decimal import Decimal
+            for row in results:
+                for key, value in row.items():
+                    if isinstance(value, Decimal):
+                        row[key] = float(value)
+                    elif isinstance(value, datetime):
+                        row[key] = value.isoformat()
+            
+            logger.info(f"SQL query returned {len(results)} rows")
+            return results
                 
         except Exception as e:
             logger.error(f"SQL execution error: {e}")
@@ -458,13 +371,20 @@ Respond with ONLY the SQL query, no markdown, no explanations."""
         self,
         results: List[Dict[str, Any]],
         user_query: str,
-        sql_query: str
+        sql_query: str,
+        persona: Optional[str] = None
     ) -> str:
         """Format SQL results into natural language"""
         
         if not results:
             return "No data found for your query."
         
+        # Deterministic templates for latest readings / summary statistics
+        rendered = result_renderer.render_sql(results, user_query, persona)
+        if rendered is not None:
+            logger.info("✅ Rendered SQL results deterministically (LLM formatting skipped)")
+            return rendered
+        
         # Convert results to readable format
         result_text = f"Found {len(results)} record(s):\n\n"
         
@@ -6,12 +6,16 @@ sys.path.append('/app')
 
 import httpx
 import uuid
-import json
 from typing import Dict, Any, Optional, List
 from shared.models import ConversationState
 from shared.utils import get_logger, extract_code_from_llm_response
 from shared.config import settings
 from orchestrator.llm_manager import llm_manager
+from orchestrator.services.code_attachments import attachment_store
+from orchestrator.services.media_store import media_store
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.chart_specs import chart_spec_engine
+from orchestrator.services.downsampling import downsampler
 
 logger = get_logger(__name__)
 
@@ -40,6 +44,11 @@ class VisualizationAgent:
             Dict with 'code', 'chart_type', 'image_path', 'description'
         """
         try:
+            # Common charts: declarative spec from the data (no LLM, no executor)
+            spec_result = self._create_chart_spec(state, user_query, data)
+            if spec_result:
+                return spec_result
+
             # Step 1: Determine chart type
             chart_type = await self._determine_chart_type(user_query, data)
             
@@ -50,43 +59,23 @@ class VisualizationAgent:
             code = await self._generate_viz_code(user_query, data, chart_type, filename)
             
             # Step 3: Execute visualization code
-            result = await self._execute_viz_code(code)
+            result = await self._execute_viz_code(code, data, state.query_frame)
             
             # Step 4: Generate description
             description = await self._generate_description(user_query, chart_type, data)
             
-            # Try to embed image as base64 to avoid localhost/network issues
+            # Store the image once and reference it by content hash (never inline it)
             try:
-                import base64
-                import os
-                
-                # Check multiple possible paths
-                possible_paths = [
-                    f"/app/outputs/{filename}",  # Docker
-                    f"outputs/{filename}",       # Local relative
-                    os.path.join(os.getcwd(), "outputs", filename) # Local absolute
-                ]
-                
-                file_path = None
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        file_path = path
-                        break
-                
-                if file_path:
-                    with open(file_path, "rb") as img_file:
-                        b64_data = base64.b64encode(img_file.read()).decode('utf-8')
-                        image_url = f"data:image/png;base64,{b64_data}"
-                        logger.info(f"Embedded image {filename} as base64 from {file_path}")
-                else:
-                    # Fallback to URL if file not found
-                    logger.warning(f"Image file not found in {possible_paths}, falling back to URL")
-                    static_base = settings.STATIC_BASE_URL.rstrip('/')
-                    image_url = f"{static_base}/static/{filename}"
+                digest = media_store.put_output(filename)
             except Exception as e:
-                logger.error(f"Error embedding image: {e}")
+                logger.error(f"Error storing image: {e}")
+                digest = None
+            if digest:
+                item = media_store.media_item(digest, filename)
+            else:
                 static_base = settings.STATIC_BASE_URL.rstrip('/')
-                image_url = f"{static_base}/static/{filename}"
+                item = {"type": "image", "url": f"{static_base}/static/{filename}", "filename": filename}
+            image_url = item["url"]
 
             # Construct response with image link
             formatted_response = f"{description}\n\n![Visualization]({image_url})"
@@ -98,13 +87,7 @@ class VisualizationAgent:
                 "output": result.get("output"),
                 "description": description,
                 "formatted_response": formatted_response,
-                "media": [
-                    {
-                        "type": "image",
-                        "url": image_url,
-                        "filename": filename
-                    }
-                ]
+                "media": [item]
             }
             
         except Exception as e:
@@ -116,6 +99,38 @@ class VisualizationAgent:
                 "chart_type": None
             }
     
+    def _create_chart_spec(
+        self,
+        state: ConversationState,
+        user_query: str,
+        data: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Build the chart as a Plotly spec when the intent is supported (None otherwise)"""
+        records = self._records(data)
+        if not records or not chart_spec_engine.enabled:
+            return None
+        try:
+            frame = state.query_frame if state.query_frame is not None else SeriesFrame.from_records(records)
+            chart = chart_spec_engine.build(
+                user_query, frame, state.intermediate_results.get("sensor_metadata")
+            )
+            if chart is None:
+                return None
+            item = chart_spec_engine.publish(chart)
+        except Exception as e:
+            logger.warning(f"Chart spec failed, falling back to generated code: {e}")
+            return None
+
+        return {
+            "success": True,
+            "code": None,
+            "chart_type": chart.kind,
+            "output": None,
+            "description": chart.description,
+            "formatted_response": f"{chart.description}\n\n[Open interactive chart]({item['url']})",
+            "media": [item]
+        }
+
     async def _determine_chart_type(
         self,
         user_query: str,
@@ -184,7 +199,9 @@ Output Filename: {filename}
 
 Generate code that:
 1. Imports matplotlib.pyplot, seaborn, pandas, json
-2. Prepares the data (convert from dict/json to DataFrame)
+2. Uses the pandas DataFrame `df`, which is already loaded with the data above (do NOT read files or paste data).
+   Sensor readings are downsampled for plotting: 'value' keeps the shape of each series, 'min'/'max' are the
+   envelope of the readings each row stands for (draw them as a band with fill_between if useful)
 3. Creates a {chart_type} using seaborn or matplotlib
 4. Includes proper labels, title, and styling
 5. Saves the plot to '/app/outputs/{filename}'
@@ -197,16 +214,8 @@ import seaborn as sns
 import pandas as pd
 import json
 
-# Prepare data
-raw_data = {json.dumps(data) if data else "{}"}
-# If raw_data is a dict with 'data' list, extract it
-if isinstance(raw_data, dict) and 'data' in raw_data:
-    df = pd.DataFrame(raw_data['data'])
-else:
-    df = pd.DataFrame(raw_data)
-
-# Ensure numeric/datetime types
-# ...
+# `df` is provided (sensor readings: timestamp, uuid, value)
+df = df.copy()
 
 # Create plot
 plt.figure(figsize=(10, 6))
@@ -227,13 +236,33 @@ Respond with ONLY the Python code, wrapped in ```python blocks."""
         logger.info(f"Generated visualization code for {chart_type}")
         return code
     
-    async def _execute_viz_code(self, code: str) -> Dict[str, Any]:
-        """Execute visualization code"""
+    async def _execute_viz_code(
+        self,
+        code: str,
+        data: Optional[Dict[str, Any]] = None,
+        frame: Optional[SeriesFrame] = None
+    ) -> Dict[str, Any]:
+        """
+        Execute visualization code with the data attached as DataFrame 'df' (downsampled for plotting)
+
+        Args:
+            frame: The fetched SeriesFrame behind the records, if any (not rebuilt from them)
+        """
+        attachments = []
+        records = self._records(data)
+        if records is not None:
+            if frame is None:
+                frame = SeriesFrame.from_records(records)
+            if downsampler.plottable(frame):
+                attachments.append(attachment_store.attach("df", downsampler.frame(frame)))
+            else:
+                # Not plain sensor readings: attach the rows as they are
+                attachments.append(attachment_store.attach_records("df", records))
         try:
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
                     f"{CODE_EXECUTOR_URL}/execute",
-                    json={"code": code}
+                    json={"code": code, "attachments": attachments}
                 )
                 response.raise_for_status()
                 return response.json()
@@ -242,6 +271,15 @@ Respond with ONLY the Python code, wrapped in ```python blocks."""
             logger.error(f"Visualization execution error: {e}")
             raise Exception(f"Failed to create visualization: {str(e)}")
     
+    @staticmethod
+    def _records(data: Optional[Any]) -> Optional[List[Dict[str, Any]]]:
+        """Row records in a query result ({'data': [...]} or a bare list)"""
+        if isinstance(data, dict):
+            data = data.get("data")
+        if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+            return data
+        return None
+    
     async def _generate_description(
         self,
         user_query: str,
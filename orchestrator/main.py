@@ -7,12 +7,13 @@ sys.path.append('/app')
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Header, Cookie, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response, HTMLResponse
 from contextlib import asynccontextmanager
 from typing import Dict, Any, Optional
 from datetime import datetime
 import json
 import os
+import httpx
 
 from shared.models import ConversationState, Message, APIResponse
 from shared.utils import get_logger, generate_conversation_id
@@ -20,8 +21,20 @@ from shared.config import settings
 
 from orchestrator.redis_manager import RedisManager
 from orchestrator.postgres_manager import PostgresManager
+from orchestrator.mysql_manager import mysql_manager
 from orchestrator.workflow import WorkflowOrchestrator
 from orchestrator.auth_manager import AuthManager
+from orchestrator.services.class_index import class_index
+from orchestrator.services.schema_catalog import schema_catalog
+from orchestrator.services.timeseries_cache import timeseries_cache
+from orchestrator.services.parquet_archive import parquet_archive
+from orchestrator.services.storage_backends import storage_registry
+from orchestrator.services.code_attachments import attachment_store
+from orchestrator.services.code_cache import code_cache
+from orchestrator.services.code_validator import code_validator
+from orchestrator.services.media_store import media_store
+from orchestrator.services.chart_specs import chart_spec_engine, SPEC_CONTENT_TYPE
+from orchestrator.services.downsampling import downsampler
 
 logger = get_logger(__name__)
 
@@ -49,6 +62,12 @@ async def lifespan(app: FastAPI):
     await postgres_manager.connect()
     logger.info("Postgres connected")
     
+    # Initialize pooled MySQL access (time-series data)
+    await mysql_manager.connect()
+    
+    # Load the storage IRI -> backend mapping (other backends connect on first use)
+    storage_registry.load()
+    
     # Initialize authentication manager
     auth_manager = AuthManager(redis_manager, postgres_manager)
     logger.info("Auth manager initialized")
@@ -57,12 +76,23 @@ async def lifespan(app: FastAPI):
     orchestrator = WorkflowOrchestrator(redis_manager=redis_manager, postgres_manager=postgres_manager)
     logger.info("Workflow orchestrator initialized")
     
+    # Pre-warm the shared class -> instance index
+    try:
+        await class_index.load()
+        class_index.start()
+        logger.info("Class index ready")
+    except Exception as e:
+        logger.warning(f"Class index warm-up failed, will load lazily: {e}")
+    
     yield
     
     # Shutdown
     logger.info("Shutting down OntoSage 2.0 Orchestrator...")
+    await class_index.stop()
     await redis_manager.close()
     await postgres_manager.close()
+    await storage_registry.close()
+    await mysql_manager.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -124,6 +154,67 @@ async def health_check():
             }
         )
 
+@app.get("/metrics", response_model=APIResponse)
+async def metrics():
+    """Data-access metrics (MySQL pool/statements, ontology class index)"""
+    return APIResponse(
+        success=True,
+        data={
+            "mysql": mysql_manager.stats(),
+            "class_index": class_index.stats(),
+            "schema_catalog": schema_catalog.stats(),
+            "timeseries_cache": timeseries_cache.stats(),
+            "archive": parquet_archive.stats(),
+            "storage_backends": storage_registry.stats(),
+            "code_attachments": attachment_store.stats(),
+            "code_cache": code_cache.stats(),
+            "code_validator": code_validator.stats(),
+            "media": media_store.stats(),
+            "chart_specs": chart_spec_engine.stats(),
+            "downsampling": downsampler.stats()
+        }
+    )
+
+@app.get("/media/{media_hash}")
+async def get_media(media_hash: str, request: Request, variant: str = "original", download: int = 0):
+    """
+    Serve a stored image (or its webp/thumb variant) by content hash
+    
+    Content never changes under a hash, so responses are cacheable forever.
+    """
+    found = media_store.get(media_hash, variant)
+    if not found:
+        raise HTTPException(status_code=404, detail="Media not found")
+    path, content_type = found
+    etag = f'"{media_hash}-{variant}"'
+    headers = {
+        "Cache-Control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if download:
+        extension = os.path.splitext(path)[1] or ".png"
+        headers["Content-Disposition"] = f'attachment; filename="{media_hash[:12]}{extension}"'
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+@app.get("/charts/{chart_hash}")
+async def get_chart(chart_hash: str, request: Request):
+    """Interactive page for a stored chart spec (rendered in the browser with plotly.js)"""
+    found = media_store.get(chart_hash)
+    if not found or found[1] != SPEC_CONTENT_TYPE:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    etag = f'"{chart_hash}-page"'
+    headers = {
+        "Cache-Control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    with open(found[0], "r", encoding="utf-8") as f:
+        spec_json = f.read()
+    return HTMLResponse(chart_spec_engine.page(spec_json), headers=headers)
+
 @app.get("/conversations/{user_id}", response_model=APIResponse)
 async def get_conversations(user_id: str):
     """Get list of conversations for a user"""
@@ -1076,6 +1167,15 @@ async def delete_conversation(conversation_id: str):
         await redis_manager.redis.delete(f"conversation:{conversation_id}")
         await redis_manager.redis.delete(f"messages:{conversation_id}")
         
+        # Free the conversation's analysis session in the code executor (best effort)
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                await client.delete(
+                    f"http://{settings.CODE_EXECUTOR_HOST}:{settings.CODE_EXECUTOR_PORT}/sessions/{conversation_id}"
+                )
+        except httpx.HTTPError as e:
+            logger.debug(f"Could not end executor session {conversation_id}: {e}")
+        
         return APIResponse(
             success=True,
             data={"message": f"Conversation {conversation_id} deleted"}
@@ -0,0 +1,321 @@
+"""
+MySQL Manager for OntoSage 2.0
+Pooled access to the building time-series database (Building 1)
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import time
+import aiomysql
+import numpy as np
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Sequence
+from pymysql.constants import FIELD_TYPE
+from shared.config import settings
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+NUMERIC_TYPES = {
+    FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG,
+    FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24, FIELD_TYPE.YEAR
+}
+TEMPORAL_TYPES = {FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP, FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE}
+
+
+def _column_dtype(type_code: int):
+    """numpy dtype for a MySQL result column (None NULLs become NaN / NaT)"""
+    if type_code in NUMERIC_TYPES:
+        return np.float64
+    if type_code in TEMPORAL_TYPES:
+        return "datetime64[us]"
+    return object
+
+
+def _decode(values: Sequence[Any], dtype) -> np.ndarray:
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        # e.g. zero dates returned as strings
+        return np.array(values, dtype=object)
+
+
+class MySQLManager:
+    """Manages a shared aiomysql connection pool with per-query timeouts and metrics"""
+
+    def __init__(self, db_config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            db_config: host/port/user/password/db overrides (defaults to the MYSQL_* settings);
+                used by storage backends that point at another MySQL server
+        """
+        self.db_config = {
+            'host': settings.MYSQL_HOST,
+            'port': settings.MYSQL_PORT,
+            'user': settings.MYSQL_USER,
+            'password': settings.MYSQL_PASSWORD,
+            'db': settings.MYSQL_DATABASE
+        }
+        self.db_config.update(db_config or {})
+        self.pool: Optional[aiomysql.Pool] = None
+        self.query_timeout = settings.MYSQL_QUERY_TIMEOUT
+        self.read_only = settings.MYSQL_READ_ONLY
+        self._connect_lock = asyncio.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._latencies = deque(maxlen=1000)
+        self.metrics = {
+            "statements": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rows": 0,
+            "bytes": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+            "reconnects": 0,
+        }
+
+    def _init_command(self) -> str:
+        """Session settings applied to every pooled connection"""
+        settings_sql = [f"max_execution_time = {int(self.query_timeout * 1000)}"]
+        if self.read_only:
+            settings_sql.insert(0, "transaction_read_only = 1")
+        return "SET SESSION " + ", ".join(settings_sql)
+
+    async def connect(self):
+        """Create the connection pool"""
+        async with self._connect_lock:
+            if self.pool:
+                return
+            try:
+                self.pool = await aiomysql.create_pool(
+                    minsize=settings.MYSQL_POOL_MIN_SIZE,
+                    maxsize=settings.MYSQL_POOL_MAX_SIZE,
+                    pool_recycle=settings.MYSQL_POOL_RECYCLE,
+                    connect_timeout=settings.MYSQL_CONNECT_TIMEOUT,
+                    autocommit=True,
+                    init_command=self._init_command(),
+                    **self.db_config
+                )
+                logger.info(
+                    f"Connected to MySQL: {self.db_config['host']}/{self.db_config['db']} "
+                    f"(pool {settings.MYSQL_POOL_MIN_SIZE}-{settings.MYSQL_POOL_MAX_SIZE}, read_only={self.read_only})"
+                )
+            except Exception as e:
+                logger.error(f"Failed to connect to MySQL: {e}")
+                # Don't raise here to allow app to start even if DB is down
+
+    async def close(self):
+        """Close the connection pool"""
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            logger.info("Closed MySQL connection pool")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Acquire a healthy pooled connection.
+
+        Connections idle for longer than MYSQL_POOL_PING_INTERVAL are pinged
+        before use; connections that error or time out are closed instead of
+        being returned to the pool.
+        """
+        if not self.pool:
+            await self.connect()
+        if not self.pool:
+            raise Exception("MySQL connection pool unavailable")
+
+        conn = await self.pool.acquire()
+        healthy = True
+        try:
+            idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+            if idle > settings.MYSQL_POOL_PING_INTERVAL:
+                try:
+                    await conn.ping(reconnect=True)
+                except Exception:
+                    self.metrics["reconnects"] += 1
+                    raise
+            yield conn
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            if healthy and not conn.closed:
+                self._last_used[id(conn)] = time.monotonic()
+            else:
+                self._last_used.pop(id(conn), None)
+                conn.close()
+            self.pool.release(conn)
+
+    async def fetch_all(
+        self,
+        sql: str,
+        params: Optional[Sequence[Any]] = None,
+        timeout: Optional[float] = None,
+        dict_rows: bool = True
+    ) -> List[Any]:
+        """
+        Execute a query and return all rows
+
+        Args:
+            sql: SQL statement (use %s placeholders for params)
+            params: Bound parameters
+            timeout: Per-query timeout in seconds (defaults to MYSQL_QUERY_TIMEOUT)
+            dict_rows: Return dict rows instead of tuples
+
+        Returns:
+            List of rows
+        """
+        timeout = timeout or self.query_timeout
+        start = time.perf_counter()
+        try:
+            async with self.acquire() as conn:
+                cursor_cls = aiomysql.DictCursor if dict_rows else aiomysql.Cursor
+                async with conn.cursor(cursor_cls) as cursor:
+                    await asyncio.wait_for(cursor.execute(sql, params), timeout)
+                    rows = await cursor.fetchall()
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            self.metrics["errors"] += 1
+            raise Exception(f"MySQL query exceeded {timeout}s timeout")
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+
+        self._record(time.perf_counter() - start, rows)
+        return list(rows)
+
+    async def fetch_columns(
+        self,
+        sql: str,
+        params: Optional[Sequence[Any]] = None,
+        timeout: Optional[float] = None,
+        chunk_size: int = 10000
+    ) -> Dict[str, np.ndarray]:
+        """
+        Stream a query through an unbuffered server-side cursor into typed column arrays
+
+        Rows are read in chunks and each chunk is transposed and decoded straight
+        into numpy arrays (numeric -> float64, DATETIME -> datetime64[us], other ->
+        object), so no per-row dicts are built and only one chunk of Python rows
+        is alive at a time.
+
+        Args:
+            sql: SQL statement (use %s placeholders for params)
+            params: Bound parameters
+            timeout: Timeout for the whole fetch in seconds (defaults to MYSQL_QUERY_TIMEOUT)
+            chunk_size: Rows per fetchmany() call
+
+        Returns:
+            Column name -> array
+        """
+        timeout = timeout or self.query_timeout
+        start = time.perf_counter()
+
+        async def stream() -> Dict[str, np.ndarray]:
+            async with self.acquire() as conn:
+                # Not "async with": closing an unbuffered cursor drains the rest of the
+                # result set; on errors acquire() closes the connection instead
+                cursor = await conn.cursor(aiomysql.SSCursor)
+                await cursor.execute(sql, params)
+                names = [d[0] for d in cursor.description]
+                dtypes = [_column_dtype(d[1]) for d in cursor.description]
+                chunks: List[List[np.ndarray]] = [[] for _ in names]
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for i, values in enumerate(zip(*rows)):
+                        chunks[i].append(_decode(values, dtypes[i]))
+                await cursor.close()
+            return {
+                name: np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+                for name, dtype, parts in zip(names, dtypes, chunks)
+            }
+
+        try:
+            columns = await asyncio.wait_for(stream(), timeout)
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            self.metrics["errors"] += 1
+            raise Exception(f"MySQL query exceeded {timeout}s timeout")
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+
+        row_count = len(next(iter(columns.values()))) if columns else 0
+        nbytes = sum(a.nbytes for a in columns.values())
+        self._record_counts(time.perf_counter() - start, row_count, nbytes)
+        return columns
+
+    def _record(self, latency: float, rows: Sequence[Any]):
+        """Record statement metrics"""
+        self._record_counts(latency, len(rows), self._estimate_bytes(rows))
+
+    def _record_counts(self, latency: float, row_count: int, nbytes: int):
+        self.metrics["statements"] += 1
+        self.metrics["rows"] += row_count
+        self.metrics["bytes"] += nbytes
+        self.metrics["total_latency"] += latency
+        self.metrics["max_latency"] = max(self.metrics["max_latency"], latency)
+        self._latencies.append(latency)
+        if latency > settings.MYSQL_SLOW_QUERY_SECONDS:
+            logger.warning(f"⚠️  Slow MySQL query: {latency:.2f}s, {row_count} rows")
+
+    @staticmethod
+    def _estimate_bytes(rows: Sequence[Any]) -> int:
+        """Approximate wire size of a result set"""
+        total = 0
+        for row in rows:
+            values = row.values() if isinstance(row, dict) else row
+            for value in values:
+                if value is None:
+                    continue
+                if isinstance(value, (str, bytes)):
+                    total += len(value)
+                else:
+                    total += 8
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool and statement statistics"""
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        statements = self.metrics["statements"]
+        return {
+            "pool": {
+                "connected": self.pool is not None,
+                "size": self.pool.size if self.pool else 0,
+                "free": self.pool.freesize if self.pool else 0,
+                "min": settings.MYSQL_POOL_MIN_SIZE,
+                "max": settings.MYSQL_POOL_MAX_SIZE,
+                "read_only": self.read_only,
+            },
+            "statements": {
+                **self.metrics,
+                "avg_latency": round(self.metrics["total_latency"] / statements, 4) if statements else None,
+                "p50_latency": pct(0.5),
+                "p95_latency": pct(0.95),
+            },
+        }
+
+    async def health(self) -> bool:
+        """Check that a pooled connection can run a trivial query"""
+        try:
+            await self.fetch_all("SELECT 1", timeout=5, dict_rows=False)
+            return True
+        except Exception as e:
+            logger.warning(f"MySQL health check failed: {e}")
+            return False
+
+
+# Global instance
+mysql_manager = MySQLManager()
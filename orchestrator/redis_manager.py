@@ -362,6 +362,18 @@ class RedisManager:
             logger.error(f"Failed to set cache for key {key}: {e}")
             return False
 
+    async def delete_cache(self, key: str) -> bool:
+        """Delete a cached value"""
+        if not self.client:
+            await self.connect()
+
+        try:
+            await self.client.delete(key)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete cache for key {key}: {e}")
+            return False
+
     async def add_conversation_to_user(self, user_id: str, conversation_id: str, title: str):
         """Add conversation to user's list"""
         if not self.client:
@@ -0,0 +1,468 @@
+"""
+Analytics Engine Service
+In-process, vectorised answers to common time-series statistics questions.
+
+Mean/min/max/percentiles, latest value, counts, resampling, rolling windows,
+threshold exceedance and cross-sensor correlation are computed with NumPy
+group-bys on the fetched SeriesFrame and returned as structured results, so
+these questions no longer round-trip through LLM code generation and the
+code executor. Anything the parser does not recognise (plots, forecasts,
+free-form analyses) returns None and keeps going through code generation.
+
+Long windows arrive bucketed (value = average plus min/max/count/last per
+bucket, see resolution_planner); statistics are count-weighted over
+buckets, and those that need individual readings (percentiles, threshold
+durations) are flagged approximate.
+"""
+import sys
+sys.path.append('/app')
+
+import re
+import time
+import numpy as np
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame, TIMESTAMP_DTYPE
+from orchestrator.services.resolution_planner import BUCKET_WIDTHS
+
+logger = get_logger(__name__)
+
+UNIT_SECONDS = {"minute": 60, "min": 60, "hour": 3600, "hr": 3600, "day": 86400, "week": 604800}
+
+# Questions that need code generation (charts, models) rather than a statistic
+NOVEL_RE = re.compile(
+    r"\b(plot|chart|graph|visuali[sz]e|draw|histogram|heatmap|forecast|predict|anomal\w*|outlier\w*|"
+    r"regression|cluster\w*|fft|spectr\w*|decompos\w*|seasonal\w*)\b"
+)
+CORRELATION_RE = re.compile(r"\b(correlat\w*|relationship between)\b")
+ROLLING_RE = re.compile(
+    r"\b(rolling|moving|running)\s+(?:average|mean|avg)\b"
+    r"(?:\s+(?:over|of|across)\s+(?:the\s+|a\s+)?(?:(\d+)\s*-?\s*)?(minute|min|hour|hr|day|week)s?\b)?"
+)
+ROLLING_OTHER_RE = re.compile(r"\b(rolling|moving|running)\s+(max|maximum|min|minimum|sum|median|std)\b")
+THRESHOLD_RE = re.compile(
+    r"\b(above|over|exceed(?:s|ed|ing)?|greater than|higher than|more than|"
+    r"below|under|less than|lower than)\s+(-?\d+(?:\.\d+)?)"
+    # The whole number, so "over 24 hours" cannot backtrack to a threshold of 2 (a trailing full stop is fine)
+    r"(?!\.?\d)"
+    r"(?!\s*(?:minute|min|hour|hr|day|week|month|year|h|d|m|w)s?\b)"
+)
+PERCENTILE_RE = re.compile(r"\b(\d{1,2}(?:\.\d+)?)(?:st|nd|rd|th)?[\s-]*percentile\b|\bp(\d{1,2})\b")
+RESAMPLE_RE = re.compile(
+    r"\b(hourly|daily|weekly|"
+    r"(?:per|each|every|by)\s+(?:(\d+)\s*)?(minute|min|hour|hr|day|week)s?)\b"
+)
+STAT_WORDS = {
+    "mean": re.compile(r"\b(average|mean|avg)\b"),
+    "max": re.compile(r"\b(maximum|max|peak|highest)\b"),
+    "min": re.compile(r"\b(minimum|min|lowest)\b"),
+    "latest": re.compile(r"\b(current|latest|now|recent|last reading|most recent)\b"),
+    "count": re.compile(r"\b(count|how many readings|number of readings)\b"),
+}
+SUMMARY_RE = re.compile(r"\b(summary|summari[sz]e|statistics|stats|describe)\b")
+BELOW_WORDS = ("below", "under", "less than", "lower than")
+
+
+@dataclass
+class AnalyticsRequest:
+    """A recognised statistics question"""
+    operation: str
+    # Statistics the answer should focus on (mean/min/max/latest/count)
+    statistics: Tuple[str, ...] = ()
+    percentiles: Tuple[float, ...] = ()
+    bucket_seconds: Optional[int] = None
+    window_seconds: Optional[int] = None
+    threshold: Optional[float] = None
+    direction: str = "above"
+
+
+@dataclass
+class AnalyticsResult:
+    """Structured answer: one row per sensor (per bucket for resampling, per pair for correlation)"""
+    operation: str
+    rows: List[Dict[str, Any]]
+    params: Dict[str, Any] = field(default_factory=dict)
+    # Per-point output (rolling windows)
+    series: List[Dict[str, Any]] = field(default_factory=list)
+    approximate: bool = False
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "params": self.params,
+            "rows": self.rows,
+            "series": self.series,
+            "approximate": self.approximate,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+        }
+
+
+def _seconds(count: Optional[str], unit: str) -> int:
+    return int(count or 1) * UNIT_SECONDS[unit]
+
+
+def zone_offsets(seconds: np.ndarray, from_zone: str, to_zone: str) -> np.ndarray:
+    """
+    Seconds to add to naive epoch seconds in one zone to get wall-clock seconds in another
+
+    Offsets are resolved once per distinct hour, which covers DST changes.
+    """
+    if from_zone == to_zone or not len(seconds):
+        return np.zeros(len(seconds), dtype=np.int64)
+    source, target = ZoneInfo(from_zone), ZoneInfo(to_zone)
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = []
+    for hour in hours.tolist():
+        naive = datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)
+        wall = naive.replace(tzinfo=source).astimezone(target).replace(tzinfo=None)
+        offsets.append(int((wall - naive).total_seconds()))
+    return np.asarray(offsets, dtype=np.int64)[inverse]
+
+
+def parse_request(user_query: str, sensor_count: int = 1) -> Optional[AnalyticsRequest]:
+    """
+    Recognise a statistics question the engine can answer
+
+    Returns:
+        AnalyticsRequest, or None when the question needs code generation
+    """
+    q = (user_query or "").lower()
+    if NOVEL_RE.search(q):
+        return None
+
+    if CORRELATION_RE.search(q):
+        return AnalyticsRequest("correlation") if sensor_count >= 2 else None
+
+    if ROLLING_OTHER_RE.search(q):
+        return None
+    rolling = ROLLING_RE.search(q)
+    if rolling:
+        window = _seconds(rolling.group(2), rolling.group(3)) if rolling.group(3) else 3600
+        return AnalyticsRequest("rolling", statistics=("mean",), window_seconds=window)
+
+    threshold = THRESHOLD_RE.search(q)
+    if threshold:
+        direction = "below" if threshold.group(1) in BELOW_WORDS else "above"
+        return AnalyticsRequest("threshold", threshold=float(threshold.group(2)), direction=direction)
+
+    statistics = tuple(name for name, pattern in STAT_WORDS.items() if pattern.search(q))
+
+    resample = RESAMPLE_RE.search(q)
+    if resample:
+        word = resample.group(1)
+        named = {"hourly": 3600, "daily": 86400, "weekly": 604800}
+        bucket = named.get(word) or _seconds(resample.group(2), resample.group(3))
+        stats = tuple(s for s in statistics if s in ("mean", "min", "max", "count")) or ("mean",)
+        return AnalyticsRequest("resample", statistics=stats, bucket_seconds=bucket)
+
+    percentiles = []
+    for match in PERCENTILE_RE.finditer(q):
+        percentiles.append(float(match.group(1) or match.group(2)))
+    if re.search(r"\bmedian\b", q):
+        percentiles.append(50.0)
+    if re.search(r"\b(quartiles?|iqr|interquartile)\b", q):
+        percentiles.extend([25.0, 50.0, 75.0])
+    if percentiles:
+        return AnalyticsRequest("percentile", statistics=statistics, percentiles=tuple(sorted(set(percentiles))))
+
+    if SUMMARY_RE.search(q):
+        return AnalyticsRequest("summary", statistics=("mean", "min", "max", "count"))
+    if statistics:
+        return AnalyticsRequest("summary", statistics=statistics)
+    return None
+
+
+class AnalyticsEngine:
+    """Vectorised statistics over long-format (timestamp, uuid, value) frames"""
+
+    # ==================== Preparation ====================
+    # prepare/segments/reduce are also used by chart_specs and downsampling
+
+    @staticmethod
+    def prepare(frame: SeriesFrame) -> Dict[str, Any]:
+        """
+        Clean, typed columns sorted by (uuid, timestamp)
+
+        Raw readings are treated as one-reading buckets (min = max = last =
+        value, count = 1) so every statistic has a single code path.
+        """
+        cols = frame.columns
+        value = cols["value"].astype(np.float64)
+        ts = cols["timestamp"].astype(TIMESTAMP_DTYPE)
+        keep = ~np.isnan(value) & ~np.isnat(ts)
+        bucketed = "count" in cols
+
+        def column(name: str) -> np.ndarray:
+            source = cols.get(name)
+            if source is None:
+                return value.copy()
+            source = source.astype(np.float64)
+            return np.where(np.isnan(source), value, source)
+
+        count = np.nan_to_num(cols["count"].astype(np.float64), nan=1.0) if bucketed else np.ones(len(value))
+        names, codes = np.unique(cols["uuid"][keep].astype(str), return_inverse=True)
+        prepared = {
+            "ts": ts[keep].astype(np.int64),
+            "value": value[keep],
+            "min": column("min")[keep],
+            "max": column("max")[keep],
+            "last": column("last")[keep],
+            "count": count[keep],
+        }
+        order = np.lexsort((prepared["ts"], codes))
+        prepared = {name: values[order] for name, values in prepared.items()}
+        prepared["code"] = codes[order]
+        prepared["names"] = names
+        prepared["bucketed"] = bucketed
+        return prepared
+
+    @staticmethod
+    def segments(*keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Start and end (exclusive) indices of runs of equal keys in sorted arrays"""
+        n = len(keys[0])
+        if not n:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        change = np.zeros(n, dtype=bool)
+        change[0] = True
+        for key in keys:
+            change[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(change)
+        return starts, np.r_[starts[1:], n]
+
+    @staticmethod
+    def _iso(us: np.ndarray) -> List[str]:
+        return np.datetime_as_string(us.astype(TIMESTAMP_DTYPE), unit="s").tolist()
+
+    def reduce(self, data: Dict[str, Any], starts: np.ndarray, ends: np.ndarray) -> Dict[str, np.ndarray]:
+        """Count-weighted mean, min, max, total count and latest value per segment"""
+        weighted = np.add.reduceat(data["value"] * data["count"], starts)
+        counts = np.add.reduceat(data["count"], starts)
+        return {
+            "mean": weighted / counts,
+            "min": np.minimum.reduceat(data["min"], starts),
+            "max": np.maximum.reduceat(data["max"], starts),
+            "count": counts,
+            "latest": data["last"][ends - 1],
+            "first_at": data["ts"][starts],
+            "latest_at": data["ts"][ends - 1],
+        }
+
+    # ==================== Operations ====================
+
+    def summary(self, data: Dict[str, Any], percentiles: Tuple[float, ...] = ()) -> List[Dict[str, Any]]:
+        starts, ends = self.segments(data["code"])
+        if not len(starts):
+            return []
+        stats = self.reduce(data, starts, ends)
+        first_at, latest_at = self._iso(stats["first_at"]), self._iso(stats["latest_at"])
+        rows = []
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            peak = start + int(np.argmax(data["max"][start:end]))
+            trough = start + int(np.argmin(data["min"][start:end]))
+            row = {
+                "uuid": str(data["names"][data["code"][start]]),
+                "mean": float(stats["mean"][i]),
+                "min": float(stats["min"][i]),
+                "min_at": self._iso(data["ts"][trough:trough + 1])[0],
+                "max": float(stats["max"][i]),
+                "max_at": self._iso(data["ts"][peak:peak + 1])[0],
+                "count": int(stats["count"][i]),
+                "latest": float(stats["latest"][i]),
+                "latest_at": latest_at[i],
+                "from": first_at[i],
+                "to": latest_at[i],
+            }
+            if percentiles:
+                # Bucketed input: percentiles of bucket averages (weighted by readings)
+                values = data["value"][start:end]
+                weights = data["count"][start:end]
+                order = np.argsort(values, kind="stable")
+                cumulative = np.cumsum(weights[order])
+                for p in percentiles:
+                    rank = np.searchsorted(cumulative, p / 100.0 * cumulative[-1], side="left")
+                    row[f"p{p:g}"] = float(values[order][min(rank, len(values) - 1)]) \
+                        if data["bucketed"] else float(np.percentile(values, p))
+            rows.append(row)
+        return rows
+
+    def resample(self, data: Dict[str, Any], bucket_seconds: int) -> List[Dict[str, Any]]:
+        """
+        Bucket statistics per sensor; buckets follow the local calendar (TIME_ZONE),
+        so a daily bucket is a local day during BST too. 'timestamp' is the bucket
+        start in the data's own zone (MYSQL_TIMEZONE), 'local_start' in TIME_ZONE.
+        """
+        seconds = data["ts"] // 1_000_000
+        local = seconds + zone_offsets(seconds, settings.MYSQL_TIMEZONE, settings.TIME_ZONE)
+        local_buckets = local - local % bucket_seconds
+        # Already sorted by (uuid, timestamp), so buckets are contiguous per uuid
+        starts, ends = self.segments(data["code"], local_buckets)
+        if not len(starts):
+            return []
+        stats = self.reduce(data, starts, ends)
+        local_starts = local_buckets[starts]
+        buckets = local_starts + zone_offsets(local_starts, settings.TIME_ZONE, settings.MYSQL_TIMEZONE)
+        timestamps = self._iso(buckets * 1_000_000)
+        local_timestamps = self._iso(local_starts * 1_000_000)
+        names = data["names"][data["code"][starts]]
+        return [
+            {
+                "uuid": str(names[i]),
+                "timestamp": timestamps[i],
+                "local_start": local_timestamps[i],
+                "mean": float(stats["mean"][i]),
+                "min": float(stats["min"][i]),
+                "max": float(stats["max"][i]),
+                "count": int(stats["count"][i]),
+            }
+            for i in range(len(starts))
+        ]
+
+    def rolling(self, data: Dict[str, Any], window_seconds: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Trailing time-window mean (window_seconds ending at each reading), per sensor"""
+        window = window_seconds * 1_000_000
+        rows, series = [], []
+        starts, ends = self.segments(data["code"])
+        for start, end in zip(starts, ends):
+            ts = data["ts"][start:end]
+            weights = data["count"][start:end]
+            sums = np.r_[0.0, np.cumsum(data["value"][start:end] * weights)]
+            counts = np.r_[0.0, np.cumsum(weights)]
+            lower = np.searchsorted(ts, ts - window, side="right")
+            idx = np.arange(1, len(ts) + 1)
+            means = (sums[idx] - sums[lower]) / (counts[idx] - counts[lower])
+            uuid = str(data["names"][data["code"][start]])
+            timestamps = self._iso(ts)
+            peak, trough = int(np.argmax(means)), int(np.argmin(means))
+            rows.append({
+                "uuid": uuid,
+                "latest": float(means[-1]),
+                "latest_at": timestamps[-1],
+                "max": float(means[peak]),
+                "max_at": timestamps[peak],
+                "min": float(means[trough]),
+                "min_at": timestamps[trough],
+            })
+            series.extend({"uuid": uuid, "timestamp": t, "value": float(v)} for t, v in zip(timestamps, means))
+        return rows, series
+
+    def threshold(self, data: Dict[str, Any], threshold: float, direction: str) -> List[Dict[str, Any]]:
+        """Readings beyond a threshold per sensor (bucketed input counts whole buckets)"""
+        bucketed = data["bucketed"]
+        if direction == "below":
+            hit = data["min"] < threshold
+        else:
+            hit = data["max"] > threshold
+        rows = []
+        starts, ends = self.segments(data["code"])
+        for start, end in zip(starts, ends):
+            sensor_hit = hit[start:end]
+            ts = data["ts"][start:end]
+            n_hit = int(sensor_hit.sum())
+            interval = float(np.median(np.diff(ts))) / 1e6 if len(ts) > 1 else 0.0
+            extreme = data["min"][start:end] if direction == "below" else data["max"][start:end]
+            hit_times = self._iso(ts[sensor_hit]) if n_hit else []
+            rows.append({
+                "uuid": str(data["names"][data["code"][start]]),
+                "threshold": threshold,
+                "direction": direction,
+                # Raw: readings; bucketed: buckets containing at least one such reading
+                "exceedances": n_hit,
+                "total": int(end - start),
+                "share": n_hit / float(end - start),
+                "duration_seconds": round(n_hit * interval),
+                "first_at": hit_times[0] if hit_times else None,
+                "last_at": hit_times[-1] if hit_times else None,
+                "extreme": float(extreme.min() if direction == "below" else extreme.max()),
+                "unit": "buckets" if bucketed else "readings",
+            })
+        return rows
+
+    def correlation(self, data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """Pairwise Pearson correlation on a shared time grid"""
+        seconds = data["ts"] // 1_000_000
+        grid = 60
+        if len(seconds) > 1:
+            steps = np.diff(seconds)[np.diff(data["code"]) == 0]
+            step = float(np.median(steps)) if len(steps) else 60.0
+            grid = next((w for w in BUCKET_WIDTHS if w >= step), BUCKET_WIDTHS[-1])
+        buckets = seconds - seconds % grid
+        starts, ends = self.segments(data["code"], buckets)
+        if not len(starts):
+            return [], grid
+        means = self.reduce(data, starts, ends)["mean"]
+        times, time_index = np.unique(buckets[starts], return_inverse=True)
+        matrix = np.full((len(times), len(data["names"])), np.nan)
+        matrix[time_index, data["code"][starts]] = means
+
+        rows = []
+        for a in range(matrix.shape[1]):
+            for b in range(a + 1, matrix.shape[1]):
+                both = ~np.isnan(matrix[:, a]) & ~np.isnan(matrix[:, b])
+                n = int(both.sum())
+                r = None
+                if n >= 3 and np.std(matrix[both, a]) > 0 and np.std(matrix[both, b]) > 0:
+                    r = float(np.corrcoef(matrix[both, a], matrix[both, b])[0, 1])
+                rows.append({"uuid_a": str(data["names"][a]), "uuid_b": str(data["names"][b]), "r": r, "n": n})
+        rows.sort(key=lambda row: -abs(row["r"]) if row["r"] is not None else 1.0)
+        return rows, grid
+
+    # ==================== Entry point ====================
+
+    def run(self, frame: SeriesFrame, request: AnalyticsRequest) -> AnalyticsResult:
+        """Compute a recognised request over a frame"""
+        start = time.perf_counter()
+        data = self.prepare(frame)
+        bucketed = data["bucketed"]
+        params: Dict[str, Any] = {"statistics": list(request.statistics)}
+        series: List[Dict[str, Any]] = []
+        approximate = False
+
+        if request.operation == "correlation":
+            rows, grid = self.correlation(data)
+            params["grid_seconds"] = grid
+        elif request.operation == "rolling":
+            rows, series = self.rolling(data, request.window_seconds)
+            params["window_seconds"] = request.window_seconds
+        elif request.operation == "threshold":
+            rows = self.threshold(data, request.threshold, request.direction)
+            params.update({"threshold": request.threshold, "direction": request.direction})
+            approximate = bucketed
+        elif request.operation == "resample":
+            rows = self.resample(data, request.bucket_seconds)
+            params["bucket_seconds"] = request.bucket_seconds
+        else:
+            rows = self.summary(data, request.percentiles)
+            params["percentiles"] = list(request.percentiles)
+            approximate = bucketed and bool(request.percentiles)
+
+        result = AnalyticsResult(
+            operation=request.operation,
+            rows=rows,
+            params=params,
+            series=series,
+            approximate=approximate,
+            elapsed_ms=(time.perf_counter() - start) * 1000
+        )
+        logger.info(
+            f"⚡ Analytics engine: {request.operation} over {len(frame)} rows, "
+            f"{len(data['names'])} sensor(s) in {result.elapsed_ms:.1f}ms"
+        )
+        return result
+
+    def answer(self, user_query: str, frame: SeriesFrame) -> Optional[AnalyticsResult]:
+        """Answer a question natively, or None when it needs code generation"""
+        if not len(frame):
+            return None
+        request = parse_request(user_query, sensor_count=len(frame.uuids))
+        if request is None:
+            return None
+        return self.run(frame, request)
+
+
+# Global instance
+analytics_engine = AnalyticsEngine()
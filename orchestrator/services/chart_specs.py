@@ -0,0 +1,360 @@
+"""
+Chart Spec Engine
+Declarative Plotly figures built directly from the fetched SeriesFrame.
+
+Visualization turns used to ask the LLM for a chart type, then for
+matplotlib code, run that code in the executor and ask the LLM again for a
+description. Common intents are now mapped to a Plotly figure (JSON
+data/layout) computed with NumPy on the columnar data:
+
+- line: time series of one sensor (min/max band for bucketed or downsampled data)
+- overlay: time series of several sensors on shared axes
+- bar: one aggregate (mean/max/min/latest) per sensor
+- heatmap: mean by local hour of day x weekday, one sensor at a time
+- histogram: value distribution, shared bins across sensors
+
+The spec is stored in the media store and rendered by the browser
+(/charts/{hash}); the description is generated from the same statistics.
+A PNG of the figure is optional (CHART_PNG_RENDER) and rendered by the
+code executor in the background, after the response has been sent.
+Anything else (scatter, pie, correlation matrices, forecasts) returns None
+and keeps going through code generation.
+"""
+import sys
+sys.path.append('/app')
+
+import re
+import json
+import asyncio
+import httpx
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.analytics_engine import analytics_engine, zone_offsets, STAT_WORDS
+from orchestrator.services.media_store import media_store
+from orchestrator.services.downsampling import downsampler
+
+logger = get_logger(__name__)
+
+CODE_EXECUTOR_URL = f"http://{settings.CODE_EXECUTOR_HOST}:{settings.CODE_EXECUTOR_PORT}"
+SPEC_CONTENT_TYPE = "application/vnd.plotly.v1+json"
+
+# Charts the engine does not build (they keep going through code generation)
+UNSUPPORTED_RE = re.compile(
+    r"\b(scatter|pie|proportion|percentage|correlat\w*|matrix|box\s*plot|violin|forecast|predict\w*|"
+    r"regression|anomal\w*|outlier\w*|cluster\w*|fft|spectr\w*|decompos\w*|3d)\b"
+)
+HEATMAP_RE = re.compile(r"\b(heat\s*map|hour of (?:the )?day|by hour and (?:week)?day|weekly pattern|daily pattern)\b")
+HISTOGRAM_RE = re.compile(r"\b(histogram|distribution|spread of)\b")
+BAR_RE = re.compile(r"\b(bar|bars|compare|comparison|versus|vs|rank\w*)\b")
+LINE_RE = re.compile(r"\b(line|trend\w*|over time|time\s*series|history|plot|chart|graph|visuali[sz]e|draw|show)\b")
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+STAT_TITLES = {"mean": "Average", "max": "Maximum", "min": "Minimum", "latest": "Latest"}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="{plotly_js}"></script>
+<style>html, body, #chart {{ margin: 0; width: 100%; height: 100%; }}</style>
+</head>
+<body>
+<div id="chart"></div>
+<script>
+var spec = {spec};
+Plotly.newPlot("chart", spec.data, spec.layout, {{responsive: true, displaylogo: false}});
+</script>
+</body>
+</html>
+"""
+
+
+@dataclass
+class ChartSpec:
+    """A Plotly figure and the text describing it"""
+    kind: str
+    spec: Dict[str, Any]
+    description: str
+    points: int
+
+
+def detect_kind(user_query: str, sensor_count: int = 1) -> Optional[str]:
+    """
+    Chart kind for a visualization request
+
+    Returns:
+        line/overlay/bar/heatmap/histogram, or None when the chart needs code generation
+    """
+    q = (user_query or "").lower()
+    if UNSUPPORTED_RE.search(q):
+        return None
+    if HEATMAP_RE.search(q):
+        return "heatmap"
+    if HISTOGRAM_RE.search(q):
+        return "histogram"
+    if BAR_RE.search(q):
+        return "bar"
+    if LINE_RE.search(q):
+        return "overlay" if sensor_count > 1 else "line"
+    return None
+
+
+class ChartSpecEngine:
+    """Builds, stores and (optionally) rasterises declarative chart specs"""
+
+    def __init__(self):
+        self.metrics = {"built": 0, "fallback": 0, "png_rendered": 0, "png_failed": 0}
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHART_SPECS_ENABLED
+
+    # ==================== Building ====================
+
+    def build(
+        self,
+        user_query: str,
+        frame: SeriesFrame,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None
+    ) -> Optional[ChartSpec]:
+        """
+        Build the chart a request asks for
+
+        Args:
+            user_query: User's visualization request
+            frame: Readings to plot (raw or bucketed)
+            sensor_metadata: UUID -> {"label": ...} for trace names
+
+        Returns:
+            ChartSpec, or None when the intent or data is not supported
+        """
+        if not self.enabled:
+            return None
+        data = analytics_engine.prepare(frame)
+        kind = detect_kind(user_query, len(data["names"]))
+        if kind is None or not len(data["value"]):
+            self.metrics["fallback"] += 1
+            return None
+
+        labels = self._labels(data["names"], sensor_metadata)
+        if kind in ("line", "overlay"):
+            chart = self._line(data, labels, kind)
+        elif kind == "bar":
+            stat = next((s for s in STAT_WORDS if s != "count" and STAT_WORDS[s].search(user_query.lower())), "mean")
+            chart = self._bar(data, labels, stat)
+        elif kind == "heatmap":
+            chart = self._heatmap(data, labels)
+        else:
+            chart = self._histogram(data, labels)
+
+        chart.spec["layout"].setdefault("template", "plotly_white")
+        chart.spec["layout"].setdefault("margin", {"l": 60, "r": 20, "t": 60, "b": 50})
+        self.metrics["built"] += 1
+        logger.info(f"📈 Built {kind} chart spec ({chart.points} points, {len(labels)} sensors)")
+        return chart
+
+    @staticmethod
+    def _labels(names: np.ndarray, sensor_metadata: Optional[Dict[str, Dict[str, str]]]) -> List[str]:
+        labels = []
+        for name in names.tolist():
+            meta = (sensor_metadata or {}).get(name) or {}
+            label = meta.get("label")
+            labels.append(label if label and label != "Unknown Sensor" else str(name)[:12])
+        return labels
+
+    @staticmethod
+    def _fmt(value: float) -> str:
+        return f"{value:.4g}"
+
+    def _line(self, data: Dict[str, Any], labels: List[str], kind: str) -> ChartSpec:
+        # Statistics from every reading, traces from the downsampled series
+        starts, ends = analytics_engine.segments(data["code"])
+        stats = analytics_engine.reduce(data, starts, ends)
+        plot = downsampler.reduce(data)
+        traces, notes = [], []
+        for i, (start, end) in enumerate(zip(*analytics_engine.segments(plot["code"]))):
+            x = analytics_engine._iso(plot["ts"][start:end])
+            if plot["bucketed"] and kind == "line":
+                # Envelope of the readings each point stands for
+                traces.append({"type": "scatter", "mode": "lines", "x": x, "y": plot["max"][start:end].tolist(),
+                               "line": {"width": 0}, "showlegend": False, "hoverinfo": "skip"})
+                traces.append({"type": "scatter", "mode": "lines", "x": x, "y": plot["min"][start:end].tolist(),
+                               "line": {"width": 0}, "fill": "tonexty", "fillcolor": "rgba(31,119,180,0.2)",
+                               "name": "min-max range", "hoverinfo": "skip"})
+            traces.append({"type": "scatter", "mode": "lines", "name": labels[i], "x": x,
+                           "y": plot["value"][start:end].tolist()})
+            notes.append(f"{labels[i]} averaged {self._fmt(stats['mean'][i])} "
+                         f"(range {self._fmt(stats['min'][i])} to {self._fmt(stats['max'][i])})")
+
+        start_at, end_at = analytics_engine._iso(np.array([data["ts"].min(), data["ts"].max()]))
+        title = f"{labels[0]} over time" if kind == "line" else "Sensor readings over time"
+        spec = {
+            "data": traces,
+            "layout": {
+                "title": {"text": title},
+                "xaxis": {"title": {"text": "Time"}, "type": "date"},
+                "yaxis": {"title": {"text": "Value"}},
+                "hovermode": "x unified",
+            },
+        }
+        what = "Line chart" if kind == "line" else f"Overlay of {len(labels)} sensors"
+        description = f"{what} from {start_at} to {end_at}: " + "; ".join(notes) + "."
+        return ChartSpec(kind, spec, description, len(plot["value"]))
+
+    def _bar(self, data: Dict[str, Any], labels: List[str], stat: str) -> ChartSpec:
+        starts, ends = analytics_engine.segments(data["code"])
+        values = analytics_engine.reduce(data, starts, ends)[stat].tolist()
+        order = np.argsort(values)[::-1]
+        title = f"{STAT_TITLES[stat]} value per sensor"
+        spec = {
+            "data": [{"type": "bar", "x": [labels[i] for i in order], "y": [values[i] for i in order],
+                      "text": [self._fmt(values[i]) for i in order], "textposition": "auto"}],
+            "layout": {
+                "title": {"text": title},
+                "xaxis": {"title": {"text": "Sensor"}},
+                "yaxis": {"title": {"text": STAT_TITLES[stat]}},
+            },
+        }
+        top, bottom = order[0], order[-1]
+        description = f"Bar chart of the {STAT_TITLES[stat].lower()} value per sensor: highest {labels[top]} " \
+                      f"({self._fmt(values[top])})"
+        if len(order) > 1:
+            description += f", lowest {labels[bottom]} ({self._fmt(values[bottom])})"
+        return ChartSpec("bar", spec, description + ".", len(values))
+
+    def _heatmap(self, data: Dict[str, Any], labels: List[str]) -> ChartSpec:
+        seconds = data["ts"] // 1_000_000
+        # Bin by the building's wall clock, not the database's zone
+        seconds = seconds + zone_offsets(seconds, settings.MYSQL_TIMEZONE, settings.TIME_ZONE)
+        hours = (seconds // 3600) % 24
+        # 1970-01-01 was a Thursday (weekday 3)
+        weekdays = (seconds // 86400 + 3) % 7
+        cell = data["code"] * 168 + weekdays * 24 + hours
+        size = len(labels) * 168
+        weighted = np.bincount(cell, weights=data["value"] * data["count"], minlength=size)
+        counts = np.bincount(cell, weights=data["count"], minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (weighted / counts).reshape(len(labels), 7, 24)
+
+        traces, buttons, notes = [], [], []
+        for i, label in enumerate(labels):
+            grid = means[i]
+            z = [[None if np.isnan(v) else float(v) for v in row] for row in grid]
+            traces.append({"type": "heatmap", "x": list(range(24)), "y": WEEKDAYS, "z": z, "name": label,
+                           "colorscale": "Viridis", "visible": i == 0, "hoverongaps": False})
+            buttons.append({"label": label, "method": "update",
+                            "args": [{"visible": [j == i for j in range(len(labels))]},
+                                     {"title": {"text": f"{label} by hour of day and weekday"}}]})
+            if not np.all(np.isnan(grid)):
+                day, hour = np.unravel_index(np.nanargmax(grid), grid.shape)
+                notes.append(f"{label} peaks on {WEEKDAYS[day]} around {hour:02d}:00 ({self._fmt(grid[day, hour])})")
+
+        layout = {
+            "title": {"text": f"{labels[0]} by hour of day and weekday"},
+            "xaxis": {"title": {"text": "Hour of day"}, "dtick": 1},
+            "yaxis": {"title": {"text": "Weekday"}, "autorange": "reversed"},
+        }
+        if len(labels) > 1:
+            layout["updatemenus"] = [{"type": "dropdown", "buttons": buttons, "x": 1.0, "y": 1.15}]
+        description = "Heatmap of the average value by hour of day and weekday"
+        if notes:
+            description += ": " + "; ".join(notes)
+        return ChartSpec("heatmap", {"data": traces, "layout": layout}, description + ".", len(data["value"]))
+
+    def _histogram(self, data: Dict[str, Any], labels: List[str]) -> ChartSpec:
+        # Bins are computed here so the spec carries counts, not every reading
+        edges = np.histogram_bin_edges(data["value"], bins=min(50, max(10, int(np.sqrt(len(data["value"]))))))
+        centers = ((edges[:-1] + edges[1:]) / 2).tolist()
+        starts, ends = analytics_engine.segments(data["code"])
+        traces, notes = [], []
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            counts, _ = np.histogram(data["value"][start:end], bins=edges, weights=data["count"][start:end])
+            traces.append({"type": "bar", "name": labels[i], "x": centers, "y": counts.tolist(),
+                           "width": float(edges[1] - edges[0]), "opacity": 0.6 if len(labels) > 1 else 1.0})
+            mode = centers[int(np.argmax(counts))]
+            notes.append(f"{labels[i]} is most often around {self._fmt(mode)}")
+        spec = {
+            "data": traces,
+            "layout": {
+                "title": {"text": "Distribution of values"},
+                "barmode": "overlay",
+                "xaxis": {"title": {"text": "Value"}},
+                "yaxis": {"title": {"text": "Readings"}},
+            },
+        }
+        description = "Histogram of the readings"
+        if data["bucketed"]:
+            description += " (bucket averages, weighted by reading count)"
+        description += ": " + "; ".join(notes) + "."
+        return ChartSpec("histogram", spec, description, len(data["value"]))
+
+    # ==================== Publishing ====================
+
+    def publish(self, chart: ChartSpec) -> Dict[str, Any]:
+        """
+        Store a spec in the media store and return its media reference
+
+        The reference uses the 'chart' media type, which the frontend shows
+        in an iframe (/charts/{hash} renders the spec with plotly.js).
+        """
+        payload = json.dumps(chart.spec, separators=(",", ":"), allow_nan=False).encode("utf-8")
+        digest = media_store.put(payload, SPEC_CONTENT_TYPE)
+        base = settings.STATIC_BASE_URL.rstrip('/')
+        item = {
+            "type": "chart",
+            "format": "plotly",
+            "chart_type": chart.kind,
+            "url": f"{base}/charts/{digest}",
+            "spec_url": media_store.url(digest),
+            "filename": f"chart_{digest[:12]}.json",
+            "hash": digest,
+        }
+        if settings.CHART_PNG_RENDER:
+            item["png_url"] = media_store.url(digest, "png")
+            task = asyncio.create_task(self.render_png(digest, payload.decode("utf-8")))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return item
+
+    @staticmethod
+    def page(spec_json: str) -> str:
+        """Standalone HTML page rendering a stored spec"""
+        return PAGE_TEMPLATE.format(plotly_js=settings.CHART_PLOTLY_JS_URL, spec=spec_json.replace("</", "<\\/"))
+
+    async def render_png(self, digest: str, spec_json: str):
+        """Rasterise a spec in the code executor and store it as the 'png' variant (background)"""
+        filename = f"chart_{digest[:16]}.png"
+        code = (
+            "import plotly.io as pio\n"
+            "fig = pio.from_json(spec_json)\n"
+            f"fig.write_image('/app/outputs/{filename}', width=1000, height=500)\n"
+            f"print('PLOT_GENERATED: {filename}')\n"
+        )
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await client.post(
+                    f"{CODE_EXECUTOR_URL}/execute",
+                    json={"code": code, "context": {"spec_json": spec_json}}
+                )
+                response.raise_for_status()
+                result = response.json()
+            if not result.get("success"):
+                raise RuntimeError(result.get("error") or "execution failed")
+            if not media_store.put_output_variant(digest, "png", filename):
+                raise RuntimeError(f"{filename} was not written")
+            self.metrics["png_rendered"] += 1
+        except Exception as e:
+            self.metrics["png_failed"] += 1
+            logger.warning(f"PNG rendering of chart {digest[:12]} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "png_render": settings.CHART_PNG_RENDER, **self.metrics}
+
+
+# Global instance
+chart_spec_engine = ChartSpecEngine()
@@ -0,0 +1,291 @@
+"""
+Class Index Service
+Pre-warmed class -> instance index for the building ontology.
+
+Built from a single bulk SPARQL query over rdf:type/rdfs:subClassOf*, so a
+lookup for brick:Temperature_Sensor also returns instances typed with any
+Brick subclass. The index is shared across workers through a Redis snapshot
+(with a local JSON snapshot as a cold-start mirror) and refreshed
+incrementally: a cheap fingerprint query decides whether a rebuild is needed,
+and single classes can be merged in on a miss.
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import json
+import os
+import time
+import httpx
+from typing import Dict, Any, List, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.redis_manager import redis_manager
+
+logger = get_logger(__name__)
+
+GRAPHDB_QUERY_ENDPOINT = f"http://{settings.GRAPHDB_HOST}:{settings.GRAPHDB_PORT}/repositories/{settings.GRAPHDB_REPOSITORY}"
+
+BLDG_NS = "http://abacwsbuilding.cardiff.ac.uk/abacws#"
+BRICK_NS = "https://brickschema.org/schema/Brick#"
+
+SNAPSHOT_KEY = "index:class_instances"
+VERSION_KEY = "index:class_instances:version"
+
+PREFIXES = f"""PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX brick: <{BRICK_NS}>
+PREFIX bldg: <{BLDG_NS}>"""
+
+BULK_QUERY = PREFIXES + f"""
+SELECT DISTINCT ?s ?class WHERE {{
+  ?s rdf:type ?t .
+  ?t rdfs:subClassOf* ?class .
+  FILTER(STRSTARTS(STR(?s), '{BLDG_NS}'))
+  FILTER(STRSTARTS(STR(?class), '{BRICK_NS}'))
+}}"""
+
+FINGERPRINT_QUERY = PREFIXES + f"""
+SELECT (COUNT(*) AS ?n) WHERE {{
+  ?s rdf:type ?t .
+  FILTER(STRSTARTS(STR(?s), '{BLDG_NS}'))
+}}"""
+
+
+def _compact(uri: str) -> str:
+    """Compact a bldg:/brick: IRI to its prefixed form"""
+    if uri.startswith(BLDG_NS):
+        return "bldg:" + uri[len(BLDG_NS):]
+    if uri.startswith(BRICK_NS):
+        return "brick:" + uri[len(BRICK_NS):]
+    return uri
+
+
+class ClassInstanceIndex:
+    """In-memory class -> instance index with interned IRIs"""
+
+    def __init__(self):
+        self._instances: List[str] = []
+        self._instance_ids: Dict[str, int] = {}
+        self._by_class: Dict[str, List[int]] = {}
+        self.fingerprint: Optional[int] = None
+        self.version: int = 0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._by_class)
+
+    # ==================== Lookups ====================
+
+    def instances_of(self, brick_class: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Return instances of a Brick class (including subclasses).
+
+        Args:
+            brick_class: Prefixed class name, e.g. 'brick:Humidity_Sensor'
+            limit: Optional maximum number of instances
+
+        Returns:
+            List of 'bldg:' instance names
+        """
+        ids = self._by_class.get(_compact(brick_class), [])
+        if limit is not None:
+            ids = ids[:limit]
+        return [self._instances[i] for i in ids]
+
+    def has_class(self, brick_class: str) -> bool:
+        """Whether the class is indexed (possibly with no instances)"""
+        return _compact(brick_class) in self._by_class
+
+    def search(self, token: str, limit: Optional[int] = None) -> List[str]:
+        """Return indexed instances whose local name contains the token"""
+        out = [name for name in self._instances if token in name]
+        return out[:limit] if limit is not None else out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instances": len(self._instances),
+            "classes": len(self._by_class),
+            "fingerprint": self.fingerprint,
+            "version": self.version,
+        }
+
+    # ==================== Building ====================
+
+    def _intern(self, uri: str) -> int:
+        name = sys.intern(_compact(uri))
+        idx = self._instance_ids.get(name)
+        if idx is None:
+            idx = len(self._instances)
+            self._instances.append(name)
+            self._instance_ids[name] = idx
+        return idx
+
+    def _add(self, instance_uri: str, class_uri: str):
+        idx = self._intern(instance_uri)
+        key = sys.intern(_compact(class_uri))
+        members = self._by_class.setdefault(key, [])
+        if not members or members[-1] != idx:
+            members.append(idx)
+
+    def _reset(self):
+        self._instances = []
+        self._instance_ids = {}
+        self._by_class = {}
+
+    async def _query(self, sparql: str, timeout: float = 60.0) -> List[Dict[str, Any]]:
+        auth = (settings.GRAPHDB_USER, settings.GRAPHDB_PASSWORD) if settings.GRAPHDB_USER else None
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            resp = await client.post(
+                GRAPHDB_QUERY_ENDPOINT,
+                auth=auth,
+                data={"query": sparql},
+                headers={"Accept": "application/sparql-results+json"}
+            )
+            resp.raise_for_status()
+            return resp.json().get("results", {}).get("bindings", [])
+
+    async def _fetch_fingerprint(self) -> Optional[int]:
+        try:
+            bindings = await self._query(FINGERPRINT_QUERY, timeout=15.0)
+            return int(bindings[0]["n"]["value"]) if bindings else 0
+        except Exception as e:
+            logger.warning(f"Class index fingerprint query failed: {e}")
+            return None
+
+    async def build(self):
+        """Rebuild the whole index with one bulk subclass-closure query"""
+        start = time.time()
+        fingerprint = await self._fetch_fingerprint()
+        bindings = await self._query(BULK_QUERY)
+        self._reset()
+        for b in bindings:
+            s = b.get("s", {}).get("value")
+            c = b.get("class", {}).get("value")
+            if s and c:
+                self._add(s, c)
+        for members in self._by_class.values():
+            members.sort(key=lambda i: self._instances[i])
+        self.fingerprint = fingerprint
+        self.version = int(time.time())
+        logger.info(
+            f"✅ Built class index: {len(self._instances)} instances, {len(self._by_class)} classes "
+            f"in {time.time() - start:.2f}s"
+        )
+        await self._publish()
+
+    async def refresh_class(self, brick_class: str, limit: Optional[int] = None) -> List[str]:
+        """Fetch a single class (with subclasses) and merge it into the index"""
+        cls = _compact(brick_class)
+        q = PREFIXES + f"""
+SELECT DISTINCT ?s WHERE {{
+  ?s rdf:type/rdfs:subClassOf* {cls} .
+  FILTER(STRSTARTS(STR(?s), '{BLDG_NS}'))
+}}"""
+        try:
+            bindings = await self._query(q, timeout=25.0)
+        except Exception as e:
+            logger.warning(f"Class instance query failed for {brick_class}: {e}")
+            return []
+        # An empty result is indexed too, so classes without instances are not queried again
+        members = set(self._by_class.get(cls, []))
+        for b in bindings:
+            uri = b.get("s", {}).get("value")
+            if uri:
+                members.add(self._intern(uri))
+        self._by_class[sys.intern(cls)] = sorted(members, key=lambda i: self._instances[i])
+        return self.instances_of(cls, limit)
+
+    # ==================== Snapshots ====================
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "instances": self._instances,
+            "classes": self._by_class,
+        }
+
+    def _restore(self, snapshot: Dict[str, Any]):
+        self._instances = [sys.intern(name) for name in snapshot.get("instances", [])]
+        self._instance_ids = {name: i for i, name in enumerate(self._instances)}
+        self._by_class = {sys.intern(cls): ids for cls, ids in snapshot.get("classes", {}).items()}
+        self.fingerprint = snapshot.get("fingerprint")
+        self.version = snapshot.get("version", 0)
+
+    async def _publish(self):
+        """Share the current index with other workers (Redis) and persist a local mirror"""
+        snapshot = self._snapshot()
+        ttl = settings.CLASS_INDEX_SNAPSHOT_TTL
+        await redis_manager.set_cache(SNAPSHOT_KEY, snapshot, ttl=ttl)
+        await redis_manager.set_cache(VERSION_KEY, self.version, ttl=ttl)
+        try:
+            path = settings.CLASS_INDEX_SNAPSHOT_PATH
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+        except Exception as e:
+            logger.warning(f"Failed to write class index snapshot: {e}")
+
+    async def load(self):
+        """Load the index from Redis, then the local mirror, else build it"""
+        async with self._lock:
+            snapshot = await redis_manager.get_cache(SNAPSHOT_KEY)
+            if snapshot:
+                self._restore(snapshot)
+                logger.info(f"📚 Loaded class index v{self.version} from Redis ({len(self._instances)} instances)")
+                return
+            path = settings.CLASS_INDEX_SNAPSHOT_PATH
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._restore(json.load(f))
+                    logger.info(f"📚 Loaded class index v{self.version} from {path}")
+                    await self._refresh_locked()
+                    return
+                except Exception as e:
+                    logger.warning(f"Failed to read class index snapshot {path}: {e}")
+            await self.build()
+
+    async def refresh(self):
+        """Adopt a newer shared snapshot, or rebuild if the graph changed"""
+        async with self._lock:
+            await self._refresh_locked()
+
+    async def _refresh_locked(self):
+        shared_version = await redis_manager.get_cache(VERSION_KEY)
+        if shared_version and shared_version > self.version:
+            snapshot = await redis_manager.get_cache(SNAPSHOT_KEY)
+            if snapshot:
+                self._restore(snapshot)
+                logger.info(f"📚 Adopted shared class index v{self.version}")
+                return
+        fingerprint = await self._fetch_fingerprint()
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            logger.info(f"Ontology changed (type triples {self.fingerprint} -> {fingerprint}), rebuilding class index")
+            await self.build()
+
+    async def run_refresh_loop(self):
+        """Periodically refresh the index (started from the app lifespan)"""
+        interval = settings.CLASS_INDEX_REFRESH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Class index refresh failed: {e}")
+
+    def start(self):
+        if settings.CLASS_INDEX_REFRESH_INTERVAL > 0 and not self._refresh_task:
+            self._refresh_task = asyncio.create_task(self.run_refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+
+# Global instance
+class_index = ClassInstanceIndex()
@@ -0,0 +1,155 @@
+"""
+Code Attachments
+Hands fetched sensor data to the code executor as Arrow, not as source code.
+
+Generated code used to receive its data as a JSON literal prepended to the
+source, so every request compiled, regex-validated and posted megabytes of
+text (and broke on data containing ''' ). Data now travels as a named
+attachment on CodeExecutionRequest and is bound to a pandas DataFrame in the
+sandbox before the code runs:
+
+- small frames: inline Arrow IPC stream (base64) in the request body
+- larger frames: an Arrow IPC file in CODE_EXECUTOR_ATTACHMENT_DIR (a volume
+  both services mount), referenced by file name only
+"""
+import sys
+sys.path.append('/app')
+
+import os
+import time
+import base64
+import hashlib
+import numpy as np
+from typing import Dict, Any, List, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame, BASE_COLUMNS, INTEGER_COLUMNS
+
+logger = get_logger(__name__)
+
+ARTIFACT_SUFFIX = ".arrow"
+
+
+class AttachmentStore:
+    """Encodes SeriesFrames and result records as code-executor attachments"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.CODE_EXECUTOR_ATTACHMENT_DIR
+        self.metrics = {"inline": 0, "artifacts": 0, "bytes": 0, "pruned": 0}
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            return pyarrow
+        except ImportError:
+            logger.error("pyarrow not installed. Run: pip install pyarrow")
+            raise
+
+    def to_arrow(self, frame: SeriesFrame) -> bytes:
+        """Serialize a frame as an Arrow IPC stream"""
+        pa = self._pyarrow()
+        arrays = {}
+        for name, column in frame.columns.items():
+            if column.dtype == object:
+                # uuid, or a column as_column could not type (mixed/unparsed values)
+                arrays[name] = pa.array([None if v is None else str(v) for v in column.tolist()], type=pa.string())
+            elif name == "timestamp":
+                arrays[name] = pa.array(column.astype("datetime64[us]"), type=pa.timestamp("us"))
+            elif name in INTEGER_COLUMNS and not np.isnan(column).any():
+                arrays[name] = pa.array(column.astype(np.int64), type=pa.int64())
+            else:
+                arrays[name] = pa.array(column.astype(np.float64), type=pa.float64())
+        return self._serialize(pa.table(arrays))
+
+    def _serialize(self, table) -> bytes:
+        pa = self._pyarrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def attach(self, name: str, frame: SeriesFrame) -> Dict[str, Any]:
+        """
+        Build a DataAttachment payload for a frame
+
+        Args:
+            name: Variable name the sandbox binds the DataFrame to
+            frame: Readings to attach
+
+        Returns:
+            Dict matching shared.models.DataAttachment
+        """
+        return self._package(name, self.to_arrow(frame), len(frame))
+
+    def attach_records(self, name: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build a DataAttachment payload for arbitrary dict records
+
+        Sensor readings (timestamp/uuid/value) get the typed SeriesFrame
+        columns; other result sets keep their own columns, with Arrow
+        inferring types and falling back to strings for mixed columns.
+        """
+        if records and all(key in records[0] for key in BASE_COLUMNS):
+            return self.attach(name, SeriesFrame.from_records(records))
+        pa = self._pyarrow()
+        try:
+            table = pa.Table.from_pylist(records)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            names = list(dict.fromkeys(key for record in records for key in record))
+            table = pa.table({
+                key: pa.array([None if r.get(key) is None else str(r.get(key)) for r in records], type=pa.string())
+                for key in names
+            })
+        return self._package(name, self._serialize(table), len(records))
+
+    def _package(self, name: str, payload: bytes, rows: int) -> Dict[str, Any]:
+        """Inline small payloads; write larger ones to the shared directory"""
+        self.metrics["bytes"] += len(payload)
+        if len(payload) <= settings.CODE_EXECUTOR_INLINE_ATTACHMENT_BYTES:
+            self.metrics["inline"] += 1
+            return {
+                "name": name,
+                "format": "arrow",
+                "data": base64.b64encode(payload).decode("ascii"),
+                "rows": rows,
+            }
+
+        handle = hashlib.sha1(payload).hexdigest() + ARTIFACT_SUFFIX
+        path = os.path.join(self.directory, handle)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        else:
+            # Touch so pruning keeps artifacts that are still being reused
+            os.utime(path)
+        self.metrics["artifacts"] += 1
+        self.prune()
+        logger.info(f"📎 Attachment '{name}' written as artifact {handle} ({len(payload)} bytes, {rows} rows)")
+        return {"name": name, "format": "artifact", "artifact": handle, "rows": rows}
+
+    def prune(self):
+        """Delete artifacts unused for longer than CODE_EXECUTOR_ATTACHMENT_TTL"""
+        cutoff = time.time() - settings.CODE_EXECUTOR_ATTACHMENT_TTL
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith(ARTIFACT_SUFFIX) and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    self.metrics["pruned"] += 1
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": self.directory, **self.metrics}
+
+
+# Global instance
+attachment_store = AttachmentStore()
@@ -0,0 +1,211 @@
+"""
+Generated Code Cache
+Reuses analytics code that already ran successfully for the same kind of question.
+
+Entries are keyed on a normalised analysis intent (the question with time
+windows, sensor names and filler words removed, synonyms folded) plus the
+schema signature of the attached data (columns, dtypes, number of sensors) -
+never on the data itself. Stored code is a template: sensor UUIDs, labels
+and the plot file name are replaced by placeholders when stored and filled
+with the current request's values when reused. Entries live in Redis so all
+workers share them; an entry whose reuse fails is evicted and the question
+goes back to code generation.
+"""
+import sys
+sys.path.append('/app')
+
+import re
+import time
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.redis_manager import redis_manager
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.time_resolver import (
+    RELATIVE_RE, RANGE_RE, SINCE_RE, ON_DATE_RE, WEEKDAY_RE, IN_MONTH_RE, DAY_PART_RE
+)
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "codecache"
+
+TIME_PATTERNS = (RANGE_RE, SINCE_RE, RELATIVE_RE, DAY_PART_RE, WEEKDAY_RE, IN_MONTH_RE, ON_DATE_RE)
+TIME_WORDS_RE = re.compile(r"\b(today|yesterday|tonight|this (?:morning|afternoon|evening|week|month|year)|so far)\b")
+UUID_RE = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+PLOT_FILE_RE = re.compile(r"plot_[\w.-]*?_\d{8}_\d{6}\.png")
+TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+# Folded so "avg" and "average" share entries
+SYNONYMS = {
+    "average": "mean", "avg": "mean", "averages": "mean",
+    "maximum": "max", "highest": "max", "peak": "max",
+    "minimum": "min", "lowest": "min",
+    "graph": "plot", "chart": "plot", "visualise": "plot", "visualize": "plot",
+    "compare": "comparison", "versus": "comparison", "vs": "comparison",
+    "hourly": "hour", "daily": "day", "weekly": "week", "monthly": "month",
+}
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "from", "by", "with", "and", "or",
+    "is", "are", "was", "were", "be", "been", "what", "whats", "which", "how", "me", "my", "i",
+    "please", "can", "could", "you", "show", "give", "get", "tell", "find", "calculate", "compute",
+    "sensor", "sensors", "data", "value", "values", "reading", "readings", "it", "its", "s",
+    "that", "this", "these", "those", "there", "do", "does", "did", "over", "during", "between",
+}
+
+
+@dataclass
+class CachedCode:
+    """Code ready to run for the current request"""
+    key: str
+    code: str
+    intent: str
+
+
+def normalise_intent(user_query: str, sensor_metadata: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+    """
+    Reduce a question to the analysis it asks for
+
+    Time windows, UUIDs and sensor labels are removed (the attached data
+    already reflects them); other numbers are kept, since thresholds and
+    percentiles end up as literals in the generated code.
+    """
+    text = (user_query or "").lower()
+    for meta in (sensor_metadata or {}).values():
+        label = str(meta.get("label") or "").lower()
+        if label:
+            text = text.replace(label, " ")
+    text = UUID_RE.sub(" ", text)
+    for pattern in TIME_PATTERNS:
+        text = pattern.sub(" ", text)
+    text = TIME_WORDS_RE.sub(" ", text)
+    tokens = [SYNONYMS.get(t, t) for t in TOKEN_RE.findall(text)]
+    return " ".join(sorted({t for t in tokens if t not in STOPWORDS}))
+
+
+def schema_signature(frame: SeriesFrame) -> str:
+    """Columns, dtypes and sensor count of the data the code will receive"""
+    columns = ",".join(f"{name}:{values.dtype.kind}" for name, values in sorted(frame.columns.items()))
+    return f"{columns}|sensors={len(frame.uuids)}"
+
+
+class CodeCache:
+    """Shared cache of validated analytics code templates"""
+
+    def __init__(self):
+        self.metrics = {"lookups": 0, "hits": 0, "stored": 0, "reuse_success": 0, "reuse_failure": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CODE_CACHE_ENABLED
+
+    def _key(self, intent: str, signature: str) -> str:
+        digest = hashlib.sha1(f"{intent}\n{signature}".encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{digest}"
+
+    @staticmethod
+    def _sensors(sensor_metadata: Optional[Dict[str, Dict[str, str]]]) -> List[tuple]:
+        return [(uuid, str(meta.get("label") or "")) for uuid, meta in (sensor_metadata or {}).items()]
+
+    # ==================== Templates ====================
+
+    def _to_template(self, code: str, sensor_metadata: Optional[Dict[str, Dict[str, str]]]) -> str:
+        sensors = self._sensors(sensor_metadata)
+        for i, (uuid, _) in enumerate(sensors):
+            code = code.replace(uuid, f"{{{{SENSOR_{i}}}}}")
+        # Longest labels first so a label containing another is replaced whole
+        for i, label in sorted(((i, label) for i, (_, label) in enumerate(sensors) if label), key=lambda x: -len(x[1])):
+            code = code.replace(label, f"{{{{LABEL_{i}}}}}")
+        return PLOT_FILE_RE.sub("{{PLOT_FILE}}", code)
+
+    def _from_template(
+        self,
+        template: str,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]],
+        plot_filename: str
+    ) -> str:
+        code = template.replace("{{PLOT_FILE}}", plot_filename)
+        for i, (uuid, label) in enumerate(self._sensors(sensor_metadata)):
+            code = code.replace(f"{{{{SENSOR_{i}}}}}", uuid).replace(f"{{{{LABEL_{i}}}}}", label)
+        return code
+
+    # ==================== Lookup / Store ====================
+
+    async def get(
+        self,
+        user_query: str,
+        frame: SeriesFrame,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]],
+        plot_filename: str
+    ) -> Optional[CachedCode]:
+        """
+        Find validated code for this intent and data shape
+
+        Returns:
+            CachedCode with placeholders filled in, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        intent = normalise_intent(user_query, sensor_metadata)
+        key = self._key(intent, schema_signature(frame))
+        self.metrics["lookups"] += 1
+        entry = await redis_manager.get_cache(key)
+        if not entry or not entry.get("validated"):
+            return None
+        self.metrics["hits"] += 1
+        logger.info(f"♻️  Code cache hit for '{intent}' (reused {entry.get('successes', 0)}x)")
+        return CachedCode(key=key, code=self._from_template(entry["code"], sensor_metadata, plot_filename), intent=intent)
+
+    async def store(
+        self,
+        user_query: str,
+        frame: SeriesFrame,
+        sensor_metadata: Optional[Dict[str, Dict[str, str]]],
+        code: str
+    ):
+        """Remember code that just executed successfully"""
+        if not self.enabled or not code:
+            return
+        intent = normalise_intent(user_query, sensor_metadata)
+        if not intent:
+            return
+        key = self._key(intent, schema_signature(frame))
+        entry = {
+            "intent": intent,
+            "signature": schema_signature(frame),
+            "code": self._to_template(code, sensor_metadata),
+            "validated": True,
+            "successes": 0,
+            "stored_at": time.time(),
+        }
+        if await redis_manager.set_cache(key, entry, ttl=settings.CODE_CACHE_TTL):
+            self.metrics["stored"] += 1
+            logger.info(f"💾 Cached analytics code for '{intent}'")
+
+    async def record(self, cached: CachedCode, success: bool):
+        """Track the outcome of reusing an entry; failed code is evicted"""
+        if success:
+            self.metrics["reuse_success"] += 1
+            entry = await redis_manager.get_cache(cached.key)
+            if entry:
+                entry["successes"] = entry.get("successes", 0) + 1
+                await redis_manager.set_cache(cached.key, entry, ttl=settings.CODE_CACHE_TTL)
+            return
+        self.metrics["reuse_failure"] += 1
+        self.metrics["evicted"] += 1
+        await redis_manager.delete_cache(cached.key)
+        logger.warning(f"🗑️  Evicted cached code for '{cached.intent}' after a failed reuse")
+
+    def stats(self) -> Dict[str, Any]:
+        reused = self.metrics["reuse_success"] + self.metrics["reuse_failure"]
+        return {
+            "enabled": self.enabled,
+            **self.metrics,
+            "hit_rate": round(self.metrics["hits"] / self.metrics["lookups"], 3) if self.metrics["lookups"] else None,
+            "reuse_success_rate": round(self.metrics["reuse_success"] / reused, 3) if reused else None,
+        }
+
+
+# Global instance
+code_cache = CodeCache()
@@ -0,0 +1,257 @@
+"""
+Code Validator
+Static checks and cheap fixes for generated analytics code, before execution.
+
+Generated code used to reach the executor unchecked: a forbidden import, an
+open() call or a syntax error came back as an HTTP response and cost a
+repair LLM call plus another round-trip. Code is now parsed locally and
+checked against the executor's own policy (shared.sandbox_policy):
+
+- syntax errors, forbidden imports/calls and builtins the sandbox lacks
+- names used but never defined, and columns read from the attached
+  DataFrame that are not in its schema
+- fixed in place where the intent is unambiguous: missing standard imports
+  are added
+- reading a file through open() is reported with a pointer to the attached
+  DataFrame, since the data is already bound as df (rewriting the read to
+  pandas would not give json.load's value for every file)
+
+Only code that is still invalid after the fixes goes to the LLM repair
+step, with the precise problems as the error message.
+"""
+import sys
+sys.path.append('/app')
+
+import ast
+import builtins
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Iterable, Set
+from shared import sandbox_policy
+from shared.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Conventional names fixed by adding the import
+AUTO_IMPORTS = {
+    "pd": "import pandas as pd",
+    "np": "import numpy as np",
+    "plt": "import matplotlib.pyplot as plt",
+    "sns": "import seaborn as sns",
+    "mdates": "import matplotlib.dates as mdates",
+    "go": "import plotly.graph_objects as go",
+    "px": "import plotly.express as px",
+    "json": "import json",
+    "math": "import math",
+    "time": "import time",
+    "statistics": "import statistics",
+    "datetime": "from datetime import datetime",
+    "timedelta": "from datetime import timedelta",
+    "Counter": "from collections import Counter",
+    "defaultdict": "from collections import defaultdict",
+}
+
+# DataFrame methods that keep the columns of the frame they are called on
+ROW_METHODS = {"copy", "query", "sort_values", "sort_index", "dropna", "fillna", "head", "tail", "drop_duplicates", "sample"}
+
+
+@dataclass
+class CodeValidation:
+    """Outcome of validating (and possibly fixing) one piece of code"""
+    code: str
+    issues: List[str] = field(default_factory=list)
+    fixes: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+    def error_message(self) -> str:
+        return "Static validation failed:\n" + "\n".join(f"- {issue}" for issue in self.issues)
+
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """Every name the code binds anywhere (assignment, import, def, loop, with, except, args)"""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((a.asname or a.name).split(".")[0] for a in node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+    return bound
+
+
+def free_names(code: str) -> Set[str]:
+    """Names the code reads but never binds (defined elsewhere: builtins, attachments, earlier cells)"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    loaded = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+    return loaded - _bound_names(tree)
+
+
+def _is_call(node: ast.AST, name: str) -> bool:
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == name
+
+
+class CodeValidator:
+    """Validates generated code against the sandbox policy and the data schema"""
+
+    def __init__(self):
+        self.metrics = {"validated": 0, "rejected": 0, "fixed": 0}
+
+    def validate(
+        self,
+        code: str,
+        columns: Optional[Iterable[str]] = None,
+        frame_names: Iterable[str] = ("df",),
+        provided: Iterable[str] = ()
+    ) -> CodeValidation:
+        """
+        Check code and apply cheap fixes
+
+        Args:
+            code: Generated Python code
+            columns: Columns of the attached DataFrame (None skips the column check)
+            frame_names: Names the attached DataFrame is bound to
+            provided: Other names bound before the code runs (not column-checked)
+
+        Returns:
+            CodeValidation with the (possibly fixed) code and remaining issues
+        """
+        self.metrics["validated"] += 1
+        result = CodeValidation(code=code)
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            result.issues.append(f"SyntaxError: {e.msg} (line {e.lineno})")
+            self.metrics["rejected"] += 1
+            return result
+
+        result.issues.extend(sandbox_policy.policy_violations(tree))
+        self._check_open(tree, result, list(frame_names))
+        self._fix_names(tree, result, set(frame_names) | set(provided))
+        if columns is not None:
+            self._check_columns(tree, result, set(columns), set(frame_names))
+
+        if result.fixes:
+            self.metrics["fixed"] += 1
+            logger.info(f"🔧 Auto-fixed generated code: {', '.join(result.fixes)}")
+        if result.issues:
+            self.metrics["rejected"] += 1
+            logger.warning(f"Generated code failed static validation: {result.issues}")
+        return result
+
+    # ==================== Fixes ====================
+
+    def _fix_names(self, tree: ast.Module, result: CodeValidation, prebound: Set[str]):
+        bound = _bound_names(tree) | prebound | {"result"}
+        used = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in bound:
+                if node.id not in used:
+                    used.append(node.id)
+
+        missing_imports = []
+        for name in used:
+            if name in sandbox_policy.SAFE_BUILTIN_NAMES or name in sandbox_policy.PREIMPORTS.values():
+                continue
+            if name in sandbox_policy.FORBIDDEN_CALLS or name == "__import__":
+                # Already reported as a policy violation
+                continue
+            if name in AUTO_IMPORTS:
+                missing_imports.append(AUTO_IMPORTS[name])
+            elif hasattr(builtins, name):
+                result.issues.append(f"builtin '{name}' is not available in the sandbox")
+            else:
+                result.issues.append(f"name '{name}' is used but never defined")
+
+        if missing_imports:
+            result.code = "\n".join(missing_imports) + "\n" + result.code
+            result.fixes.append("added " + "; ".join(missing_imports))
+
+    # ==================== Schema ====================
+
+    def _check_open(self, tree: ast.Module, result: CodeValidation, frame_names: List[str]):
+        """Reading a data file is already reported as a policy violation; say where the data is"""
+        if frame_names and any(_is_call(node, "open") for node in ast.walk(tree)):
+            result.issues.append(
+                f"the data is already loaded as the DataFrame '{frame_names[0]}' - use it instead of reading a file"
+            )
+
+    def _check_columns(self, tree: ast.Module, result: CodeValidation, columns: Set[str], frame_names: Set[str]):
+        """Columns read from the attached frame (or row-subsets of it) must exist"""
+        frames = set(frame_names)
+        known = set(columns)
+
+        def rooted(node: ast.AST) -> bool:
+            if isinstance(node, ast.Name):
+                return node.id in frames
+            if isinstance(node, ast.Subscript) and not isinstance(_key(node), str):
+                return rooted(node.value)
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                if node.func.attr in ROW_METHODS:
+                    return rooted(node.func.value)
+                if node.func.attr == "assign":
+                    known.update(k.arg for k in node.keywords if k.arg)
+                    return rooted(node.func.value)
+            if isinstance(node, ast.Attribute) and node.attr == "loc":
+                return rooted(node.value)
+            return False
+
+        # First pass: frames derived from df, columns the code creates, and frames whose
+        # columns change in ways not tracked here (rebound, renamed, reindexed in place)
+        untracked = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        (frames if rooted(node.value) else untracked).add(target.id)
+                    elif isinstance(target, ast.Subscript) and isinstance(_key(target), str):
+                        known.add(_key(target))
+                    elif isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name):
+                        untracked.add(target.value.id)
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+                if any(k.arg == "inplace" for k in node.keywords) and node.func.attr not in ROW_METHODS:
+                    untracked.add(node.func.value.id)
+        frames -= untracked
+
+        reported = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and rooted(node.value):
+                for column in _keys(node):
+                    if column not in known and column not in reported:
+                        reported.add(column)
+                        result.issues.append(
+                            f"column '{column}' does not exist (available: {', '.join(sorted(columns))})"
+                        )
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.metrics)
+
+
+def _key(node: ast.Subscript) -> Optional[Any]:
+    """Constant subscript key (df['col']), if any"""
+    return node.slice.value if isinstance(node.slice, ast.Constant) else None
+
+
+def _keys(node: ast.Subscript) -> List[str]:
+    """Column names read by df['col'] or df[['a', 'b']]"""
+    key = _key(node)
+    if isinstance(key, str):
+        return [key]
+    if isinstance(node.slice, ast.List):
+        return [e.value for e in node.slice.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+    return []
+
+
+# Global instance
+code_validator = CodeValidator()
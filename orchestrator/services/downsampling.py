@@ -0,0 +1,179 @@
+"""
+Plot Downsampling
+Shape-preserving reduction of time series before they are plotted.
+
+Charts are about PLOT_TARGET_WIDTH pixels wide, but multi-sensor,
+multi-day windows hold tens of thousands of readings; every one of them
+was attached to visualization code, drawn by matplotlib and serialised
+into chart specs. Each series is now reduced to a point budget derived
+from the target width and the number of series, with
+Largest-Triangle-Three-Buckets (LTTB):
+
+- the first and last readings are always kept, and so are each series'
+  global minimum and maximum (they replace the LTTB pick in their bucket;
+  a bucket holding both keeps both, in time order)
+- every kept point carries the envelope of the readings it stands for:
+  'min'/'max' over its bucket, the summed 'count' and the bucket's 'last'
+
+The output has the same shape as a bucketed fetch, so charts can draw the
+min/max band and plotting code needs no special case. Statistics must be
+computed from the full data, never from the downsampled frame.
+"""
+import sys
+sys.path.append('/app')
+
+import numpy as np
+from typing import Dict, Any, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame, TIMESTAMP_DTYPE
+from orchestrator.services.analytics_engine import analytics_engine
+
+logger = get_logger(__name__)
+
+FIELDS = ("ts", "value", "min", "max", "last", "count")
+# Columns of a raw or bucketed readings frame (anything else is not a plain series)
+SERIES_COLUMNS = {"timestamp", "uuid", "value", "min", "max", "count", "last"}
+
+
+def point_budget(series_count: int, width_px: Optional[int] = None) -> int:
+    """Points kept per series: the pixel budget shared across series, with a floor"""
+    width = width_px or settings.PLOT_TARGET_WIDTH
+    total = int(width * settings.DOWNSAMPLE_POINTS_PER_PIXEL)
+    return max(settings.DOWNSAMPLE_MIN_POINTS, total // max(series_count, 1))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps
+
+    Args:
+        x: Increasing x values (e.g. epoch microseconds)
+        y: Values
+        threshold: Number of points to keep (>= 3); one more when the
+            minimum and maximum fall in the same bucket
+
+    Returns:
+        Sorted, unique indices, including the first and last point and
+        the global minimum and maximum of y
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    forced = {}
+    for extreme in sorted({int(np.argmin(y)), int(np.argmax(y))}):
+        if 0 < extreme < n - 1:
+            forced.setdefault(int(np.searchsorted(edges, extreme, side="right")) - 1, []).append(extreme)
+
+    selected = [0]
+    a = 0
+    for b in range(threshold - 2):
+        start, end = edges[b], edges[b + 1]
+        if b in forced:
+            # Both extremes may share a bucket: keep both, the later one anchors the next bucket
+            selected.extend(forced[b])
+            a = forced[b][-1]
+        else:
+            # Average of the next bucket (the last point for the final bucket)
+            next_start, next_end = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+            area = np.abs(
+                (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+            )
+            a = start + int(np.argmax(area))
+            selected.append(a)
+    selected.append(n - 1)
+    return np.asarray(selected, dtype=np.int64)
+
+
+class Downsampler:
+    """Reduces prepared (uuid, timestamp)-sorted series to the plot point budget"""
+
+    def __init__(self):
+        self.metrics = {"series": 0, "reduced": 0, "points_in": 0, "points_out": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PLOT_DOWNSAMPLING
+
+    def reduce(self, data: Dict[str, Any], width_px: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Downsample prepared series (see AnalyticsEngine.prepare)
+
+        Returns:
+            The same structure with every series reduced to the point budget
+            (plus one point when its minimum and maximum share a bucket);
+            min/max/count/last describe the readings each kept point represents
+        """
+        starts, ends = analytics_engine.segments(data["code"])
+        budget = point_budget(len(starts), width_px)
+        self.metrics["series"] += len(starts)
+        self.metrics["points_in"] += len(data["value"])
+        if not self.enabled or all(end - start <= budget for start, end in zip(starts, ends)):
+            self.metrics["points_out"] += len(data["value"])
+            return data
+
+        pieces = {name: [] for name in FIELDS + ("code",)}
+        for start, end in zip(starts, ends):
+            if end - start <= budget:
+                for name in pieces:
+                    pieces[name].append(data[name][start:end])
+                continue
+            self.metrics["reduced"] += 1
+            keep = lttb_indices(data["ts"][start:end], data["value"][start:end], budget)
+            # Each kept point stands for the readings up to the next kept point
+            bounds = np.r_[keep, end - start]
+            span = slice(start, end)
+            pieces["ts"].append(data["ts"][span][keep])
+            pieces["value"].append(data["value"][span][keep])
+            pieces["min"].append(np.minimum.reduceat(data["min"][span], keep))
+            pieces["max"].append(np.maximum.reduceat(data["max"][span], keep))
+            pieces["count"].append(np.add.reduceat(data["count"][span], keep))
+            pieces["last"].append(data["last"][span][bounds[1:] - 1])
+            pieces["code"].append(data["code"][span][keep])
+
+        reduced = {name: np.concatenate(values) for name, values in pieces.items()}
+        reduced["names"] = data["names"]
+        reduced["bucketed"] = True
+        self.metrics["points_out"] += len(reduced["value"])
+        logger.info(f"📉 Downsampled {len(data['value'])} -> {len(reduced['value'])} points "
+                    f"({len(starts)} series, {budget} per series)")
+        return reduced
+
+    @staticmethod
+    def plottable(frame: SeriesFrame) -> bool:
+        """Whether a frame holds plain readings that downsampling can stand in for"""
+        if not len(frame) or not set(frame.columns) <= SERIES_COLUMNS:
+            return False
+        values = frame.columns["value"]
+        return values.dtype.kind == "f" and frame.columns["timestamp"].dtype.kind == "M" \
+            and not np.isnan(values).all()
+
+    def frame(self, frame: SeriesFrame, width_px: Optional[int] = None) -> SeriesFrame:
+        """Downsampled copy of a frame, in bucketed shape (timestamp, uuid, value, min, max, count, last)"""
+        data = self.reduce(analytics_engine.prepare(frame), width_px)
+        return SeriesFrame({
+            "timestamp": data["ts"].astype(TIMESTAMP_DTYPE),
+            "uuid": data["names"][data["code"]].astype(object),
+            "value": data["value"],
+            "min": data["min"],
+            "max": data["max"],
+            "count": data["count"],
+            "last": data["last"],
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.metrics,
+            "ratio": round(self.metrics["points_out"] / self.metrics["points_in"], 3) if self.metrics["points_in"] else None,
+        }
+
+
+# Global instance
+downsampler = Downsampler()
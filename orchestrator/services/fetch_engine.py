@@ -0,0 +1,122 @@
+"""
+Fetch Engine Service
+Parallel, bounded fetching of many sensor UUIDs.
+
+UUIDs are split into fixed-size batches that run concurrently (capped so a
+single request cannot drain the connection pool). Each batch gets a fair
+share of the total row budget and results are merged in batch order into
+one columnar frame. Batches are merged as they complete, and once the byte
+budget is used no further batch is started. UUIDs of failed batches are
+recorded on the frame (failed_uuids), which is then marked truncated.
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import time
+from typing import Dict, List, Callable, Awaitable, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame
+
+logger = get_logger(__name__)
+
+# fetch_batch(uuids, row_limit) -> SeriesFrame (sets frame.truncated if it hit row_limit)
+BatchFetcher = Callable[[List[str], int], Awaitable[SeriesFrame]]
+
+
+class ChunkedFetcher:
+    """Runs batched UUID fetches concurrently within row/byte budgets"""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.batch_size = batch_size or settings.SQL_FETCH_BATCH_SIZE
+        self.concurrency = concurrency or settings.SQL_FETCH_CONCURRENCY
+        self.max_rows = max_rows or settings.SQL_UUID_FETCH_LIMIT
+        self.max_bytes = max_bytes or settings.SQL_FETCH_MAX_BYTES
+
+    def batches(self, uuids: List[str]) -> List[List[str]]:
+        unique = list(dict.fromkeys(uuids))
+        return [unique[i:i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+
+    async def fetch(self, uuids: List[str], fetch_batch: BatchFetcher) -> SeriesFrame:
+        """
+        Fetch all UUIDs in parallel batches
+
+        Args:
+            uuids: Sensor UUIDs
+            fetch_batch: Coroutine fetching one batch with a row limit
+
+        Returns:
+            Merged SeriesFrame (truncated=True if a budget was hit or a batch failed)
+
+        Raises:
+            The first batch's error when every batch failed
+        """
+        batches = self.batches(uuids)
+        if not batches:
+            return SeriesFrame()
+
+        total = sum(len(b) for b in batches)
+        start = time.perf_counter()
+
+        async def run(index: int, batch: List[str]):
+            row_limit = max(1, self.max_rows * len(batch) // total)
+            try:
+                return index, await fetch_batch(batch, row_limit)
+            except Exception as e:
+                return index, e
+
+        # At most `concurrency` batches in flight; no new batch starts once the byte budget is used
+        results: Dict[int, SeriesFrame] = {}
+        errors: Dict[int, Exception] = {}
+        used_bytes = 0
+        truncated = False
+        queued = list(enumerate(batches))
+        pending = set()
+        while pending or (queued and not truncated):
+            while queued and len(pending) < self.concurrency and not truncated:
+                pending.add(asyncio.ensure_future(run(*queued.pop(0))))
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, result = task.result()
+                if isinstance(result, Exception):
+                    logger.error(f"Batch fetch failed for {len(batches[index])} UUIDs: {result}")
+                    errors[index] = result
+                    continue
+                if truncated:
+                    continue
+                if used_bytes + result.nbytes > self.max_bytes:
+                    # Keep the rows that still fit and stop fetching
+                    per_row = max(1, result.nbytes // max(1, len(result)))
+                    result = result.head((self.max_bytes - used_bytes) // per_row)
+                    truncated = True
+                    logger.warning(f"⚠️  Fetch byte budget ({self.max_bytes} bytes) reached, remaining batches dropped")
+                used_bytes += result.nbytes
+                results[index] = result
+            if truncated:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                pending = set()
+
+        if len(errors) == len(batches):
+            raise errors[0]
+
+        # Merge in batch order; failed UUIDs are recorded so the answer can say data is missing
+        frames = [results[i] for i in sorted(results)]
+        failed = [u for i in sorted(errors) for u in batches[i]]
+        merged = SeriesFrame.concat(frames)
+        merged.failed_uuids.extend(failed)
+        merged.truncated = merged.truncated or truncated or bool(failed)
+        logger.info(
+            f"📦 Fetched {len(merged)} rows for {total} UUIDs in {len(batches)} batch(es) "
+            f"(concurrency {self.concurrency}) in {time.perf_counter() - start:.2f}s"
+            + (" [truncated]" if merged.truncated else "")
+        )
+        return merged
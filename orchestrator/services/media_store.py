@@ -0,0 +1,280 @@
+"""
+Media Store
+Content-addressed storage for generated images, served from /media/{hash}.
+
+Charts used to be base64-encoded into data: URLs inside the message text and
+metadata, so every chart added hundreds of KB to each Redis state load/save
+and Postgres row for the rest of the conversation. Images are now stored
+once on local disk under their SHA-256 and messages carry only the URL:
+
+    {MEDIA_DIR}/ab/abcdef...            original bytes
+    {MEDIA_DIR}/ab/abcdef....webp       full-size WebP variant
+    {MEDIA_DIR}/ab/abcdef....thumb.webp thumbnail (MEDIA_THUMBNAIL_SIZE px)
+    {MEDIA_DIR}/ab/abcdef....png        PNG of a chart spec (CHART_PNG_RENDER)
+
+Content never changes under a hash, so responses are cacheable forever. The
+directory is capped at MEDIA_MAX_BYTES; the least recently served blobs
+(and their variants) are evicted first.
+"""
+import sys
+sys.path.append('/app')
+
+import io
+import os
+import re
+import base64
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+from shared.utils import get_logger
+from shared.config import settings
+
+logger = get_logger(__name__)
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_RE = re.compile(r"data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=]+)")
+
+# variant -> (file suffix, content type)
+VARIANTS = {
+    "original": ("", None),
+    "webp": (".webp", "image/webp"),
+    "thumb": (".thumb.webp", "image/webp"),
+    # Rasterised chart spec (rendered in the background, never a fallback)
+    "png": (".png", "image/png"),
+}
+EXTENSION_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".gif": "image/gif",
+                   ".svg": "image/svg+xml", ".webp": "image/webp", ".pdf": "application/pdf"}
+TYPE_FILE = ".type"
+
+
+class MediaStore:
+    """SHA-256 addressed blob store with WebP/thumbnail variants and an LRU size cap"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.MEDIA_DIR
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self._pil_warned = False
+        self.metrics = {"stored": 0, "deduplicated": 0, "served": 0, "evicted": 0, "inlined_converted": 0}
+
+    def _pil(self):
+        try:
+            from PIL import Image
+            return Image
+        except ImportError:
+            if not self._pil_warned:
+                logger.warning("Pillow not installed, media variants disabled. Run: pip install Pillow")
+                self._pil_warned = True
+            return None
+
+    def _blob_path(self, digest: str, variant: str = "original") -> str:
+        return os.path.join(self.directory, digest[:2], digest + VARIANTS[variant][0])
+
+    # ==================== Write ====================
+
+    def put(self, data: bytes, content_type: str = "image/png") -> str:
+        """
+        Store bytes (idempotent) and return their hash
+
+        Args:
+            data: Media bytes
+            content_type: MIME type of the original
+
+        Returns:
+            Hex SHA-256 of the content
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self.metrics["deduplicated"] += 1
+                return digest
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            written = self._write(path, data)
+            written += self._write(path + TYPE_FILE, content_type.encode())
+            if content_type.startswith("image/") and content_type != "image/svg+xml":
+                written += self._write_variants(digest, data)
+            self.metrics["stored"] += 1
+            self._account(written)
+        logger.info(f"🖼️  Stored media {digest[:12]} ({len(data)} bytes, {content_type})")
+        return digest
+
+    def put_file(self, path: str) -> str:
+        """Store a file's content; the type is taken from its extension"""
+        with open(path, "rb") as f:
+            data = f.read()
+        content_type = EXTENSION_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+        return self.put(data, content_type)
+
+    def put_output(self, filename: str) -> Optional[str]:
+        """Store a file the code executor wrote to the shared outputs directory (None if absent)"""
+        path = self._find_output(filename)
+        return self.put_file(path) if path else None
+
+    def put_output_variant(self, digest: str, variant: str, filename: str) -> bool:
+        """Attach an executor output file to an existing blob as one of its variants"""
+        path = self._find_output(filename)
+        if not path or variant not in VARIANTS or variant == "original" or not os.path.exists(self._blob_path(digest)):
+            return False
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            self._account(self._write(self._blob_path(digest, variant), data))
+        logger.info(f"🖼️  Stored {variant} variant of media {digest[:12]} ({len(data)} bytes)")
+        return True
+
+    @staticmethod
+    def _find_output(filename: str) -> Optional[str]:
+        for path in (
+            f"/app/outputs/{filename}",  # Docker
+            f"outputs/{filename}",       # Local relative
+            os.path.join(os.getcwd(), "outputs", filename)
+        ):
+            if os.path.exists(path):
+                return path
+        logger.warning(f"Output file {filename} not found")
+        return None
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> int:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def _write_variants(self, digest: str, data: bytes) -> int:
+        Image = self._pil()
+        if Image is None:
+            return 0
+        written = 0
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                for variant in ("webp", "thumb"):
+                    copy = image.copy()
+                    if variant == "thumb":
+                        size = settings.MEDIA_THUMBNAIL_SIZE
+                        copy.thumbnail((size, size))
+                    buffer = io.BytesIO()
+                    copy.save(buffer, format="WEBP", quality=settings.MEDIA_WEBP_QUALITY, method=4)
+                    written += self._write(self._blob_path(digest, variant), buffer.getvalue())
+        except Exception as e:
+            logger.warning(f"Could not build variants for media {digest[:12]}: {e}")
+        return written
+
+    # ==================== Read ====================
+
+    def get(self, digest: str, variant: str = "original") -> Optional[Tuple[str, str]]:
+        """
+        Locate a stored blob
+
+        Returns:
+            (path, content type), or None if unknown. Missing image variants
+            fall back to the original; a chart without its PNG is None.
+        """
+        if not HASH_RE.match(digest or "") or variant not in VARIANTS:
+            return None
+        original = self._blob_path(digest)
+        if not os.path.exists(original):
+            return None
+        # mtime of the original is the LRU clock for the whole set
+        try:
+            os.utime(original)
+        except OSError:
+            pass
+        self.metrics["served"] += 1
+        path = self._blob_path(digest, variant)
+        if variant != "original" and os.path.exists(path):
+            return path, VARIANTS[variant][1]
+        if variant == "png":
+            return None
+        try:
+            with open(original + TYPE_FILE, "r", encoding="utf-8") as f:
+                content_type = f.read().strip()
+        except OSError:
+            content_type = "application/octet-stream"
+        return original, content_type
+
+    def url(self, digest: str, variant: str = "original") -> str:
+        base = f"{settings.STATIC_BASE_URL.rstrip('/')}/media/{digest}"
+        return base if variant == "original" else f"{base}?variant={variant}"
+
+    def media_item(self, digest: str, filename: str, media_type: str = "image") -> Dict[str, Any]:
+        """Reference stored in message metadata (no content)"""
+        return {
+            "type": media_type,
+            "url": self.url(digest),
+            "filename": filename,
+            "hash": digest,
+            "webp_url": self.url(digest, "webp"),
+            "thumbnail_url": self.url(digest, "thumb"),
+        }
+
+    def externalize(self, text: str) -> str:
+        """Replace inline data: URLs in text with media references"""
+        if not text or "data:" not in text:
+            return text
+
+        def _store(match):
+            digest = self.put(base64.b64decode(match.group(2)), match.group(1))
+            self.metrics["inlined_converted"] += 1
+            return self.url(digest)
+
+        return DATA_URL_RE.sub(_store, text)
+
+    # ==================== Eviction ====================
+
+    def _entries(self):
+        """(mtime, digest, total bytes) per stored blob set"""
+        sets: Dict[str, list] = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                digest = name[:64]
+                if not HASH_RE.match(digest):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entry = sets.setdefault(digest, [0.0, 0])
+                if name == digest:
+                    entry[0] = stat.st_mtime
+                entry[1] += stat.st_size
+        return [(mtime, digest, size) for digest, (mtime, size) in sets.items()]
+
+    def _account(self, written: int):
+        """Track the directory size and evict least recently used sets over the cap"""
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, _, size in self._entries())
+        else:
+            self._total_bytes += written
+        if self._total_bytes <= settings.MEDIA_MAX_BYTES:
+            return
+        target = settings.MEDIA_MAX_BYTES * 0.9
+        for _, digest, size in sorted(self._entries()):
+            if self._total_bytes <= target:
+                break
+            folder = os.path.join(self.directory, digest[:2])
+            for name in os.listdir(folder):
+                if name.startswith(digest):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+            self._total_bytes -= size
+            self.metrics["evicted"] += 1
+        logger.info(f"🧹 Media store trimmed to {self._total_bytes} bytes")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "bytes": self._total_bytes,
+            "max_bytes": settings.MEDIA_MAX_BYTES,
+            **self.metrics,
+        }
+
+
+# Global instance
+media_store = MediaStore()
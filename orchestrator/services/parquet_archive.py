@@ -0,0 +1,241 @@
+"""
+Parquet Archive Service
+Cold tier for closed days of sensor history, read with pyarrow datasets.
+
+scripts/archive_sensor_data.py exports whole days of the wide sensor table
+into long-format Parquet files partitioned by day and sensor group:
+
+    {ARCHIVE_DIR}/day=YYYY-MM-DD/group=NN/part.parquet   (uuid, timestamp, value)
+
+Each UUID always lands in the same group (stable hash), and rows are sorted
+by (uuid, timestamp), so a per-sensor range read touches one file per day
+and skips most row groups via Parquet statistics. manifest.json records the
+exported days; the contiguous run of days it covers is served from here while
+newer data stays in MySQL.
+"""
+import sys
+sys.path.append('/app')
+
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame, aggregate_buckets
+from orchestrator.services.resolution_planner import ResolutionPlan
+
+logger = get_logger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def sensor_group(uuid: str, groups: int) -> int:
+    """Stable partition group for a UUID (same across processes and runs)"""
+    return zlib.crc32(uuid.lower().encode()) % groups
+
+
+class ParquetArchive:
+    """Day/sensor-group partitioned Parquet store for closed sensor history"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.ARCHIVE_DIR
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.metrics = {"reads": 0, "files_read": 0, "rows_read": 0, "days_exported": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ARCHIVE_ENABLED
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.parquet
+            return pyarrow
+        except ImportError:
+            logger.error("pyarrow not installed. Run: pip install pyarrow")
+            raise
+
+    # ==================== Manifest ====================
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def _part_path(self, day: str, group: int) -> str:
+        return os.path.join(self.directory, f"day={day}", f"group={group:02d}", "part.parquet")
+
+    def manifest(self) -> Dict[str, Any]:
+        """Current manifest, reloaded when the exporter rewrites it"""
+        path = self._manifest_path()
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return {"groups": settings.ARCHIVE_SENSOR_GROUPS, "days": {}}
+            if self._manifest is None or mtime != self._manifest_mtime:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._manifest_path()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def coverage(self) -> Optional[Tuple[datetime, datetime]]:
+        """
+        [low, high) covered by the newest contiguous run of archived days
+
+        Bounds are naive datetimes in the database timezone, like the MySQL
+        Datetime column they were exported from.
+        """
+        if not self.enabled:
+            return None
+        try:
+            days = sorted(self.manifest().get("days", {}), reverse=True)
+        except Exception as e:
+            logger.warning(f"Archive manifest unreadable: {e}")
+            return None
+        if not days:
+            return None
+        newest = date.fromisoformat(days[0])
+        oldest = newest
+        for day in days[1:]:
+            previous = date.fromisoformat(day)
+            if previous != oldest - timedelta(days=1):
+                break
+            oldest = previous
+        return datetime.combine(oldest, datetime.min.time()), datetime.combine(newest + timedelta(days=1), datetime.min.time())
+
+    # ==================== Export ====================
+
+    def export_day(self, day: date, frame: SeriesFrame) -> Dict[str, Any]:
+        """
+        Write one closed day of readings and record it in the manifest
+
+        Re-exporting a day replaces its files.
+
+        Args:
+            day: Day the readings belong to
+            frame: Long-format readings for [day, day + 1)
+        """
+        pa = self._pyarrow()
+        manifest = dict(self.manifest())
+        groups = int(manifest.get("groups", settings.ARCHIVE_SENSOR_GROUPS))
+        key = day.isoformat()
+
+        uuids = frame.columns["uuid"].astype(str)
+        timestamps = frame.columns["timestamp"].astype("datetime64[us]")
+        values = frame.columns["value"].astype(np.float64)
+        group_of = {u: sensor_group(u, groups) for u in dict.fromkeys(uuids.tolist())}
+        group_ids = np.array([group_of[u] for u in uuids.tolist()], dtype=np.int64)
+
+        written = []
+        for group in sorted(set(group_of.values())):
+            mask = group_ids == group
+            order = np.lexsort((timestamps[mask], uuids[mask]))
+            table = pa.table({
+                "uuid": pa.array(uuids[mask][order], type=pa.string()),
+                "timestamp": pa.array(timestamps[mask][order], type=pa.timestamp("us")),
+                "value": pa.array(values[mask][order], type=pa.float64()),
+            })
+            path = self._part_path(key, group)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            pa.parquet.write_table(
+                table, tmp,
+                compression=settings.ARCHIVE_COMPRESSION,
+                row_group_size=settings.ARCHIVE_ROW_GROUP_SIZE
+            )
+            os.replace(tmp, path)
+            written.append(group)
+
+        entry = {
+            "rows": int(len(frame)),
+            "sensors": len(group_of),
+            "groups": written,
+            "exported_at": datetime.utcnow().isoformat() + "Z",
+        }
+        days = dict(manifest.get("days", {}))
+        days[key] = entry
+        manifest.update({"groups": groups, "days": days})
+        self._save_manifest(manifest)
+        self.metrics["days_exported"] += 1
+        logger.info(f"🗄️  Archived {key}: {entry['rows']} readings, {entry['sensors']} sensors in {len(written)} file(s)")
+        return entry
+
+    # ==================== Read ====================
+
+    def read(self, uuids: List[str], start: datetime, end: datetime) -> SeriesFrame:
+        """Raw readings for uuids in [start, end) from the archived days"""
+        pa = self._pyarrow()
+        manifest = self.manifest()
+        groups = int(manifest.get("groups", settings.ARCHIVE_SENSOR_GROUPS))
+        wanted = {sensor_group(u, groups) for u in uuids}
+
+        files = []
+        day = start.date()
+        while datetime.combine(day, datetime.min.time()) < end:
+            entry = manifest.get("days", {}).get(day.isoformat())
+            if entry:
+                files.extend(
+                    self._part_path(day.isoformat(), g) for g in entry.get("groups", []) if g in wanted
+                )
+            day += timedelta(days=1)
+        if not files or not uuids:
+            return SeriesFrame()
+
+        field = pa.dataset.field
+        dataset = pa.dataset.dataset(files, format="parquet")
+        table = dataset.to_table(
+            columns=["timestamp", "uuid", "value"],
+            filter=(
+                field("uuid").isin(list(uuids))
+                & (field("timestamp") >= pa.scalar(start, type=pa.timestamp("us")))
+                & (field("timestamp") < pa.scalar(end, type=pa.timestamp("us")))
+            )
+        )
+        self.metrics["reads"] += 1
+        self.metrics["files_read"] += len(files)
+        self.metrics["rows_read"] += table.num_rows
+        return SeriesFrame({
+            "timestamp": table.column("timestamp").to_numpy(),
+            "uuid": table.column("uuid").to_numpy(zero_copy_only=False).astype(object),
+            "value": table.column("value").to_numpy(zero_copy_only=False).astype(np.float64),
+        })
+
+    def fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int) -> SeriesFrame:
+        """
+        Read a plan's window in the same shape as the SQL fetch paths (blocking)
+
+        Raw plans return the newest row_limit readings, newest first; bucketed
+        plans are aggregated here into the plan's buckets.
+        """
+        if plan.is_raw:
+            frame = self.read(uuids, plan.start, plan.end).sort_by_time(descending=True)
+            return frame.head(row_limit) if len(frame) > row_limit else frame
+        return aggregate_buckets(self.read(uuids, plan.start, plan.end), plan.bucket_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        coverage = self.coverage()
+        return {
+            "enabled": self.enabled,
+            "days": len(self.manifest().get("days", {})) if self.enabled else 0,
+            "coverage": [c.isoformat() for c in coverage] if coverage else None,
+            **self.metrics,
+        }
+
+
+# Global instance
+parquet_archive = ParquetArchive()
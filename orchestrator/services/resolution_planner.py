@@ -0,0 +1,125 @@
+"""
+Resolution Planner
+Chooses the time-bucket width for a time-series fetch.
+
+Short windows are read as raw rows. Longer windows are aggregated in the
+database into fixed-width buckets (avg/min/max/count/last per sensor) so a
+"last month" question returns a bounded number of rows that still cover the
+whole range, instead of the newest N raw readings.
+"""
+import sys
+sys.path.append('/app')
+
+import re
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from shared.config import settings
+
+# Bucket widths (seconds) the planner may choose from, smallest first
+BUCKET_WIDTHS = (60, 300, 900, 1800, 3600, 10800, 21600, 43200, 86400, 604800)
+
+# Aggregates returned per bucket; 'value' carries the average
+BUCKET_AGGREGATES = ("avg", "min", "max", "count", "last")
+
+RAW_REQUEST_RE = re.compile(r"\b(raw|every reading|all readings|individual readings|each reading)\b")
+
+
+@dataclass
+class ResolutionPlan:
+    """Fetch resolution for one [start, end) window"""
+    start: datetime
+    end: datetime
+    bucket_seconds: Optional[int] = None
+
+    @property
+    def is_raw(self) -> bool:
+        return self.bucket_seconds is None
+
+    @property
+    def expected_points(self) -> Optional[int]:
+        """Upper bound on buckets per sensor (None for raw fetches)"""
+        if self.is_raw:
+            return None
+        span = (self.end - self.start).total_seconds()
+        return int(span) // self.bucket_seconds + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": "raw" if self.is_raw else "bucketed",
+            "bucket_seconds": self.bucket_seconds,
+            "aggregates": [] if self.is_raw else list(BUCKET_AGGREGATES),
+            "expected_points": self.expected_points,
+        }
+
+
+def align_down(ts: datetime, bucket_seconds: int) -> datetime:
+    """Floor a naive datetime to a bucket boundary (epoch-aligned)"""
+    epoch = datetime(1970, 1, 1)
+    seconds = int((ts - epoch).total_seconds())
+    return epoch + timedelta(seconds=seconds - seconds % bucket_seconds)
+
+
+def wants_raw(user_query: str) -> bool:
+    """Whether the user explicitly asked for individual readings"""
+    return bool(RAW_REQUEST_RE.search((user_query or "").lower()))
+
+
+def plan_resolution(
+    start: datetime,
+    end: datetime,
+    target_points: Optional[int] = None,
+    raw_window_hours: Optional[float] = None,
+    force_raw: bool = False
+) -> ResolutionPlan:
+    """
+    Pick raw rows or a bucket width for a window
+
+    Args:
+        start: Inclusive lower bound
+        end: Exclusive upper bound
+        target_points: Desired points per sensor (defaults to SQL_TARGET_POINTS)
+        raw_window_hours: Windows up to this length are fetched raw (defaults to SQL_RAW_WINDOW_HOURS)
+        force_raw: Always fetch raw rows
+
+    Returns:
+        ResolutionPlan (bucket_seconds=None means raw)
+    """
+    target_points = target_points or settings.SQL_TARGET_POINTS
+    if raw_window_hours is None:
+        raw_window_hours = settings.SQL_RAW_WINDOW_HOURS
+    span = (end - start).total_seconds()
+
+    if force_raw or span <= raw_window_hours * 3600:
+        return ResolutionPlan(start=start, end=end)
+
+    ideal = span / max(1, target_points)
+    bucket = next((w for w in BUCKET_WIDTHS if w >= ideal), BUCKET_WIDTHS[-1])
+    # Buckets are epoch-aligned in SQL; the window itself is not widened, so the
+    # first and last buckets may be partial (their 'count' says so)
+    return ResolutionPlan(start=start, end=end, bucket_seconds=bucket)
+
+
+def split_at_coverage(
+    plan: ResolutionPlan,
+    coverage: Optional[Tuple[datetime, datetime]]
+) -> Tuple[Optional[ResolutionPlan], Optional[ResolutionPlan]]:
+    """
+    Split a plan at the end of a store's [low, high) coverage
+
+    Used to read the older part of a window from a secondary store (narrow
+    table, Parquet archive) and the newer rest from the primary one. For
+    bucketed plans the split falls on a bucket boundary so no bucket spans
+    both stores.
+
+    Returns:
+        (covered part or None, remaining newer part or None)
+    """
+    if not coverage or not (coverage[0] <= plan.start < coverage[1]):
+        return None, plan
+    split = min(plan.end, coverage[1])
+    if not plan.is_raw:
+        split = max(plan.start, align_down(split, plan.bucket_seconds))
+    covered = replace(plan, end=split) if split > plan.start else None
+    rest = replace(plan, start=split) if split < plan.end else None
+    return covered, rest
@@ -0,0 +1,447 @@
+"""
+Result Renderer Service
+Deterministic, template-based rendering of small or tabular SPARQL/SQL results.
+Avoids an LLM round-trip for the common answer shapes; callers fall back to the
+LLM only when a result is too complex or the persona needs a narrative answer.
+"""
+import sys
+sys.path.append('/app')
+
+import re
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from shared.utils import get_logger
+from shared.config import settings
+
+logger = get_logger(__name__)
+
+BLDG_NS = "http://abacwsbuilding.cardiff.ac.uk/abacws#"
+
+NAMESPACES = (
+    (BLDG_NS, ""),
+    ("https://brickschema.org/schema/Brick#", "brick:"),
+    ("http://www.w3.org/1999/02/22-rdf-syntax-ns#", "rdf:"),
+    ("http://www.w3.org/2000/01/rdf-schema#", "rdfs:"),
+    ("https://brickschema.org/schema/Brick/ref#", "ref:"),
+    ("https://w3id.org/rec#", "rec:"),
+)
+
+# Variable-name hints used to recognise the role of a SPARQL binding column
+ENTITY_HINTS = ("sensor", "point", "entity", "equipment", "device", "s", "subject", "instance")
+LOCATION_HINTS = ("location", "room", "zone", "space", "floor")
+LABEL_HINTS = ("label", "name")
+UUID_HINTS = ("uuid", "id", "timeseries", "connstring")
+# A single value is a result count only when the whole name says so (not ?totalArea, ?numberOfFloors)
+COUNT_NAMES = ("count", "total", "num", "number", "n")
+
+
+def name_tokens(var: str) -> List[str]:
+    """Lower-case words of a variable name (camelCase, snake_case, digits)"""
+    return [t.lower() for t in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", var)]
+
+
+def has_hint(var: str, hints) -> bool:
+    """Whether a hint is one of the name's words, or (3+ letters) a prefix of the name"""
+    tokens = name_tokens(var)
+    name = var.lower()
+    return any(h in tokens or (len(h) > 2 and name.startswith(h)) for h in hints)
+
+
+class ResultRenderer:
+    """Renders query results with fixed templates instead of an LLM call"""
+
+    def __init__(self):
+        self.labels_by_uuid: Dict[str, str] = {}
+        self.labels_by_uri: Dict[str, str] = {}
+
+    # ==================== Label Resolution ====================
+
+    def load_sensor_map(self, sensor_map: Dict[str, Dict[str, Any]]):
+        """
+        Index human labels from the cached sensor map (data/sensor_map.json).
+
+        Args:
+            sensor_map: Mapping of name/label/uri -> {uri, uuid, storage, label}
+        """
+        for entry in sensor_map.values():
+            if not isinstance(entry, dict):
+                continue
+            label = entry.get("label")
+            if not label:
+                continue
+            if entry.get("uuid"):
+                self.labels_by_uuid[entry["uuid"]] = label
+            if entry.get("uri"):
+                self.labels_by_uri[entry["uri"]] = label
+        logger.info(f"Result renderer indexed {len(self.labels_by_uuid)} sensor labels")
+
+    def label_for(self, value: str, metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Return a human-readable label for a UUID or IRI"""
+        if metadata and value in metadata and metadata[value].get("label"):
+            return metadata[value]["label"]
+        if value in self.labels_by_uuid:
+            return self.labels_by_uuid[value]
+        if value in self.labels_by_uri:
+            return self.labels_by_uri[value]
+        return self._compact(value).replace("_", " ")
+
+    def _compact(self, value: str) -> str:
+        """Strip known namespaces from an IRI"""
+        for ns, prefix in NAMESPACES:
+            if value.startswith(ns):
+                return prefix + value[len(ns):]
+        return value
+
+    # ==================== Routing ====================
+
+    def needs_narrative(self, persona: Optional[str]) -> bool:
+        """Whether the persona is configured to always receive an LLM narrative"""
+        if not persona:
+            return False
+        personas = [p.strip() for p in settings.RENDER_NARRATIVE_PERSONAS.split(",") if p.strip()]
+        return persona in personas
+
+    # ==================== SPARQL ====================
+
+    def render_sparql(
+        self,
+        bindings: List[Dict[str, Any]],
+        user_query: str,
+        persona: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Render deduplicated SPARQL bindings.
+
+        Args:
+            bindings: SPARQL JSON bindings (already deduplicated)
+            user_query: Original user question
+            persona: User persona
+
+        Returns:
+            Rendered markdown, or None when the LLM should format the result
+        """
+        if not settings.DETERMINISTIC_RENDERING or self.needs_narrative(persona):
+            return None
+        if not bindings:
+            return "No results found for your query."
+
+        variables = list(dict.fromkeys(var for b in bindings for var in b))
+        if len(variables) > settings.RENDER_MAX_COLUMNS:
+            return None
+
+        rows = [{var: b[var] for var in b} for b in bindings]
+
+        if len(rows) == 1 and len(variables) == 1:
+            return self._render_single_value(variables[0], rows[0][variables[0]], user_query)
+
+        roles = self._classify_variables(variables, rows)
+        if roles["other"]:
+            # Unknown columns carry meaning we cannot template reliably
+            return None
+
+        if roles["location"] and roles["entity"]:
+            return self._render_location_table(rows, roles, user_query)
+        if roles["entity"] or roles["label"]:
+            return self._render_entity_list(rows, roles, user_query)
+        return None
+
+    def _classify_variables(self, variables: List[str], rows: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Assign each variable a role based on its name and value type"""
+        roles = {"entity": [], "location": [], "label": [], "uuid": [], "other": []}
+        for var in variables:
+            name = var.lower()
+            sample = next((r[var] for r in rows if var in r), {})
+            is_uri = sample.get("type") == "uri"
+            if has_hint(var, UUID_HINTS):
+                roles["uuid"].append(var)
+            elif has_hint(var, LABEL_HINTS) and not is_uri:
+                roles["label"].append(var)
+            elif has_hint(var, LOCATION_HINTS):
+                roles["location"].append(var)
+            elif is_uri or name in ENTITY_HINTS or has_hint(var, [h for h in ENTITY_HINTS if len(h) > 1]):
+                roles["entity"].append(var)
+            else:
+                roles["other"].append(var)
+        if not roles["entity"] and roles["location"]:
+            # e.g. "list all rooms" - the location itself is the entity
+            roles["entity"], roles["location"] = roles["location"], []
+        return roles
+
+    def _binding_text(self, binding: Optional[Dict[str, Any]]) -> str:
+        if not binding:
+            return "N/A"
+        value = binding.get("value", "N/A")
+        if binding.get("type") == "uri":
+            return self.label_for(value)
+        return value
+
+    def _render_single_value(self, var: str, binding: Dict[str, Any], user_query: str) -> str:
+        value = self._binding_text(binding)
+        tokens = name_tokens(var)
+        if var.lower() in COUNT_NAMES or (tokens and "count" in (tokens[0], tokens[-1])):
+            return f"There are **{value}** matching results."
+        readable = " ".join(tokens) or var
+        return f"The {readable} is **{value}**."
+
+    def _entity_title(self, row: Dict[str, Any], roles: Dict[str, List[str]]) -> str:
+        for var in roles["label"]:
+            if var in row:
+                return row[var].get("value", "N/A")
+        for var in roles["entity"]:
+            if var in row:
+                return self._binding_text(row[var])
+        return "N/A"
+
+    def _render_entity_list(self, rows: List[Dict[str, Any]], roles: Dict[str, List[str]], user_query: str) -> str:
+        limit = self._row_limit(user_query)
+        lines = [f"I found **{len(rows)}** result(s):\n"]
+        for row in rows[:limit]:
+            title = self._entity_title(row, roles)
+            extras = [f"UUID: `{row[v]['value']}`" for v in roles["uuid"] if v in row]
+            suffix = f" ({', '.join(extras)})" if extras else ""
+            lines.append(f"• {title}{suffix}")
+        if len(rows) > limit:
+            lines.append(f"\n... and {len(rows) - limit} more results")
+        if roles["uuid"]:
+            lines.append("\nThe UUIDs above can be used to retrieve sensor data.")
+        return "\n".join(lines)
+
+    def _render_location_table(self, rows: List[Dict[str, Any]], roles: Dict[str, List[str]], user_query: str) -> str:
+        limit = self._row_limit(user_query)
+        headers = ["Sensor", "Location"] + (["UUID"] if roles["uuid"] else [])
+        lines = [
+            f"I found **{len(rows)}** result(s):\n",
+            "| " + " | ".join(headers) + " |",
+            "|" + "---|" * len(headers),
+        ]
+        for row in rows[:limit]:
+            cells = [
+                self._entity_title(row, roles),
+                ", ".join(self._binding_text(row.get(v)) for v in roles["location"] if v in row) or "N/A",
+            ]
+            if roles["uuid"]:
+                cells.append(next((f"`{row[v]['value']}`" for v in roles["uuid"] if v in row), "N/A"))
+            lines.append("| " + " | ".join(cells) + " |")
+        if len(rows) > limit:
+            lines.append(f"\n... and {len(rows) - limit} more results")
+        return "\n".join(lines)
+
+    def _row_limit(self, user_query: str) -> int:
+        uq = user_query.lower()
+        show_all = bool(re.search(r"\b(all|complete|full|everything|list)\b", uq))
+        return 100 if show_all else settings.RENDER_MAX_ROWS
+
+    # ==================== SQL ====================
+
+    def render_sql(
+        self,
+        rows: List[Dict[str, Any]],
+        user_query: str,
+        persona: Optional[str] = None,
+        sensor_metadata: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[str]:
+        """
+        Render SQL rows. Long-format time series (timestamp/uuid/value) are
+        summarised per sensor; other small tables are rendered verbatim.
+
+        Returns:
+            Rendered markdown, or None when the LLM should format the result
+        """
+        if not settings.DETERMINISTIC_RENDERING or self.needs_narrative(persona):
+            return None
+        if not rows:
+            return "No data found for your query."
+
+        columns = list(rows[0].keys())
+        if {"uuid", "value"}.issubset(columns):
+            uq = user_query.lower()
+            if any(k in uq for k in ["latest", "current", "now", "last reading", "most recent"]):
+                return self._render_latest_readings(rows, sensor_metadata)
+            return self._render_summary_stats(rows, sensor_metadata)
+
+        if len(rows) == 1 and len(columns) == 1:
+            return f"The {columns[0].replace('_', ' ')} is **{self._fmt(rows[0][columns[0]])}**."
+
+        if len(columns) > settings.RENDER_MAX_COLUMNS or len(rows) > settings.RENDER_MAX_ROWS:
+            return None
+        lines = [
+            f"Found **{len(rows)}** record(s):\n",
+            "| " + " | ".join(columns) + " |",
+            "|" + "---|" * len(columns),
+        ]
+        for row in rows:
+            lines.append("| " + " | ".join(self._fmt(row.get(c)) for c in columns) + " |")
+        return "\n".join(lines)
+
+    def _group_by_sensor(self, rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            grouped.setdefault(str(row.get("uuid")), []).append(row)
+        return grouped
+
+    def _render_latest_readings(self, rows: List[Dict[str, Any]], sensor_metadata: Optional[Dict[str, Dict[str, Any]]]) -> str:
+        lines = ["| Sensor | Latest Value | Time |", "|---|---|---|"]
+        for uuid, sensor_rows in self._group_by_sensor(rows).items():
+            latest = max(sensor_rows, key=lambda r: str(r.get("timestamp", "")))
+            # A bucket's newest reading is 'last'; 'value' is the bucket average
+            value = latest.get("last") if latest.get("last") is not None else latest.get("value")
+            lines.append(
+                f"| {self.label_for(uuid, sensor_metadata)} | **{self._fmt(value)}** | {self._fmt(latest.get('timestamp'))} |"
+            )
+        return "Latest readings:\n\n" + "\n".join(lines)
+
+    @staticmethod
+    def _reading_stats(rows: List[Dict[str, Any]]) -> Tuple[int, Optional[float], Optional[float], Optional[float]]:
+        """
+        Readings, mean, min and max of one sensor's rows
+
+        Bucketed rows (with 'count'/'min'/'max') stand for 'count' readings each:
+        the mean is count-weighted and the extremes come from the bucket envelopes.
+        """
+        number = lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)
+        rows = [r for r in rows if number(r.get("value"))]
+        if not rows:
+            return 0, None, None, None
+        if all(number(r.get("count")) and number(r.get("min")) and number(r.get("max")) for r in rows):
+            readings = int(sum(r["count"] for r in rows))
+            weighted = sum(float(r["value"]) * r["count"] for r in rows)
+            mean = weighted / readings if readings else None
+            return readings, mean, min(float(r["min"]) for r in rows), max(float(r["max"]) for r in rows)
+        values = [float(r["value"]) for r in rows]
+        return len(values), sum(values) / len(values), min(values), max(values)
+
+    def _render_summary_stats(self, rows: List[Dict[str, Any]], sensor_metadata: Optional[Dict[str, Dict[str, Any]]]) -> str:
+        lines = ["| Sensor | Readings | Mean | Min | Max | From | To |", "|---|---|---|---|---|---|---|"]
+        total = 0
+        for uuid, sensor_rows in self._group_by_sensor(rows).items():
+            readings, mean, low, high = self._reading_stats(sensor_rows)
+            total += readings
+            times = sorted(str(r.get("timestamp")) for r in sensor_rows if r.get("timestamp") is not None)
+            if mean is not None:
+                stats = [self._fmt(mean), self._fmt(low), self._fmt(high)]
+            else:
+                stats = ["N/A", "N/A", "N/A"]
+            lines.append(
+                f"| {self.label_for(uuid, sensor_metadata)} | {readings} | "
+                + " | ".join(stats)
+                + f" | {self._fmt(times[0]) if times else 'N/A'} | {self._fmt(times[-1]) if times else 'N/A'} |"
+            )
+        header = f"Retrieved **{total}** readings" + (f" in {len(rows)} time buckets" if "count" in rows[0] else "")
+        return header + ":\n\n" + "\n".join(lines)
+
+    def render_unavailable(self, uuids: List[str], sensor_metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Name the sensors whose data could not be fetched"""
+        names = [self.label_for(uuid, sensor_metadata) for uuid in dict.fromkeys(uuids)]
+        shown = ", ".join(names[:settings.RENDER_MAX_ROWS])
+        if len(names) > settings.RENDER_MAX_ROWS:
+            shown += f" and {len(names) - settings.RENDER_MAX_ROWS} more"
+        return f"⚠️ Data for {len(names)} sensor(s) could not be retrieved, so these results are incomplete: {shown}."
+
+    # ==================== Analytics ====================
+
+    def render_analytics(
+        self,
+        result: Dict[str, Any],
+        sensor_metadata: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> str:
+        """
+        Render a structured analytics engine result (AnalyticsResult.to_dict())
+
+        Returns:
+            Markdown table with the statistics the question asked about
+        """
+        operation = result.get("operation")
+        params = result.get("params", {})
+        rows = result.get("rows", [])
+        if not rows:
+            return "No data was available for this analysis."
+        label = lambda uuid: self.label_for(uuid, sensor_metadata)
+        note = "\n\n_Computed from time buckets; values are approximate._" if result.get("approximate") else ""
+
+        if operation == "correlation":
+            lines = ["| Sensor A | Sensor B | Correlation (r) | Points |", "|---|---|---|---|"]
+            for row in rows[:settings.RENDER_MAX_ROWS]:
+                lines.append(f"| {label(row['uuid_a'])} | {label(row['uuid_b'])} | **{self._fmt(row['r'])}** | {row['n']} |")
+            return f"Correlation on a {params.get('grid_seconds')}s grid:\n\n" + "\n".join(lines) + note
+
+        if operation == "threshold":
+            word = "below" if params.get("direction") == "below" else "above"
+            lines = [f"| Sensor | Times {word} {self._fmt(params.get('threshold'))} | Share | Approx. duration | First | Last | Extreme |",
+                     "|---|---|---|---|---|---|---|"]
+            for row in rows:
+                lines.append(
+                    f"| {label(row['uuid'])} | **{row['exceedances']}** of {row['total']} {row['unit']} | "
+                    f"{row['share'] * 100:.1f}% | {self._duration(row['duration_seconds'])} | "
+                    f"{self._fmt(row['first_at'])} | {self._fmt(row['last_at'])} | {self._fmt(row['extreme'])} |"
+                )
+            return "Threshold exceedance:\n\n" + "\n".join(lines) + note
+
+        if operation == "rolling":
+            window = self._duration(params.get("window_seconds", 0))
+            lines = ["| Sensor | Latest | Highest | At | Lowest | At |", "|---|---|---|---|---|---|"]
+            for row in rows:
+                lines.append(
+                    f"| {label(row['uuid'])} | **{self._fmt(row['latest'])}** | {self._fmt(row['max'])} | "
+                    f"{self._fmt(row['max_at'])} | {self._fmt(row['min'])} | {self._fmt(row['min_at'])} |"
+                )
+            return f"{window} rolling average:\n\n" + "\n".join(lines) + note
+
+        if operation == "resample":
+            stats = params.get("statistics") or ["mean"]
+            lines = ["| Sensor | Period | " + " | ".join(s.title() for s in stats) + " |", "|---|---|" + "---|" * len(stats)]
+            for row in rows[:settings.RENDER_MAX_ROWS * 4]:
+                lines.append(
+                    f"| {label(row['uuid'])} | {self._fmt(row.get('local_start', row['timestamp']))} | "
+                    + " | ".join(self._fmt(row[s]) for s in stats) + " |"
+                )
+            more = len(rows) - settings.RENDER_MAX_ROWS * 4
+            tail = f"\n\n…and {more} more period(s)." if more > 0 else ""
+            return f"{self._duration(params.get('bucket_seconds', 0))} summary:\n\n" + "\n".join(lines) + tail + note
+
+        # Summary / percentile: requested statistics first, then context columns
+        percentiles = [f"p{p:g}" for p in params.get("percentiles", [])]
+        stats = [s for s in params.get("statistics", []) if s in ("mean", "min", "max", "latest", "count")]
+        if not stats and not percentiles:
+            stats = ["mean", "min", "max", "count"]
+        headers = {"mean": "Mean", "min": "Min", "max": "Max", "latest": "Latest", "count": "Readings"}
+        columns = stats + percentiles
+        lines = [
+            "| Sensor | " + " | ".join(headers.get(c, c.upper()) for c in columns) + " | From | To |",
+            "|---|" + "---|" * (len(columns) + 2),
+        ]
+        for row in rows:
+            cells = []
+            for c in columns:
+                cell = f"**{self._fmt(row[c])}**" if c != "count" else str(row[c])
+                if c in ("min", "max", "latest"):
+                    cell += f" ({self._fmt(row[c + '_at'])})"
+                cells.append(cell)
+            lines.append(f"| {label(row['uuid'])} | " + " | ".join(cells) + f" | {self._fmt(row['from'])} | {self._fmt(row['to'])} |")
+        return "\n".join(lines) + note
+
+    def _duration(self, seconds: float) -> str:
+        seconds = int(seconds or 0)
+        for unit, size in (("week", 604800), ("day", 86400), ("hour", 3600), ("minute", 60)):
+            if seconds >= size and seconds % size == 0:
+                n = seconds // size
+                return f"{n} {unit}{'s' if n != 1 else ''}"
+        if seconds >= 3600:
+            return f"{seconds / 3600:.1f} hours"
+        return f"{seconds // 60} min" if seconds >= 60 else f"{seconds}s"
+
+    def _fmt(self, value: Any) -> str:
+        """Format a scalar for display"""
+        if value is None:
+            return "N/A"
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        text = str(value)
+        if "T" in text and len(text) >= 19 and text[4] == "-":
+            return text[:19].replace("T", " ")
+        return self._compact(text)
+
+
+# Global instance
+result_renderer = ResultRenderer()
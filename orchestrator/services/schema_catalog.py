@@ -0,0 +1,208 @@
+"""
+Schema Catalog Service
+Cached, change-aware view of the time-series database schema.
+
+The full column list is read once from information_schema (a single query
+instead of SHOW TABLES + DESCRIBE per table) and cached in memory and Redis.
+A cheap fingerprint query (per-table column count and CREATE_TIME) decides
+when the cache is stale. Prompts get a compact summary that lists only the
+sensor columns relevant to the current request.
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import re
+import time
+from typing import Dict, Any, List, Optional
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.mysql_manager import mysql_manager
+from orchestrator.redis_manager import redis_manager
+
+logger = get_logger(__name__)
+
+UUID_COLUMN_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+COLUMNS_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = %s
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+FINGERPRINT_QUERY = """
+SELECT t.TABLE_NAME, t.CREATE_TIME, COUNT(c.COLUMN_NAME)
+FROM information_schema.TABLES t
+LEFT JOIN information_schema.COLUMNS c
+  ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME
+WHERE t.TABLE_SCHEMA = %s
+GROUP BY t.TABLE_NAME, t.CREATE_TIME
+ORDER BY t.TABLE_NAME
+"""
+
+
+def _detect_timestamp_column(columns: List[List[str]]) -> Optional[str]:
+    """Pick the first datetime-like column (same rules the SQL agent has always used)"""
+    for name, col_type in columns:
+        name_lower = name.lower()
+        type_lower = str(col_type).lower()
+        if 'datetime' in name_lower or 'timestamp' in name_lower or 'date' in type_lower or 'time' in type_lower:
+            return name
+    return None
+
+
+class SchemaCatalog:
+    """In-memory + Redis cache of table/column metadata"""
+
+    def __init__(self):
+        self.database = settings.MYSQL_DATABASE
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.fingerprint: Optional[List[List[Any]]] = None
+        self._column_sets: Dict[str, set] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return f"cache:schema_catalog:{self.database}"
+
+    # ==================== Loading ====================
+
+    async def _fetch_fingerprint(self) -> List[List[Any]]:
+        rows = await mysql_manager.fetch_all(FINGERPRINT_QUERY, (self.database,), dict_rows=False)
+        return [[name, str(created), int(count)] for name, created, count in rows]
+
+    async def _introspect(self, fingerprint: List[List[Any]]):
+        start = time.time()
+        rows = await mysql_manager.fetch_all(COLUMNS_QUERY, (self.database,), dict_rows=False)
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table_name, col_name, col_type in rows:
+            if isinstance(col_type, bytes):
+                col_type = col_type.decode('utf-8')
+            tables.setdefault(table_name, {"columns": []})["columns"].append([col_name, col_type])
+        for info in tables.values():
+            info["timestamp_column"] = _detect_timestamp_column(info["columns"])
+            info["uuid_column_count"] = sum(1 for name, _ in info["columns"] if UUID_COLUMN_RE.match(name))
+        self._set(tables, fingerprint)
+        logger.info(f"📚 Introspected schema for {len(tables)} tables in {time.time() - start:.2f}s")
+        await redis_manager.set_cache(
+            self.cache_key,
+            {"tables": tables, "fingerprint": fingerprint},
+            ttl=settings.SCHEMA_CATALOG_TTL
+        )
+
+    def _set(self, tables: Dict[str, Dict[str, Any]], fingerprint: List[List[Any]]):
+        self.tables = tables
+        self.fingerprint = fingerprint
+        self._column_sets = {name: {c[0] for c in info["columns"]} for name, info in tables.items()}
+
+    async def refresh(self, force: bool = False):
+        """
+        Make sure the catalog is current.
+
+        Checks the fingerprint at most every SCHEMA_CHECK_INTERVAL seconds and
+        only re-reads column metadata when it changed.
+        """
+        if not force and self.tables and time.time() - self._checked_at < settings.SCHEMA_CHECK_INTERVAL:
+            return
+        async with self._lock:
+            if not force and self.tables and time.time() - self._checked_at < settings.SCHEMA_CHECK_INTERVAL:
+                return
+            fingerprint = await self._fetch_fingerprint()
+            self._checked_at = time.time()
+            if not force and self.tables and fingerprint == self.fingerprint:
+                return
+            if not force:
+                cached = await redis_manager.get_cache(self.cache_key)
+                if cached and cached.get("fingerprint") == fingerprint:
+                    self._set(cached["tables"], fingerprint)
+                    logger.info(f"📚 Loaded schema catalog from Redis ({len(self.tables)} tables)")
+                    return
+            if self.fingerprint is not None:
+                logger.info("Schema change detected, re-reading column metadata")
+            await self._introspect(fingerprint)
+
+    # ==================== Lookups ====================
+
+    def has_table(self, table: str) -> bool:
+        return table in self.tables
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self._column_sets.get(table, ())
+
+    def column_set(self, table: str) -> Optional[set]:
+        """Column names of a table, or None if the table is unknown"""
+        return self._column_sets.get(table)
+
+    def timestamp_column(self, table: str) -> Optional[str]:
+        info = self.tables.get(table)
+        return info.get("timestamp_column") if info else None
+
+    def is_wide(self, table: str) -> bool:
+        """Whether the table stores one column per sensor UUID"""
+        info = self.tables.get(table)
+        return bool(info) and info.get("uuid_column_count", 0) >= settings.SCHEMA_WIDE_TABLE_MIN_UUIDS
+
+    # ==================== Prompt Summary ====================
+
+    async def describe(self, target_uuids: Optional[List[str]] = None) -> str:
+        """
+        Compact schema summary for LLM prompts
+
+        Args:
+            target_uuids: Sensor UUIDs relevant to the request; for wide tables
+                only these UUID columns are listed
+
+        Returns:
+            Schema text
+        """
+        await self.refresh()
+        targets = list(dict.fromkeys(target_uuids or []))
+        schema_info = "Database Schema:\n\n"
+        timestamp_col_detected = None
+
+        for table_name, info in self.tables.items():
+            schema_info += f"Table: {table_name}\n"
+            columns = info["columns"]
+            if self.is_wide(table_name):
+                for col_name, col_type in columns:
+                    if not UUID_COLUMN_RE.match(col_name):
+                        schema_info += f"  - {col_name} ({col_type})\n"
+                uuid_total = info.get("uuid_column_count", 0)
+                if targets:
+                    present = [u for u in targets if self.has_column(table_name, u)]
+                    missing = [u for u in targets if u not in present]
+                    schema_info += f"  - {uuid_total} sensor UUID columns (DOUBLE); relevant to this request:\n"
+                    for u in present:
+                        schema_info += f"    - `{u}`\n"
+                    if missing:
+                        schema_info += f"  - NOT present in this table: {', '.join(missing)}\n"
+                else:
+                    sample = [c[0] for c in columns if UUID_COLUMN_RE.match(c[0])][:5]
+                    schema_info += f"  - {uuid_total} sensor UUID columns, e.g. {', '.join(f'`{u}`' for u in sample)}\n"
+            else:
+                for col_name, col_type in columns:
+                    schema_info += f"  - {col_name} ({col_type})\n"
+            if not timestamp_col_detected:
+                timestamp_col_detected = info.get("timestamp_column")
+            schema_info += "\n"
+
+        # Add critical note about timestamp column
+        if timestamp_col_detected:
+            schema_info += f"\n⚠️  CRITICAL: The timestamp column is named '{timestamp_col_detected}' (case-sensitive).\n"
+            schema_info += f"    Always use '{timestamp_col_detected}' in SELECT, WHERE, and ORDER BY clauses.\n"
+            schema_info += f"    You can alias it as 'timestamp' in SELECT (e.g., '{timestamp_col_detected} AS timestamp').\n"
+
+        return schema_info
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tables": len(self.tables),
+            "columns": sum(len(info["columns"]) for info in self.tables.values()),
+            "last_checked": self._checked_at or None,
+        }
+
+
+# Global instance
+schema_catalog = SchemaCatalog()
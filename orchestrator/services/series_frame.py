@@ -0,0 +1,219 @@
+"""
+Series Frame
+Columnar container for long-format sensor readings (timestamp, uuid, value).
+
+Columns are typed numpy arrays (timestamp: datetime64[us], uuid: object,
+numeric columns: float64). Fetch paths build and merge frames column-wise;
+conversion to a list of JSON records happens only where a caller needs it.
+"""
+import sys
+sys.path.append('/app')
+
+import numpy as np
+from typing import Dict, Any, List, Optional, Iterable, Sequence
+
+BASE_COLUMNS = ("timestamp", "uuid", "value")
+TIMESTAMP_DTYPE = "datetime64[us]"
+# Numeric columns emitted as integers in records
+INTEGER_COLUMNS = ("count",)
+
+
+def _empty(name: str) -> np.ndarray:
+    if name == "timestamp":
+        return np.empty(0, dtype=TIMESTAMP_DTYPE)
+    if name == "uuid":
+        return np.empty(0, dtype=object)
+    return np.empty(0, dtype=np.float64)
+
+
+def _filler(name: str, n: int, like: Optional[np.ndarray] = None) -> np.ndarray:
+    """Missing-value column of length n"""
+    if name == "timestamp":
+        return np.full(n, np.datetime64("NaT"), dtype=TIMESTAMP_DTYPE)
+    if name == "uuid" or (like is not None and like.dtype == object):
+        return np.full(n, None, dtype=object)
+    return np.full(n, np.nan)
+
+
+def as_column(name: str, values: Any) -> np.ndarray:
+    """Coerce values (list or array) into the typed array for a column"""
+    if isinstance(values, np.ndarray):
+        if name == "timestamp" and values.dtype != np.dtype(TIMESTAMP_DTYPE):
+            try:
+                return values.astype(TIMESTAMP_DTYPE)
+            except (TypeError, ValueError):
+                return values
+        return values
+    values = list(values)
+    if name == "uuid":
+        return np.array(values, dtype=object)
+    dtype = TIMESTAMP_DTYPE if name == "timestamp" else np.float64
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object)
+
+
+class SeriesFrame:
+    """Column-oriented time-series readings"""
+
+    def __init__(self, columns: Optional[Dict[str, Any]] = None):
+        self.columns: Dict[str, np.ndarray] = {name: _empty(name) for name in BASE_COLUMNS}
+        if columns:
+            for name, values in columns.items():
+                self.columns[name] = as_column(name, values)
+        self.truncated = False
+        # UUIDs whose fetch failed (the frame is then also truncated)
+        self.failed_uuids: List[str] = []
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "SeriesFrame":
+        """Build a frame from timestamp/uuid/value dict records"""
+        records = list(records)
+        names = list(BASE_COLUMNS)
+        names.extend(k for k in (records[0].keys() if records else []) if k not in BASE_COLUMNS)
+        return cls({name: [r.get(name) for r in records] for name in names})
+
+    @classmethod
+    def from_wide(
+        cls,
+        columns: Dict[str, np.ndarray],
+        uuids: Sequence[str],
+        fields: Optional[Dict[str, str]] = None
+    ) -> "SeriesFrame":
+        """
+        Unpivot wide column arrays (timestamp + per-UUID columns) into a long frame
+
+        Args:
+            columns: Column arrays including 'timestamp'
+            uuids: UUIDs whose columns to unpivot
+            fields: Output column -> source column suffix; rows are kept where the
+                'value' source is not NULL (default {"value": ""}: column named after the UUID)
+        """
+        fields = fields or {"value": ""}
+        timestamps = as_column("timestamp", columns.get("timestamp", []))
+        parts = []
+        for u in uuids:
+            value = columns.get(u + fields["value"])
+            if value is None:
+                continue
+            value = as_column("value", value)
+            mask = ~np.isnan(value) if value.dtype != object else np.array([v is not None for v in value], dtype=bool)
+            n = int(mask.sum())
+            if not n:
+                continue
+            part = {"timestamp": timestamps[mask], "uuid": np.full(n, u, dtype=object)}
+            for out, suffix in fields.items():
+                source = columns.get(u + suffix)
+                part[out] = as_column(out, source)[mask] if source is not None else _filler(out, n)
+            parts.append(cls(part))
+        return cls.concat(parts)
+
+    @classmethod
+    def concat(cls, frames: Iterable["SeriesFrame"]) -> "SeriesFrame":
+        """Concatenate frames column-wise (missing columns are filled with NaN/None)"""
+        frames = [f for f in frames if f is not None]
+        names: List[str] = list(BASE_COLUMNS)
+        for f in frames:
+            names.extend(n for n in f.columns if n not in names)
+        merged = cls()
+        for name in names:
+            like = next((f.columns[name] for f in frames if name in f.columns), None)
+            pieces = [f.columns[name] if name in f.columns else _filler(name, len(f), like) for f in frames]
+            merged.columns[name] = np.concatenate(pieces) if pieces else _empty(name)
+        merged.truncated = any(f.truncated for f in frames)
+        merged.failed_uuids = [u for f in frames for u in f.failed_uuids]
+        return merged
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def head(self, n: int) -> "SeriesFrame":
+        """First n rows"""
+        frame = SeriesFrame({name: values[:n] for name, values in self.columns.items()})
+        frame.truncated = self.truncated or n < len(self)
+        frame.failed_uuids = list(self.failed_uuids)
+        return frame
+
+    def take(self, mask: np.ndarray) -> "SeriesFrame":
+        """Rows selected by a boolean mask or index array"""
+        frame = SeriesFrame({name: values[mask] for name, values in self.columns.items()})
+        frame.truncated = self.truncated
+        frame.failed_uuids = list(self.failed_uuids)
+        return frame
+
+    def sort_by_time(self, descending: bool = False) -> "SeriesFrame":
+        """Rows ordered by timestamp (stable, so per-UUID order is kept for ties)"""
+        order = np.argsort(self.columns["timestamp"], kind="stable")
+        return self.take(order[::-1] if descending else order)
+
+    @property
+    def uuids(self) -> List[str]:
+        return list(dict.fromkeys(self.columns["uuid"].tolist()))
+
+    @property
+    def nbytes(self) -> int:
+        """In-memory payload size of the column arrays"""
+        return sum(values.nbytes for values in self.columns.values())
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Row-wise dict records with ISO timestamps and None for missing values (JSON boundary)"""
+        names = list(self.columns)
+        lists = []
+        for name in names:
+            values = self.columns[name]
+            if values.dtype.kind == "M":
+                values = values.astype(TIMESTAMP_DTYPE)
+                valid = values[~np.isnat(values)]
+                unit = "us" if (valid.astype(np.int64) % 1_000_000).any() else "s"
+                text = np.datetime_as_string(values, unit=unit)
+                lists.append([None if t == "NaT" else t for t in text.tolist()])
+            elif values.dtype.kind == "f":
+                out = values.astype(object)
+                out[np.isnan(values)] = None
+                if name in INTEGER_COLUMNS:
+                    out = [None if v is None else int(v) for v in out.tolist()]
+                    lists.append(out)
+                else:
+                    lists.append(out.tolist())
+            else:
+                lists.append(values.tolist())
+        return [dict(zip(names, row)) for row in zip(*lists)]
+
+
+def aggregate_buckets(frame: SeriesFrame, bucket_seconds: int) -> SeriesFrame:
+    """
+    Aggregate raw readings into epoch-aligned buckets per UUID
+
+    Produces the same shape as a bucketed SQL fetch: 'value' is the average,
+    plus min/max/count and 'last' (the newest reading in the bucket).
+
+    Args:
+        frame: Raw readings (timestamp, uuid, value)
+        bucket_seconds: Bucket width
+
+    Returns:
+        One row per (uuid, bucket), ordered by uuid then bucket
+    """
+    value = frame.columns["value"].astype(np.float64)
+    keep = ~np.isnan(value) & ~np.isnat(frame.columns["timestamp"])
+    seconds = frame.columns["timestamp"][keep].astype("datetime64[s]").astype(np.int64)
+    value = value[keep]
+    names, codes = np.unique(frame.columns["uuid"][keep].astype(str), return_inverse=True)
+    if not len(value):
+        return SeriesFrame({name: _empty(name) for name in ("min", "max", "count", "last")})
+
+    buckets = seconds - seconds % bucket_seconds
+    order = np.lexsort((seconds, buckets, codes))
+    codes, buckets, value = codes[order], buckets[order], value[order]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])])
+    counts = np.diff(np.r_[starts, len(value)])
+    return SeriesFrame({
+        "timestamp": buckets[starts].astype("datetime64[s]"),
+        "uuid": names[codes[starts]].astype(object),
+        "value": np.add.reduceat(value, starts) / counts,
+        "min": np.minimum.reduceat(value, starts),
+        "max": np.maximum.reduceat(value, starts),
+        "count": counts.astype(np.float64),
+        "last": value[starts + counts - 1],
+    })
@@ -0,0 +1,279 @@
+"""
+SQL Builder Service
+Deterministic SQL for UUID time-series fetches.
+
+Replaces LLM-written UNION ALL queries for the common "give me readings for
+these sensors" path. Identifiers are quoted safely, time bounds and UUID
+literals are bound parameters, and the wide sensor table is read with a
+single range scan that selects only the requested UUID columns (unpivoted
+client-side) instead of one sub-select per sensor. Long windows are
+aggregated server-side into time buckets (see resolution_planner). When the
+narrow (uuid, Datetime, value) table exists, reads go through its
+(uuid, Datetime) primary key instead.
+"""
+import sys
+sys.path.append('/app')
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from shared.utils import get_logger
+from orchestrator.services.series_frame import SeriesFrame
+
+logger = get_logger(__name__)
+
+DIALECTS = ("mysql", "postgres")
+
+
+def quote_identifier(name: str, dialect: str = "mysql") -> str:
+    """Quote a table/column identifier for the given SQL dialect"""
+    if dialect == "postgres":
+        return '"' + name.replace('"', '""') + '"'
+    return "`" + name.replace("`", "``") + "`"
+
+
+@dataclass
+class BuiltQuery:
+    """A parameterised statement plus what it covers"""
+    sql: str
+    params: List[Any]
+    uuids: List[str]
+    missing: List[str] = field(default_factory=list)
+    # "wide": one value column per UUID (unpivoted by frame_from_columns); "long": timestamp/uuid/value rows
+    shape: str = "long"
+    dialect: str = "mysql"
+    limit: Optional[int] = None
+    # Set for time-bucketed aggregates (columns '<uuid>__avg', '__min', '__max', '__count', '__last')
+    bucket_seconds: Optional[int] = None
+
+
+class TimeSeriesQueryBuilder:
+    """Builds time-series fetch statements for one storage backend"""
+
+    def __init__(self, dialect: str = "mysql"):
+        if dialect not in DIALECTS:
+            raise ValueError(f"Unsupported SQL dialect: {dialect}")
+        self.dialect = dialect
+        self._param_index = 0
+
+    def q(self, name: str) -> str:
+        return quote_identifier(name, self.dialect)
+
+    def _placeholder(self) -> str:
+        self._param_index += 1
+        return f"${self._param_index}" if self.dialect == "postgres" else "%s"
+
+    def _reset(self):
+        self._param_index = 0
+
+    def validate_uuids(self, uuids: List[str], available_columns: Optional[set]) -> Tuple[List[str], List[str]]:
+        """Split UUIDs into (present, missing) against the table's columns"""
+        unique = list(dict.fromkeys(uuids))
+        if available_columns is None:
+            return unique, []
+        present = [u for u in unique if u in available_columns]
+        missing = [u for u in unique if u not in available_columns]
+        if missing:
+            logger.warning(f"⚠️  {len(missing)} UUID(s) have no column in the sensor table: {missing}")
+        return present, missing
+
+    def build_wide(
+        self,
+        table: str,
+        timestamp_column: str,
+        uuids: List[str],
+        start: datetime,
+        end: datetime,
+        limit: Optional[int] = None,
+        available_columns: Optional[set] = None
+    ) -> BuiltQuery:
+        """
+        Raw readings from a wide table (one column per sensor UUID)
+
+        Args:
+            table: Table name
+            timestamp_column: Timestamp column (e.g. 'Datetime')
+            uuids: Sensor UUID columns to read
+            start: Inclusive lower bound
+            end: Exclusive upper bound
+            limit: Max number of timestamps (newest first)
+            available_columns: Column names from the schema catalog for validation
+
+        Returns:
+            BuiltQuery with shape 'wide'
+        """
+        self._reset()
+        present, missing = self.validate_uuids(uuids, available_columns)
+        if not present:
+            return BuiltQuery(sql="", params=[], uuids=[], missing=missing, shape="wide", dialect=self.dialect)
+
+        ts = self.q(timestamp_column)
+        value_cols = ", ".join(self.q(u) for u in present)
+        not_null = " OR ".join(f"{self.q(u)} IS NOT NULL" for u in present)
+        sql = (
+            f"SELECT {ts} AS timestamp, {value_cols}\n"
+            f"FROM {self.q(table)}\n"
+            f"WHERE {ts} >= {self._placeholder()} AND {ts} < {self._placeholder()}\n"
+            f"  AND ({not_null})\n"
+            f"ORDER BY {ts} DESC"
+        )
+        params: List[Any] = [start, end]
+        if limit:
+            sql += f"\nLIMIT {self._placeholder()}"
+            params.append(int(limit))
+        return BuiltQuery(
+            sql=sql, params=params, uuids=present, missing=missing,
+            shape="wide", dialect=self.dialect, limit=limit
+        )
+
+    def _bucket_expr(self, ts: str) -> str:
+        """Epoch-aligned bucket start for a timestamp expression"""
+        if self.dialect == "postgres":
+            p = self._placeholder()
+            return f"to_timestamp(floor(extract(epoch from {ts}) / {p}) * {p})"
+        return f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP({ts}) / %s) * %s)"
+
+    def _last_expr(self, col: str, ts: str) -> str:
+        """Newest non-null value of a column within the group"""
+        if self.dialect == "postgres":
+            return f"(array_agg({col} ORDER BY {ts} DESC) FILTER (WHERE {col} IS NOT NULL))[1]"
+        # GROUP_CONCAT skips NULLs; only the first element is needed so group_concat_max_len
+        # truncation is harmless. "+ 0" turns the string back into a DOUBLE
+        return f"(SUBSTRING_INDEX(GROUP_CONCAT({col} ORDER BY {ts} DESC), ',', 1) + 0)"
+
+    def build_wide_bucketed(
+        self,
+        table: str,
+        timestamp_column: str,
+        uuids: List[str],
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
+        available_columns: Optional[set] = None
+    ) -> BuiltQuery:
+        """
+        Time-bucketed aggregates from a wide table in one grouped range scan
+
+        Each bucket row carries avg/min/max/count/last for every requested UUID.
+
+        Args:
+            table: Table name
+            timestamp_column: Timestamp column (e.g. 'Datetime')
+            uuids: Sensor UUID columns to aggregate
+            start: Inclusive lower bound
+            end: Exclusive upper bound
+            bucket_seconds: Bucket width in seconds
+            available_columns: Column names from the schema catalog for validation
+
+        Returns:
+            BuiltQuery with shape 'wide' and bucket_seconds set
+        """
+        self._reset()
+        present, missing = self.validate_uuids(uuids, available_columns)
+        if not present:
+            return BuiltQuery(
+                sql="", params=[], uuids=[], missing=missing, shape="wide",
+                dialect=self.dialect, bucket_seconds=bucket_seconds
+            )
+
+        ts = self.q(timestamp_column)
+        bucket = self._bucket_expr(ts)
+        params: List[Any] = [bucket_seconds, bucket_seconds] if self.dialect == "mysql" else [bucket_seconds]
+        aggregates = []
+        for u in present:
+            col = self.q(u)
+            aggregates.extend([
+                f"AVG({col}) AS {self.q(u + '__avg')}",
+                f"MIN({col}) AS {self.q(u + '__min')}",
+                f"MAX({col}) AS {self.q(u + '__max')}",
+                f"COUNT({col}) AS {self.q(u + '__count')}",
+                f"{self._last_expr(col, ts)} AS {self.q(u + '__last')}",
+            ])
+        not_null = " OR ".join(f"{self.q(u)} IS NOT NULL" for u in present)
+        sql = (
+            f"SELECT {bucket} AS timestamp,\n  " + ",\n  ".join(aggregates) + "\n"
+            f"FROM {self.q(table)}\n"
+            f"WHERE {ts} >= {self._placeholder()} AND {ts} < {self._placeholder()}\n"
+            f"  AND ({not_null})\n"
+            f"GROUP BY 1\n"
+            f"ORDER BY 1"
+        )
+        params.extend([start, end])
+        return BuiltQuery(
+            sql=sql, params=params, uuids=present, missing=missing,
+            shape="wide", dialect=self.dialect, bucket_seconds=bucket_seconds
+        )
+
+    def build_narrow(
+        self,
+        table: str,
+        timestamp_column: str,
+        uuids: List[str],
+        start: datetime,
+        end: datetime,
+        limit: Optional[int] = None,
+        bucket_seconds: Optional[int] = None
+    ) -> BuiltQuery:
+        """
+        Readings from a narrow (uuid, timestamp, value) table keyed on (uuid, timestamp)
+
+        Args:
+            table: Table name
+            timestamp_column: Timestamp column (e.g. 'Datetime')
+            uuids: Sensor UUIDs
+            start: Inclusive lower bound
+            end: Exclusive upper bound
+            limit: Max readings (newest first; raw fetches only)
+            bucket_seconds: Aggregate into buckets of this width instead of raw rows
+
+        Returns:
+            BuiltQuery with shape 'long'
+        """
+        self._reset()
+        present = list(dict.fromkeys(uuids))
+        if not present:
+            return BuiltQuery(sql="", params=[], uuids=[], dialect=self.dialect, bucket_seconds=bucket_seconds)
+
+        ts = self.q(timestamp_column)
+        params: List[Any] = []
+        if bucket_seconds:
+            bucket = self._bucket_expr(ts)
+            params.extend([bucket_seconds, bucket_seconds] if self.dialect == "mysql" else [bucket_seconds])
+            select = (
+                f"SELECT {bucket} AS timestamp, uuid, AVG(value) AS value, MIN(value) AS min, "
+                f"MAX(value) AS max, COUNT(*) AS count, {self._last_expr('value', ts)} AS last"
+            )
+        else:
+            select = f"SELECT {ts} AS timestamp, uuid, value"
+        in_list = ", ".join(self._placeholder() for _ in present)
+        params.extend(present)
+        sql = (
+            f"{select}\n"
+            f"FROM {self.q(table)}\n"
+            f"WHERE uuid IN ({in_list})\n"
+            f"  AND {ts} >= {self._placeholder()} AND {ts} < {self._placeholder()}"
+        )
+        params.extend([start, end])
+        if bucket_seconds:
+            sql += "\nGROUP BY uuid, 1\nORDER BY 1"
+            limit = None
+        else:
+            sql += f"\nORDER BY {ts} DESC"
+            if limit:
+                sql += f"\nLIMIT {self._placeholder()}"
+                params.append(int(limit))
+        return BuiltQuery(
+            sql=sql, params=params, uuids=present, shape="long",
+            dialect=self.dialect, limit=limit, bucket_seconds=bucket_seconds
+        )
+
+
+BUCKET_FIELDS = {"value": "__avg", "min": "__min", "max": "__max", "count": "__count", "last": "__last"}
+
+
+def frame_from_columns(columns: Dict[str, Any], built: BuiltQuery) -> SeriesFrame:
+    """Build a long SeriesFrame from column arrays returned for a built query"""
+    if built.shape != "wide":
+        return SeriesFrame({name: values for name, values in columns.items()})
+    fields = BUCKET_FIELDS if built.bucket_seconds else None
+    return SeriesFrame.from_wide(columns, built.uuids, fields)
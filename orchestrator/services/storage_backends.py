@@ -0,0 +1,543 @@
+"""
+Storage Backends Service
+Routes sensor UUIDs to the store their readings live in.
+
+The ontology links each time series to a store via ref:storedAt (e.g.
+bldg:database1). STORAGE_BACKENDS_FILE maps those storage IRIs to named
+backends, each with its own connection pool and query builder:
+
+    {
+      "default": "mysql",
+      "backends": {
+        "mysql":     {"kind": "mysql"},
+        "building2": {"kind": "postgres", "dsn": "postgresql://user:pw@timescale:5432/b2", "table": "readings"},
+        "archive":   {"kind": "parquet", "path": "outputs/archive/building3"},
+        "csv":       {"kind": "csv", "path": "data/timeseries/building4"}
+      },
+      "iris": {
+        "http://abacwsbuilding.cardiff.ac.uk/abacws#database1": "mysql",
+        "building2:timescale": "building2"
+      }
+    }
+
+IRIs match exactly or by local name (the part after '#', '/' or ':').
+Unmapped IRIs, and everything when the file is absent, go to the default
+backend: the shared MySQL pool, with its narrow table and Parquet archive.
+Every backend returns the same SeriesFrame shape for a ResolutionPlan, so
+groups are fetched concurrently and merged into one frame.
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import asyncpg
+import csv
+import glob
+import json
+import os
+import time
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.mysql_manager import MySQLManager, mysql_manager
+from orchestrator.services.schema_catalog import schema_catalog
+from orchestrator.services.sql_builder import TimeSeriesQueryBuilder, BuiltQuery, frame_from_columns, quote_identifier
+from orchestrator.services.series_frame import SeriesFrame, aggregate_buckets
+from orchestrator.services.parquet_archive import ParquetArchive, parquet_archive
+from orchestrator.services.resolution_planner import ResolutionPlan, split_at_coverage
+
+logger = get_logger(__name__)
+
+DEFAULT_BACKEND = "mysql"
+
+
+@dataclass
+class FetchLog:
+    """Statements run and UUIDs not found while serving one request"""
+    queries: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+
+
+def local_name(iri: str) -> str:
+    """Last segment of an IRI or prefixed name (bldg:database1 -> database1)"""
+    for sep in ("#", "/", ":"):
+        iri = iri.rsplit(sep, 1)[-1]
+    return iri
+
+
+def _newest(frame: SeriesFrame, plan: ResolutionPlan, row_limit: int) -> SeriesFrame:
+    """Raw plans: newest row_limit readings first; bucketed: aggregated to the plan"""
+    if not plan.is_raw:
+        return aggregate_buckets(frame, plan.bucket_seconds)
+    frame = frame.sort_by_time(descending=True)
+    return frame.head(row_limit) if len(frame) > row_limit else frame
+
+
+class StorageBackend:
+    """One time-series store; subclasses implement fetch_range"""
+
+    kind = ""
+    # Remote stores sit behind the time-series cache; local files are read directly
+    cacheable = False
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.options = options or {}
+        self.metrics = {"fetches": 0, "errors": 0, "rows": 0, "total_latency": 0.0}
+
+    async def fetch_range(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        """
+        Readings for uuids in the plan's window and resolution
+
+        Raw plans return at most row_limit readings, newest first, with
+        truncated set when the limit was hit; bucketed plans return
+        value/min/max/count/last per (uuid, bucket).
+        """
+        start = time.perf_counter()
+        self.metrics["fetches"] += 1
+        try:
+            frame = await self._fetch(uuids, plan, row_limit, log)
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+        self.metrics["rows"] += len(frame)
+        self.metrics["total_latency"] += time.perf_counter() - start
+        return frame
+
+    async def _fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"kind": self.kind, **self.metrics}
+
+
+# ==================== SQL backends ====================
+
+class MySQLBackend(StorageBackend):
+    """
+    Wide MySQL sensor table
+
+    The default backend uses the shared pool and reads older ranges from the
+    narrow table and the Parquet archive. Backends with host/port/user/
+    password/database options get their own pool and read their 'table'
+    (default SENSOR_DATA_TABLE) only.
+    """
+
+    kind = "mysql"
+    cacheable = True
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(name, options)
+        overrides = {k: self.options[k] for k in ("host", "port", "user", "password") if k in self.options}
+        if "database" in self.options:
+            overrides["db"] = self.options["database"]
+        self.primary = not overrides
+        self.db = mysql_manager if self.primary else MySQLManager(overrides)
+        self.table = self.options.get("table", settings.SENSOR_DATA_TABLE)
+        self.timestamp_column = self.options.get("timestamp_column", "Datetime")
+        # (checked_at, (low_water, high_water) or None) for the narrow table
+        self._narrow_coverage: Tuple[float, Optional[Tuple[datetime, datetime]]] = (0.0, None)
+
+    async def _fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        # Archived days are scanned from Parquet, only the newer rest goes to MySQL
+        archive_plan, plan_rest = split_at_coverage(plan, parquet_archive.coverage() if self.primary else None)
+        parts = []
+        if plan_rest:
+            for built in await self._build_uuid_queries(uuids, plan_rest, row_limit):
+                log.missing.extend(built.missing)
+                if not built.sql:
+                    continue
+                log.queries.append(built.sql)
+                columns = await self.db.fetch_columns(built.sql, built.params)
+                row_count = len(columns.get("timestamp", ()))
+                part = frame_from_columns(columns, built)
+                # Bucketed fetches are bounded by the plan, only raw fetches can hit the row limit
+                part.truncated = bool(built.limit) and row_count >= built.limit
+                parts.append(part)
+        if archive_plan:
+            part = await asyncio.to_thread(parquet_archive.fetch, uuids, archive_plan, row_limit)
+            part.truncated = archive_plan.is_raw and len(part) >= row_limit
+            parts.append(part)
+        return SeriesFrame.concat(parts)
+
+    async def _get_narrow_coverage(self) -> Optional[Tuple[datetime, datetime]]:
+        """
+        [low_water, high_water) range already copied into the narrow table, or None
+
+        Read from the ETL watermark table (see scripts/sensor_etl.py) and cached
+        for SENSOR_ETL_INTERVAL seconds.
+        """
+        if not settings.SQL_USE_NARROW_TABLE or not self.primary:
+            return None
+        checked_at, coverage = self._narrow_coverage
+        if time.monotonic() - checked_at < settings.SENSOR_ETL_INTERVAL:
+            return coverage
+        coverage = None
+        try:
+            await schema_catalog.refresh()
+            if schema_catalog.has_table(settings.SENSOR_NARROW_TABLE) and \
+                    schema_catalog.has_table(settings.SENSOR_ETL_WATERMARK_TABLE):
+                rows = await self.db.fetch_all(
+                    f"SELECT low_water, high_water FROM {quote_identifier(settings.SENSOR_ETL_WATERMARK_TABLE)} "
+                    "WHERE name = %s",
+                    (settings.SENSOR_NARROW_TABLE,),
+                    dict_rows=False
+                )
+                if rows and rows[0][0] and rows[0][1] and rows[0][0] < rows[0][1]:
+                    coverage = (rows[0][0], rows[0][1])
+        except Exception as e:
+            logger.warning(f"Narrow table watermark unavailable, reading the wide table: {e}")
+        self._narrow_coverage = (time.monotonic(), coverage)
+        return coverage
+
+    async def _build_uuid_queries(
+        self,
+        uuids: List[str],
+        plan: ResolutionPlan,
+        row_limit: Optional[int] = None
+    ) -> List[BuiltQuery]:
+        """
+        Build the deterministic fetch statements for a batch of sensor UUIDs
+
+        The part of the window the narrow table covers is read through its
+        (uuid, Datetime) key; anything newer than its high-water mark is read
+        from the wide table. Statements are returned newest segment first.
+
+        Args:
+            uuids: Sensor UUIDs
+            plan: Window and resolution
+            row_limit: Max raw readings
+        """
+        table = self.table
+        timestamp_column = self.timestamp_column
+        available_columns = None
+        if self.primary:
+            # The schema catalog describes the shared database only
+            try:
+                await schema_catalog.refresh()
+                timestamp_column = schema_catalog.timestamp_column(table) or timestamp_column
+                available_columns = schema_catalog.column_set(table)
+            except Exception as e:
+                logger.warning(f"Schema catalog unavailable, skipping UUID column validation: {e}")
+
+        builder = TimeSeriesQueryBuilder("mysql")
+        row_limit = row_limit or settings.SQL_UUID_FETCH_LIMIT
+
+        # Older part from the narrow table, anything past its high-water mark from the wide table
+        narrow_plan, wide_plan = split_at_coverage(plan, await self._get_narrow_coverage())
+
+        queries: List[BuiltQuery] = []
+        present, missing = builder.validate_uuids(uuids, available_columns)
+        if wide_plan:
+            if wide_plan.is_raw:
+                # The wide table yields up to len(uuids) readings per timestamp row
+                limit = -(-row_limit // max(1, len(uuids)))
+                built = builder.build_wide(
+                    table, timestamp_column, uuids, wide_plan.start, wide_plan.end, limit, available_columns
+                )
+            else:
+                built = builder.build_wide_bucketed(
+                    table, timestamp_column, uuids, wide_plan.start, wide_plan.end,
+                    wide_plan.bucket_seconds, available_columns
+                )
+            queries.append(built)
+        if narrow_plan:
+            built = builder.build_narrow(
+                settings.SENSOR_NARROW_TABLE, "Datetime", present, narrow_plan.start, narrow_plan.end,
+                limit=row_limit if plan.is_raw else None, bucket_seconds=plan.bucket_seconds
+            )
+            if not queries:
+                built.missing = missing
+            queries.append(built)
+        return queries
+
+    async def close(self):
+        # The shared pool is closed by the app lifespan
+        if not self.primary:
+            await self.db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if not self.primary:
+            stats["pool"] = self.db.stats()["pool"]
+        return stats
+
+
+class PostgresBackend(StorageBackend):
+    """
+    PostgreSQL / TimescaleDB table
+
+    Options: dsn, table, timestamp_column (default 'time'), shape ('narrow':
+    uuid/value columns, the usual hypertable layout; or 'wide': one column per
+    UUID), pool_min_size / pool_max_size.
+    """
+
+    kind = "postgres"
+    cacheable = True
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(name, options)
+        self.dsn = self.options.get("dsn", "")
+        self.table = self.options.get("table", settings.SENSOR_DATA_TABLE)
+        self.timestamp_column = self.options.get("timestamp_column", "time")
+        self.shape = self.options.get("shape", "narrow")
+        self.pool = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _pool(self):
+        async with self._connect_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn,
+                    min_size=int(self.options.get("pool_min_size", 1)),
+                    max_size=int(self.options.get("pool_max_size", settings.SQL_FETCH_CONCURRENCY)),
+                    command_timeout=settings.MYSQL_QUERY_TIMEOUT
+                )
+                logger.info(f"Connected storage backend '{self.name}' (postgres)")
+        return self.pool
+
+    def _build(self, uuids: List[str], plan: ResolutionPlan, row_limit: int) -> BuiltQuery:
+        builder = TimeSeriesQueryBuilder("postgres")
+        if self.shape == "wide":
+            if plan.is_raw:
+                limit = -(-row_limit // max(1, len(uuids)))
+                return builder.build_wide(self.table, self.timestamp_column, uuids, plan.start, plan.end, limit)
+            return builder.build_wide_bucketed(
+                self.table, self.timestamp_column, uuids, plan.start, plan.end, plan.bucket_seconds
+            )
+        return builder.build_narrow(
+            self.table, self.timestamp_column, uuids, plan.start, plan.end,
+            limit=row_limit if plan.is_raw else None, bucket_seconds=plan.bucket_seconds
+        )
+
+    async def _fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        built = self._build(uuids, plan, row_limit)
+        if not built.sql:
+            return SeriesFrame()
+        log.queries.append(built.sql)
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            records = await asyncio.wait_for(conn.fetch(built.sql, *built.params), settings.MYSQL_QUERY_TIMEOUT)
+        names = list(records[0].keys()) if records else []
+        zone = ZoneInfo(settings.MYSQL_TIMEZONE)
+        columns: Dict[str, Any] = {}
+        for name, column in zip(names, zip(*records)):
+            if name == "timestamp":
+                # timestamptz / to_timestamp() results -> naive, like the MySQL Datetime bounds
+                columns[name] = np.array([
+                    v.astimezone(zone).replace(tzinfo=None) if v is not None and v.tzinfo else v for v in column
+                ], dtype="datetime64[us]")
+            elif name == "uuid":
+                columns[name] = np.array(column, dtype=object)
+            else:
+                columns[name] = np.array([np.nan if v is None else float(v) for v in column], dtype=np.float64)
+        frame = frame_from_columns(columns, built)
+        frame.truncated = bool(built.limit) and len(records) >= built.limit
+        return frame
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+
+# ==================== File backends ====================
+
+class ParquetBackend(StorageBackend):
+    """Parquet store in the archive layout (see parquet_archive), under options['path']"""
+
+    kind = "parquet"
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(name, options)
+        self.archive = ParquetArchive(self.options.get("path"))
+
+    async def _fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        frame = await asyncio.to_thread(self.archive.fetch, uuids, plan, row_limit)
+        frame.truncated = plan.is_raw and len(frame) >= row_limit
+        return frame
+
+
+class CSVBackend(StorageBackend):
+    """
+    Directory (or single file) of CSV exports, options['path']
+
+    Long files have timestamp/uuid/value columns; wide files have a
+    timestamp column ('Datetime' or 'timestamp') and one column per UUID.
+    Parsed files are kept in memory until their modification time changes.
+    """
+
+    kind = "csv"
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(name, options)
+        self.path = self.options.get("path", "")
+        self._files: Dict[str, Tuple[float, SeriesFrame]] = {}
+
+    def _paths(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(glob.glob(os.path.join(self.path, "*.csv")))
+        return [self.path] if os.path.exists(self.path) else []
+
+    @staticmethod
+    def _parse(path: str) -> SeriesFrame:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            rows = list(reader)
+        if not header:
+            return SeriesFrame()
+        columns = list(zip(*rows)) if rows else [() for _ in header]
+        lowered = [h.strip().lower() for h in header]
+        ts_index = lowered.index("timestamp") if "timestamp" in lowered else lowered.index("datetime")
+        timestamps = np.array([t.replace(" ", "T") if t else "NaT" for t in columns[ts_index]], dtype="datetime64[us]")
+
+        def numeric(values) -> np.ndarray:
+            return np.array([v if v != "" else "nan" for v in values], dtype=np.float64)
+
+        if "uuid" in lowered and "value" in lowered:
+            return SeriesFrame({
+                "timestamp": timestamps,
+                "uuid": np.array(columns[lowered.index("uuid")], dtype=object),
+                "value": numeric(columns[lowered.index("value")]),
+            })
+        wide = {h: numeric(c) for i, (h, c) in enumerate(zip(header, columns)) if i != ts_index}
+        wide["timestamp"] = timestamps
+        return SeriesFrame.from_wide(wide, [h for h in wide if h != "timestamp"])
+
+    def _load(self) -> SeriesFrame:
+        frames = []
+        for path in self._paths():
+            mtime = os.path.getmtime(path)
+            cached = self._files.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, self._parse(path))
+                self._files[path] = cached
+            frames.append(cached[1])
+        return SeriesFrame.concat(frames)
+
+    def _read(self, uuids: List[str], plan: ResolutionPlan, row_limit: int) -> SeriesFrame:
+        frame = self._load()
+        ts = frame.columns["timestamp"]
+        mask = np.isin(frame.columns["uuid"].astype(str), list(uuids)) \
+            & (ts >= np.datetime64(plan.start)) & (ts < np.datetime64(plan.end))
+        return _newest(frame.take(mask), plan, row_limit)
+
+    async def _fetch(self, uuids: List[str], plan: ResolutionPlan, row_limit: int, log: FetchLog) -> SeriesFrame:
+        frame = await asyncio.to_thread(self._read, uuids, plan, row_limit)
+        frame.truncated = plan.is_raw and len(frame) >= row_limit
+        return frame
+
+
+BACKEND_KINDS = {
+    "mysql": MySQLBackend,
+    "postgres": PostgresBackend,
+    "timescale": PostgresBackend,
+    "parquet": ParquetBackend,
+    "csv": CSVBackend,
+}
+
+
+# ==================== Registry ====================
+
+class StorageRegistry:
+    """Storage IRI -> backend mapping loaded from STORAGE_BACKENDS_FILE"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.STORAGE_BACKENDS_FILE
+        self.backends: Dict[str, StorageBackend] = {}
+        self.iris: Dict[str, str] = {}
+        self.default = DEFAULT_BACKEND
+        self._loaded = False
+        # Storage IRIs already reported as unmapped (warned once each)
+        self._unmapped: Set[str] = set()
+
+    def load(self):
+        """Read the mapping file (missing or invalid: everything is in the shared MySQL)"""
+        try:
+            config: Dict[str, Any] = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            self._configure(config)
+        except Exception as e:
+            logger.error(f"Invalid storage backend mapping {self.path}, using the shared MySQL only: {e}")
+            self._configure({})
+        self._loaded = True
+        self._unmapped = set()
+        logger.info(f"Storage backends: {', '.join(f'{n} ({b.kind})' for n, b in self.backends.items())}")
+        if not self.iris:
+            logger.info(f"No storage IRIs mapped, every UUID is read from '{self.default}'")
+
+    def _configure(self, config: Dict[str, Any]):
+        specs = config.get("backends") or {DEFAULT_BACKEND: {"kind": "mysql"}}
+        backends: Dict[str, StorageBackend] = {}
+        for name, spec in specs.items():
+            kind = spec.get("kind", "mysql")
+            if kind not in BACKEND_KINDS:
+                raise ValueError(f"Unknown storage backend kind '{kind}' for '{name}'")
+            backends[name] = BACKEND_KINDS[kind](name, spec)
+        default = config.get("default", next(iter(backends)))
+        if default not in backends:
+            raise ValueError(f"Default storage backend '{default}' is not defined")
+        iris: Dict[str, str] = {}
+        for iri, name in config.get("iris", {}).items():
+            if name not in backends:
+                raise ValueError(f"Storage IRI {iri} maps to undefined backend '{name}'")
+            iris[iri] = name
+            iris.setdefault(local_name(iri), name)
+        self.backends, self.default, self.iris = backends, default, iris
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get(self, name: str) -> StorageBackend:
+        self._ensure_loaded()
+        return self.backends[name]
+
+    def resolve(self, storage_iri: Optional[str]) -> str:
+        """Backend name for a ref:storedAt value (unknown or missing -> default)"""
+        self._ensure_loaded()
+        if not storage_iri:
+            return self.default
+        name = self.iris.get(storage_iri) or self.iris.get(local_name(storage_iri))
+        if name is None:
+            if self.iris and storage_iri not in self._unmapped:
+                self._unmapped.add(storage_iri)
+                logger.warning(f"⚠️  No storage backend mapped for {storage_iri}, using '{self.default}'")
+            return self.default
+        return name
+
+    def group(self, uuids: List[str], storage_map: Optional[Dict[str, str]] = None) -> Dict[str, List[str]]:
+        """Group UUIDs by backend name, keeping their order"""
+        storage_map = storage_map or {}
+        groups: Dict[str, List[str]] = {}
+        for uuid in dict.fromkeys(uuids):
+            groups.setdefault(self.resolve(storage_map.get(uuid)), []).append(uuid)
+        return groups
+
+    async def close(self):
+        for backend in self.backends.values():
+            try:
+                await backend.close()
+            except Exception as e:
+                logger.warning(f"Failed to close storage backend '{backend.name}': {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default if self._loaded else None,
+            "backends": {name: backend.stats() for name, backend in self.backends.items()},
+            "iris": len(self.iris),
+        }
+
+
+# Global instance
+storage_registry = StorageRegistry()
@@ -0,0 +1,318 @@
+"""
+Time Window Resolver
+Deterministic natural-language time expressions -> canonical [start, end) UTC windows.
+
+Expressions are interpreted in the building's local zone (TIME_ZONE,
+Europe/London) so "today", "yesterday" and "since Monday" follow local
+midnights across DST changes. Bounds are converted to UTC and aligned to
+TIME_WINDOW_ALIGN_SECONDS, so the same question asked within the same
+alignment step yields an identical window that downstream caches can key
+on, and generated SQL carries literal bounds instead of NOW().
+"""
+import sys
+sys.path.append('/app')
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+from zoneinfo import ZoneInfo
+from shared.utils import get_logger
+from shared.config import settings
+
+logger = get_logger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+MONTH_RE = "|".join([m for m in MONTHS] + [m[:3] for m in MONTHS if m != "may"] + ["sept"])
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "fifteen": 15, "twenty": 20, "thirty": 30,
+}
+UNIT_SECONDS = {
+    "minute": 60, "min": 60, "hour": 3600, "hr": 3600, "day": 86400,
+    "week": 604800, "fortnight": 1209600, "month": 2592000, "year": 31536000,
+}
+DAY_PARTS = {"morning": (6, 12), "afternoon": (12, 18), "evening": (18, 24)}
+
+RELATIVE_RE = re.compile(
+    r"\b(?:last|past|previous|over the last|over the past|in the last|in the past|within the last)\s+"
+    r"(\d+|" + "|".join(NUMBER_WORDS) + r")?\s*(minute|min|hour|hr|day|week|fortnight|month|year)s?\b"
+)
+ISO_DATE_RE = r"\d{4}-\d{2}-\d{2}(?:[ t]\d{2}:\d{2}(?::\d{2})?)?"
+UK_DATE_RE = r"\d{1,2}/\d{1,2}/\d{2,4}"
+NAMED_DATE_RE = (
+    rf"(?:\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?(?:{MONTH_RE})\.?(?:\s+\d{{4}})?"
+    rf"|(?:{MONTH_RE})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?)"
+)
+DATE_RE = rf"(?:{ISO_DATE_RE}|{UK_DATE_RE}|{NAMED_DATE_RE})"
+RANGE_RE = re.compile(rf"\b(?:between|from)\s+({DATE_RE})\s+(?:and|to|until|till)\s+({DATE_RE})")
+SINCE_RE = re.compile(
+    rf"\bsince\s+(?:(last\s+)?({'|'.join(WEEKDAYS)})|(today|yesterday)|({DATE_RE})"
+    r"|(\d{1,2})(?::(\d{2}))?\s*(am|pm)?)\b"
+)
+ON_DATE_RE = re.compile(rf"\b({DATE_RE})\b")
+WEEKDAY_RE = re.compile(rf"\b(?:on|last)\s+({'|'.join(WEEKDAYS)})\b")
+IN_MONTH_RE = re.compile(rf"\bin\s+({MONTH_RE})\b(?:\s+(\d{{4}}))?")
+DAY_PART_RE = re.compile(r"\b(this|yesterday)\s+(morning|afternoon|evening)\b")
+RELATIVE_HINT_RE = re.compile(r"^now\s*-\s*(\d+)\s*([mhdw])$")
+
+
+@dataclass
+class TimeWindow:
+    """Canonical half-open time window (timezone-aware UTC bounds)"""
+    start: datetime
+    end: datetime
+    label: str
+    source: str  # "query", "hint" or "default"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": self.start.isoformat().replace("+00:00", "Z"),
+            "end": self.end.isoformat().replace("+00:00", "Z"),
+            "label": self.label,
+            "source": self.source,
+        }
+
+    def naive_in(self, zone: str) -> Tuple[datetime, datetime]:
+        """Bounds as naive datetimes in the given zone (e.g. the database time zone)"""
+        tz = ZoneInfo(zone)
+        return (
+            self.start.astimezone(tz).replace(tzinfo=None),
+            self.end.astimezone(tz).replace(tzinfo=None),
+        )
+
+
+class TimeWindowResolver:
+    """Resolves natural-language time expressions in a fixed local zone"""
+
+    def __init__(self, zone: Optional[str] = None, align_seconds: Optional[int] = None):
+        self.zone = ZoneInfo(zone or settings.TIME_ZONE)
+        self.align_seconds = align_seconds or settings.TIME_WINDOW_ALIGN_SECONDS
+
+    # ==================== Helpers ====================
+
+    def _midnight(self, day) -> datetime:
+        """Local midnight of a date, DST-aware"""
+        return datetime(day.year, day.month, day.day, tzinfo=self.zone)
+
+    def _parse_date(self, text: str, now: datetime) -> Optional[datetime]:
+        """Parse one date expression to a local datetime (midnight unless a time is given)"""
+        text = text.strip().lower().rstrip(".")
+        try:
+            if re.fullmatch(ISO_DATE_RE, text):
+                parsed = datetime.fromisoformat(text.replace("t", "T"))
+                return parsed.replace(tzinfo=self.zone)
+            if re.fullmatch(UK_DATE_RE, text):
+                day, month, year = (int(p) for p in text.split("/"))
+                year += 2000 if year < 100 else 0
+                return datetime(year, month, day, tzinfo=self.zone)
+        except ValueError:
+            return None
+        match = re.search(r"\d{4}", text)
+        year = int(match.group(0)) if match else None
+        rest = re.sub(r"\d{4}", "", text)
+        day_match = re.search(r"\d{1,2}", rest)
+        month_match = re.search(MONTH_RE, rest)
+        if not day_match or not month_match:
+            return None
+        month = next(i for i, m in enumerate(MONTHS, 1) if m.startswith(month_match.group(0)[:3]))
+        try:
+            parsed = datetime(year or now.year, month, int(day_match.group(0)), tzinfo=self.zone)
+        except ValueError:
+            return None
+        if year is None and parsed > now:
+            parsed = parsed.replace(year=now.year - 1)
+        return parsed
+
+    def _ago(self, now: datetime, seconds: float) -> datetime:
+        """Local time `seconds` of elapsed time before now (computed in UTC, so DST days are not 23h/25h)"""
+        return (now.astimezone(timezone.utc) - timedelta(seconds=seconds)).astimezone(self.zone)
+
+    def _last_weekday(self, name: str, now: datetime, strictly_before: bool = False) -> datetime:
+        """Midnight of the most recent given weekday (today counts unless strictly_before)"""
+        delta = (now.weekday() - WEEKDAYS.index(name)) % 7
+        if delta == 0 and strictly_before:
+            delta = 7
+        return self._midnight((now - timedelta(days=delta)).date())
+
+    def _parse_hint(self, value: Optional[str], now: datetime) -> Tuple[Optional[datetime], bool]:
+        """Parse an upstream start/end hint -> (local datetime, is_absolute)"""
+        if not value:
+            return None, False
+        text = str(value).strip()
+        if text.lower() == "now":
+            return now, False
+        match = RELATIVE_HINT_RE.match(text.lower())
+        if match:
+            units = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+            return self._ago(now, int(match.group(1)) * units[match.group(2)]), False
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None, False
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=self.zone)
+        return parsed.astimezone(self.zone), True
+
+    # ==================== Expression Parsing ====================
+
+    def _from_query(self, query: str, now: datetime) -> Optional[Tuple[datetime, datetime, str]]:
+        """Local (start, end, label) for the first recognised expression, or None"""
+        q = query.lower()
+        today = self._midnight(now.date())
+
+        match = RANGE_RE.search(q)
+        if match:
+            start, end = self._parse_date(match.group(1), now), self._parse_date(match.group(2), now)
+            if start and end:
+                # A bare end date includes that whole day
+                if re.fullmatch(rf"{DATE_RE}", match.group(2)) and end.hour == 0 and end.minute == 0:
+                    end = self._midnight((end + timedelta(days=1)).date())
+                return start, end, f"{match.group(1)} to {match.group(2)}"
+
+        # Calendar periods ("previous week") before rolling ones ("last week" = 7 days)
+        if "previous week" in q:
+            monday = self._last_weekday("monday", now)
+            return self._midnight((monday - timedelta(days=7)).date()), monday, "previous week"
+        if "previous month" in q:
+            first = today.date().replace(day=1)
+            prev = (first - timedelta(days=1)).replace(day=1)
+            return self._midnight(prev), self._midnight(first), "previous month"
+
+        match = RELATIVE_RE.search(q)
+        if match:
+            amount = match.group(1)
+            n = int(amount) if amount and amount.isdigit() else NUMBER_WORDS.get(amount, 1)
+            unit = match.group(2)
+            return self._ago(now, n * UNIT_SECONDS[unit]), now, f"last {n} {unit}(s)"
+
+        match = SINCE_RE.search(q)
+        if match:
+            last, weekday, named, date_text, hour, minute, meridiem = match.groups()
+            if weekday:
+                return self._last_weekday(weekday, now, strictly_before=bool(last)), now, f"since {weekday}"
+            if named:
+                start = today if named == "today" else today - timedelta(days=1)
+                return self._midnight(start.date()), now, f"since {named}"
+            if date_text:
+                start = self._parse_date(date_text, now)
+                if start:
+                    return start, now, f"since {date_text}"
+            if hour is not None and (meridiem or minute):
+                h = int(hour) % 12 + (12 if meridiem == "pm" else 0) if meridiem else int(hour)
+                start = today.replace(hour=min(h, 23), minute=int(minute or 0))
+                if start > now:
+                    start -= timedelta(days=1)
+                return start, now, f"since {start.strftime('%H:%M')}"
+
+        match = DAY_PART_RE.search(q)
+        if match:
+            day = today if match.group(1) == "this" else self._midnight((today - timedelta(days=1)).date())
+            lo, hi = DAY_PARTS[match.group(2)]
+            start = day + timedelta(hours=lo)
+            end = min(now, self._midnight((day + timedelta(days=1)).date()) if hi == 24 else day + timedelta(hours=hi))
+            return start, end, f"{match.group(1)} {match.group(2)}"
+        if "last night" in q:
+            yesterday = self._midnight((today - timedelta(days=1)).date())
+            return yesterday + timedelta(hours=18), min(now, today + timedelta(hours=6)), "last night"
+
+        if "day before yesterday" in q:
+            start = self._midnight((today - timedelta(days=2)).date())
+            return start, self._midnight((today - timedelta(days=1)).date()), "day before yesterday"
+        if "yesterday" in q:
+            return self._midnight((today - timedelta(days=1)).date()), today, "yesterday"
+        if "today" in q:
+            return today, now, "today"
+        if "this week" in q:
+            return self._last_weekday("monday", now), now, "this week"
+        if "this month" in q:
+            return self._midnight(today.date().replace(day=1)), now, "this month"
+        if "this year" in q:
+            return self._midnight(today.date().replace(month=1, day=1)), now, "this year"
+
+        match = IN_MONTH_RE.search(q)
+        if match:
+            month = next(i for i, m in enumerate(MONTHS, 1) if m.startswith(match.group(1)[:3]))
+            year = int(match.group(2)) if match.group(2) else now.year
+            start = datetime(year, month, 1, tzinfo=self.zone)
+            if not match.group(2) and start > now:
+                start = start.replace(year=year - 1)
+            following = datetime(start.year + (start.month == 12), start.month % 12 + 1, 1, tzinfo=self.zone)
+            return start, min(following, now), f"{MONTHS[month - 1]} {start.year}"
+
+        match = WEEKDAY_RE.search(q)
+        if match:
+            start = self._last_weekday(match.group(1), now, strictly_before=q[match.start():].startswith("last"))
+            return start, min(now, self._midnight((start + timedelta(days=1)).date())), match.group(1)
+
+        match = ON_DATE_RE.search(q)
+        if match:
+            start = self._parse_date(match.group(1), now)
+            if start:
+                if start.hour or start.minute:
+                    return start, now, f"since {match.group(1)}"
+                return start, min(now, self._midnight((start + timedelta(days=1)).date())), match.group(1)
+
+        return None
+
+    # ==================== Public API ====================
+
+    def _align(self, start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+        """Convert to UTC and snap start down / end up to the alignment step"""
+        step = self.align_seconds
+        s = int(start.astimezone(timezone.utc).timestamp())
+        e = int(end.astimezone(timezone.utc).timestamp())
+        s -= s % step
+        e += (-e) % step
+        if e <= s:
+            e = s + step
+        return datetime.fromtimestamp(s, timezone.utc), datetime.fromtimestamp(e, timezone.utc)
+
+    def resolve(
+        self,
+        query: str,
+        start_hint: Optional[str] = None,
+        end_hint: Optional[str] = None,
+        now: Optional[datetime] = None
+    ) -> TimeWindow:
+        """
+        Resolve the time window for a request
+
+        Absolute (ISO) hints, e.g. a window already resolved upstream, win;
+        then an expression in the query; then relative hints ('now-1d');
+        otherwise the last 24 hours.
+
+        Args:
+            query: User query text
+            start_hint: Optional start (ISO or 'now-N[mhdw]')
+            end_hint: Optional end (ISO, 'now' or 'now-N[mhdw]')
+            now: Reference time (defaults to the current time)
+
+        Returns:
+            TimeWindow with aligned UTC bounds
+        """
+        now = (now or datetime.now(timezone.utc)).astimezone(self.zone)
+        hint_start, start_absolute = self._parse_hint(start_hint, now)
+        hint_end, end_absolute = self._parse_hint(end_hint, now)
+
+        if start_absolute:
+            start, end, label, source = hint_start, hint_end or now, "explicit", "hint"
+        else:
+            parsed = self._from_query(query or "", now)
+            if parsed:
+                start, end, label = parsed
+                source = "query"
+            elif hint_start:
+                start, end, label, source = hint_start, hint_end or now, "relative", "hint"
+            else:
+                start, end, label, source = self._ago(now, 86400), now, "last 24 hours", "default"
+
+        start, end = self._align(start, min(end, now) if source != "hint" else end)
+        return TimeWindow(start=start, end=end, label=label, source=source)
+
+
+# Global instance
+time_resolver = TimeWindowResolver()
@@ -0,0 +1,250 @@
+"""
+Time-Series Cache Service
+Read-through cache of sensor readings in fixed, aligned chunks per UUID.
+
+Windows are split into epoch-aligned chunks (a whole number of buckets for
+aggregated fetches). Chunks that ended before now - TS_CACHE_SETTLE_SECONDS
+are closed: historical readings no longer change, so they are stored
+compressed (npz columns) in Redis or on local disk without expiry. Only the
+open tail chunk, and closed chunks not cached yet, are fetched from the
+database; the result is assembled from cached and fresh pieces.
+"""
+import sys
+sys.path.append('/app')
+
+import asyncio
+import io
+import os
+import numpy as np
+import redis.asyncio as redis
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from zoneinfo import ZoneInfo
+from shared.utils import get_logger
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.resolution_planner import ResolutionPlan, align_down
+
+logger = get_logger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# fetch_range(uuids, plan, row_limit) -> SeriesFrame for plan.start..plan.end
+RangeFetcher = Callable[[List[str], ResolutionPlan, int], Awaitable[SeriesFrame]]
+
+
+def _epoch_seconds(ts: datetime) -> int:
+    return int((ts - EPOCH).total_seconds())
+
+
+def encode_chunk(frame: SeriesFrame) -> bytes:
+    """Compressed columnar encoding of one UUID's chunk (uuid column omitted)"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **{name: values for name, values in frame.columns.items() if name != "uuid"})
+    return buffer.getvalue()
+
+
+def decode_chunk(blob: bytes, uuid: str) -> SeriesFrame:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+    columns["uuid"] = np.full(len(columns.get("timestamp", ())), uuid, dtype=object)
+    return SeriesFrame(columns)
+
+
+class TimeSeriesCache:
+    """Chunked read-through cache for UUID time-series fetches"""
+
+    def __init__(self):
+        self.backend = settings.TS_CACHE_BACKEND
+        self.directory = settings.TS_CACHE_DIR
+        self._client: Optional[redis.Redis] = None
+        self.metrics = {"chunk_hits": 0, "chunk_misses": 0, "chunks_stored": 0, "live_fetches": 0, "bytes_stored": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend in ("redis", "disk")
+
+    def chunk_seconds(self, plan: ResolutionPlan) -> int:
+        """Chunk width: at least TS_CACHE_CHUNK_SECONDS and a whole number of buckets"""
+        base = settings.TS_CACHE_CHUNK_SECONDS
+        if plan.is_raw:
+            return base
+        bucket = plan.bucket_seconds
+        return bucket * max(settings.TS_CACHE_BUCKETS_PER_CHUNK, -(-base // bucket))
+
+    # ==================== Storage ====================
+
+    def _key(self, resolution: str, uuid: str, chunk_start: int) -> str:
+        return f"tscache:{resolution}:{uuid}:{chunk_start}"
+
+    def _path(self, key: str) -> str:
+        _, resolution, uuid, chunk_start = key.split(":")
+        return os.path.join(self.directory, resolution, uuid, f"{chunk_start}.npz")
+
+    async def _redis(self) -> redis.Redis:
+        # Separate client: chunks are binary and the shared client decodes responses
+        if self._client is None:
+            self._client = redis.from_url(settings.REDIS_URL, decode_responses=False)
+        return self._client
+
+    async def _load(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        if self.backend == "redis":
+            return await (await self._redis()).mget(keys)
+
+        def read() -> List[Optional[bytes]]:
+            out = []
+            for key in keys:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        out.append(f.read())
+                except FileNotFoundError:
+                    out.append(None)
+            return out
+        return await asyncio.to_thread(read)
+
+    async def _store(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        if self.backend == "redis":
+            # Closed chunks never change: no TTL
+            await (await self._redis()).mset(items)
+        else:
+            def write():
+                for key, blob in items.items():
+                    path = self._path(key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp = path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(blob)
+                    os.replace(tmp, path)
+            await asyncio.to_thread(write)
+        self.metrics["chunks_stored"] += len(items)
+        self.metrics["bytes_stored"] += sum(len(b) for b in items.values())
+
+    # ==================== Read-through ====================
+
+    async def fetch(
+        self,
+        uuids: List[str],
+        plan: ResolutionPlan,
+        row_limit: int,
+        fetch_range: RangeFetcher
+    ) -> SeriesFrame:
+        """
+        Assemble a window from cached closed chunks and fresh fetches
+
+        Args:
+            uuids: Sensor UUIDs (one batch)
+            plan: Window and resolution
+            row_limit: Raw readings budget passed to fetch_range
+            fetch_range: Coroutine fetching uuids for a sub-plan from the database
+
+        Returns:
+            SeriesFrame for [plan.start, plan.end) (bucketed: from the bucket containing plan.start)
+        """
+        if not self.enabled or not uuids:
+            return await fetch_range(uuids, plan, row_limit)
+
+        chunk = self.chunk_seconds(plan)
+        resolution = "raw" if plan.is_raw else str(plan.bucket_seconds)
+        start = plan.start if plan.is_raw else align_down(plan.start, plan.bucket_seconds)
+        now = datetime.now(ZoneInfo(settings.MYSQL_TIMEZONE)).replace(tzinfo=None)
+        closed_until = align_down(min(plan.end, now - timedelta(seconds=settings.TS_CACHE_SETTLE_SECONDS)), chunk)
+
+        chunk_starts = list(range(_epoch_seconds(align_down(start, chunk)), _epoch_seconds(closed_until), chunk))
+        if not chunk_starts:
+            self.metrics["live_fetches"] += 1
+            return await fetch_range(uuids, plan, row_limit)
+
+        # Look up every (uuid, closed chunk)
+        pairs = [(u, c) for c in chunk_starts for u in uuids]
+        try:
+            blobs = await self._load([self._key(resolution, u, c) for u, c in pairs])
+        except Exception as e:
+            logger.warning(f"Time-series cache unavailable, fetching live: {e}")
+            return await fetch_range(uuids, plan, row_limit)
+
+        pieces: List[SeriesFrame] = []
+        missing: Dict[int, List[str]] = {}
+        for (u, c), blob in zip(pairs, blobs):
+            if blob is None:
+                missing.setdefault(c, []).append(u)
+                self.metrics["chunk_misses"] += 1
+            else:
+                pieces.append(decode_chunk(blob, u))
+                self.metrics["chunk_hits"] += 1
+
+        # Fetch runs of consecutive chunks that miss the same UUIDs in one statement each
+        runs: List[Tuple[int, int, List[str]]] = []
+        for c in sorted(missing):
+            if runs and runs[-1][1] == c and runs[-1][2] == missing[c]:
+                runs[-1] = (runs[-1][0], c + chunk, runs[-1][2])
+            else:
+                runs.append((c, c + chunk, missing[c]))
+
+        async def fill(run_start: int, run_end: int, run_uuids: List[str]) -> SeriesFrame:
+            sub_plan = replace(
+                plan,
+                start=EPOCH + timedelta(seconds=run_start),
+                end=EPOCH + timedelta(seconds=run_end)
+            )
+            frame = await fetch_range(run_uuids, sub_plan, row_limit)
+            if not frame.truncated:
+                await self._store_run(frame, resolution, run_uuids, run_start, run_end, chunk)
+            return frame
+
+        tasks = [fill(*run) for run in runs]
+        live_start = max(start, closed_until)
+        if live_start < plan.end:
+            self.metrics["live_fetches"] += 1
+            tasks.append(fetch_range(uuids, replace(plan, start=live_start), row_limit))
+        pieces.extend(await asyncio.gather(*tasks))
+
+        frame = SeriesFrame.concat(pieces)
+        ts = frame.columns["timestamp"]
+        in_window = (ts >= np.datetime64(start)) & (ts < np.datetime64(plan.end))
+        result = frame.take(in_window).sort_by_time(descending=plan.is_raw)
+        result.truncated = frame.truncated
+        logger.info(
+            f"📦 Time-series cache: {len(pairs) - sum(len(v) for v in missing.values())}/{len(pairs)} "
+            f"chunk hits, {len(runs)} backfill fetch(es) [{resolution}]"
+        )
+        return result
+
+    async def _store_run(
+        self,
+        frame: SeriesFrame,
+        resolution: str,
+        uuids: List[str],
+        run_start: int,
+        run_end: int,
+        chunk: int
+    ):
+        """Split a fetched run into per-UUID chunks and store them (empty chunks included)"""
+        try:
+            ts = frame.columns["timestamp"]
+            seconds = ts.astype("datetime64[s]").astype(np.int64) if len(frame) else np.empty(0, dtype=np.int64)
+            chunk_ids = seconds - (seconds % chunk)
+            items: Dict[str, bytes] = {}
+            for u in uuids:
+                is_uuid = frame.columns["uuid"] == u
+                for c in range(run_start, run_end, chunk):
+                    items[self._key(resolution, u, c)] = encode_chunk(frame.take(is_uuid & (chunk_ids == c)))
+            await self._store(items)
+        except Exception as e:
+            logger.warning(f"Failed to store time-series cache chunks: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["chunk_hits"] + self.metrics["chunk_misses"]
+        return {
+            "backend": self.backend,
+            **self.metrics,
+            "hit_rate": round(self.metrics["chunk_hits"] / lookups, 3) if lookups else None,
+        }
+
+
+# Global instance
+timeseries_cache = TimeSeriesCache()
@@ -18,6 +18,8 @@ from orchestrator.agents import (
     AnalyticsAgent,
     VisualizationAgent
 )
+from orchestrator.services.result_renderer import result_renderer
+from orchestrator.services.media_store import media_store
 
 logger = get_logger(__name__)
 
@@ -42,6 +44,7 @@ class WorkflowOrchestrator:
                 with open("data/sensor_map.json", "r", encoding="utf-8") as f:
                     self.sensor_map = json.load(f)
                 logger.info(f"Loaded {len(self.sensor_map)} sensors from cache")
+                result_renderer.load_sensor_map(self.sensor_map)
             else:
                 logger.warning("data/sensor_map.json not found. Run scripts/cache_sensor_map.py")
         except Exception as e:
@@ -181,6 +184,7 @@ class WorkflowOrchestrator:
         state.intermediate_results["analytics_required"] = analytics_required
         state.intermediate_results["start_date"] = start_date
         state.intermediate_results["end_date"] = end_date
+        state.intermediate_results["time_window"] = time_range
         state.intermediate_results["explanation"] = explanation
         
         if is_general:
@@ -225,6 +229,7 @@ class WorkflowOrchestrator:
         
         state.intermediate_results["sparql_result"] = result
         state.query_results = result.get("results", {})
+        state.query_frame = None
         
         # Set analytics_required from LLM output (no default)
         state.analytics_required = result.get("analytics_required", False)
@@ -300,12 +305,16 @@ class WorkflowOrchestrator:
             logger.info("="*80)
             start_date = state.intermediate_results.get("start_date")
             end_date = state.intermediate_results.get("end_date")
-            result = await self.sql_agent.fetch_data_for_uuids(uuids, latest_message, storage_map, start_date, end_date)
+            result = await self.sql_agent.fetch_data_for_uuids(
+                uuids, latest_message, storage_map, start_date, end_date, persona=state.persona
+            )
         else:
             # Fallback to standard SQL generation (text-to-SQL)
             logger.info("No UUIDs found or not analytics flow, using standard Text-to-SQL")
             result = await self.sql_agent.generate_and_execute(state, latest_message)
         
+        # The fetched frame stays in process: agents use it instead of rebuilding it from the records
+        state.query_frame = result.pop("frame", None)
         state.intermediate_results["sql_result"] = result
         
         # Handle SQL failures properly
@@ -466,6 +475,9 @@ class WorkflowOrchestrator:
             state.current_intent
         )
         
+        # Messages carry media references only; any inline data: image is moved to the media store
+        final_response = media_store.externalize(final_response)
+        
         # Add to messages
         state.messages.append(Message(
             role="assistant",
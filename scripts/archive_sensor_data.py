@@ -0,0 +1,114 @@
+"""
+Parquet archive exporter
+Copies closed days of the wide sensor table into the Parquet cold tier.
+
+  python scripts/archive_sensor_data.py                    # every closed day not archived yet
+  python scripts/archive_sensor_data.py --days 7           # only the last 7 closed days
+  python scripts/archive_sensor_data.py --since 2025-01-01 --force
+
+A day is closed once it ended at least ARCHIVE_MIN_AGE_HOURS ago. Each day
+is streamed from MySQL in one columnar fetch, unpivoted to (uuid, timestamp,
+value) and written as one Parquet file per sensor group; the manifest is
+updated after each day, so an interrupted run resumes with the next one.
+MySQL keeps its rows: the archive only takes historical scans off it.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from shared.config import settings
+from shared.utils import get_logger
+from orchestrator.mysql_manager import mysql_manager
+from orchestrator.services.sql_builder import TimeSeriesQueryBuilder, frame_from_columns, quote_identifier
+from orchestrator.services.parquet_archive import parquet_archive
+from orchestrator.services.schema_catalog import UUID_COLUMN_RE
+
+logger = get_logger("archive_sensor_data")
+
+# A day can hold 86400 rows per sensor; allow long single-day scans
+DAY_QUERY_TIMEOUT = 600
+
+
+async def uuid_columns() -> List[str]:
+    rows = await mysql_manager.fetch_all(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+        (settings.MYSQL_DATABASE, settings.SENSOR_DATA_TABLE),
+        dict_rows=False
+    )
+    return [name for (name,) in rows if UUID_COLUMN_RE.match(name)]
+
+
+async def oldest_day() -> Optional[date]:
+    table = quote_identifier(settings.SENSOR_DATA_TABLE, "mysql")
+    rows = await mysql_manager.fetch_all(f"SELECT MIN(`Datetime`) FROM {table}", dict_rows=False)
+    return rows[0][0].date() if rows and rows[0][0] else None
+
+
+def last_closed_day() -> date:
+    now = datetime.now(ZoneInfo(settings.MYSQL_TIMEZONE)).replace(tzinfo=None)
+    return (now - timedelta(hours=settings.ARCHIVE_MIN_AGE_HOURS)).date() - timedelta(days=1)
+
+
+async def export_day(day: date, columns: List[str]) -> int:
+    """Stream one day of the wide table into the archive"""
+    start = datetime.combine(day, datetime.min.time())
+    built = TimeSeriesQueryBuilder("mysql").build_wide(
+        settings.SENSOR_DATA_TABLE, "Datetime", columns, start, start + timedelta(days=1)
+    )
+    data = await mysql_manager.fetch_columns(built.sql, built.params, timeout=DAY_QUERY_TIMEOUT)
+    frame = frame_from_columns(data, built)
+    parquet_archive.export_day(day, frame)
+    return len(frame)
+
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export closed days of sensor data to the Parquet archive")
+    parser.add_argument("--days", type=int, help="Only the last N closed days")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day to export (ISO date)")
+    parser.add_argument("--force", action="store_true", help="Re-export days already in the manifest")
+    args = parser.parse_args(argv)
+
+    await mysql_manager.connect()
+    try:
+        last = last_closed_day()
+        if args.days:
+            first = last - timedelta(days=args.days - 1)
+        else:
+            first = args.since or await oldest_day()
+        if first is None or first > last:
+            logger.info("No closed days to archive")
+            return
+
+        archived = parquet_archive.manifest().get("days", {})
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        days = [d for d in days if args.force or d.isoformat() not in archived]
+        if not days:
+            logger.info(f"Archive already covers {first} → {last}")
+            return
+
+        columns = await uuid_columns()
+        logger.info(f"Archiving {len(days)} day(s) of {len(columns)} sensors to {parquet_archive.directory}")
+        for day in days:
+            started = time.perf_counter()
+            rows = await export_day(day, columns)
+            logger.info(f"📦 {day}: {rows} readings in {time.perf_counter() - started:.2f}s")
+        logger.info(f"✅ Archive covers {parquet_archive.coverage()}")
+    finally:
+        await mysql_manager.close()
+
+
+if __name__ == "__main__":
+    # Setup basic logging if not using structured
+    import logging
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(main())
@@ -0,0 +1,273 @@
+"""
+Narrow time-series ETL
+Maintains the narrow (uuid, Datetime, value) copy of the wide sensor table.
+
+The wide table stores one column per sensor UUID, so a per-sensor query
+cannot use an index and reads the full width of every row. This script
+keeps SENSOR_NARROW_TABLE (primary key (uuid, Datetime)) in sync:
+
+  python scripts/sensor_etl.py init                 # create tables, set watermarks to the current end
+  python scripts/sensor_etl.py tail [--follow]      # copy rows newer than the high-water mark
+  python scripts/sensor_etl.py backfill [--until]   # copy history below the low-water mark, resumable
+
+The narrow table covers [low_water, high_water) as recorded in
+SENSOR_ETL_WATERMARK_TABLE; each batch inserts its rows and moves the
+watermark in one transaction, so an interrupted run resumes where it stopped.
+Rows are written with INSERT IGNORE, so re-copying an overlap is harmless.
+"""
+import sys
+import os
+import re
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, Dict, Any
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+import aiomysql
+from shared.config import settings
+from shared.utils import get_logger
+
+logger = get_logger("sensor_etl")
+
+UUID_COLUMN_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+INSERT_CHUNK = 5000
+FETCH_CHUNK = 1000
+
+
+def q(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+NARROW_DDL = f"""
+CREATE TABLE IF NOT EXISTS {q(settings.SENSOR_NARROW_TABLE)} (
+    uuid CHAR(36) CHARACTER SET ascii NOT NULL,
+    `Datetime` DATETIME NOT NULL,
+    value DOUBLE NOT NULL,
+    PRIMARY KEY (uuid, `Datetime`)
+) ENGINE=InnoDB
+"""
+
+WATERMARK_DDL = f"""
+CREATE TABLE IF NOT EXISTS {q(settings.SENSOR_ETL_WATERMARK_TABLE)} (
+    name VARCHAR(64) PRIMARY KEY,
+    low_water DATETIME(6) NOT NULL,
+    high_water DATETIME(6) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB
+"""
+
+
+async def connect() -> aiomysql.Connection:
+    """Writable connection (the orchestrator pool is read-only)"""
+    return await aiomysql.connect(
+        host=settings.MYSQL_HOST,
+        port=settings.MYSQL_PORT,
+        user=settings.MYSQL_USER,
+        password=settings.MYSQL_PASSWORD,
+        db=settings.MYSQL_DATABASE,
+        connect_timeout=settings.MYSQL_CONNECT_TIMEOUT,
+        autocommit=False
+    )
+
+
+async def fetch_one(conn, sql: str, params=None):
+    async with conn.cursor() as cursor:
+        await cursor.execute(sql, params)
+        return await cursor.fetchone()
+
+
+async def uuid_columns(conn) -> List[str]:
+    """UUID-named columns of the wide table"""
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+            (settings.MYSQL_DATABASE, settings.SENSOR_DATA_TABLE)
+        )
+        rows = await cursor.fetchall()
+    return [name for (name,) in rows if UUID_COLUMN_RE.match(name)]
+
+
+async def wide_bounds(conn) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Oldest and newest timestamps in the wide table"""
+    row = await fetch_one(conn, f"SELECT MIN(`Datetime`), MAX(`Datetime`) FROM {q(settings.SENSOR_DATA_TABLE)}")
+    return (row[0], row[1]) if row else (None, None)
+
+
+async def read_watermark(conn) -> Optional[Dict[str, Any]]:
+    row = await fetch_one(
+        conn,
+        f"SELECT low_water, high_water FROM {q(settings.SENSOR_ETL_WATERMARK_TABLE)} WHERE name = %s",
+        (settings.SENSOR_NARROW_TABLE,)
+    )
+    return {"low_water": row[0], "high_water": row[1]} if row else None
+
+
+async def move_watermark(conn, column: str, value: datetime):
+    """Update one watermark so tail and backfill can run side by side"""
+    assert column in ("low_water", "high_water")
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            f"UPDATE {q(settings.SENSOR_ETL_WATERMARK_TABLE)} SET {column} = %s WHERE name = %s",
+            (value, settings.SENSOR_NARROW_TABLE)
+        )
+
+
+async def copy_window(read_conn, write_conn, columns: List[str], start: datetime, end: datetime) -> int:
+    """
+    Copy [start, end) from the wide table into the narrow table (not committed)
+
+    Returns:
+        Number of readings written (before INSERT IGNORE de-duplication)
+    """
+    select = (
+        f"SELECT `Datetime`, {', '.join(q(c) for c in columns)} "
+        f"FROM {q(settings.SENSOR_DATA_TABLE)} WHERE `Datetime` >= %s AND `Datetime` < %s"
+    )
+    insert = f"INSERT IGNORE INTO {q(settings.SENSOR_NARROW_TABLE)} (uuid, `Datetime`, value) VALUES (%s, %s, %s)"
+    written = 0
+    pending: List[tuple] = []
+
+    async with read_conn.cursor(aiomysql.SSCursor) as reader, write_conn.cursor() as writer:
+        await reader.execute(select, (start, end))
+        while True:
+            rows = await reader.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            for row in rows:
+                ts = row[0]
+                for column, value in zip(columns, row[1:]):
+                    if value is not None:
+                        pending.append((column, ts, float(value)))
+            if len(pending) >= INSERT_CHUNK:
+                await writer.executemany(insert, pending)
+                written += len(pending)
+                pending = []
+        if pending:
+            await writer.executemany(insert, pending)
+            written += len(pending)
+    return written
+
+
+async def init(conn) -> Dict[str, Any]:
+    """Create the narrow and watermark tables and start both watermarks at the current end"""
+    async with conn.cursor() as cursor:
+        await cursor.execute(NARROW_DDL)
+        await cursor.execute(WATERMARK_DDL)
+    mark = await read_watermark(conn)
+    if mark is None:
+        _, newest = await wide_bounds(conn)
+        start = (newest + timedelta(microseconds=1)) if newest else datetime.utcnow()
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"INSERT IGNORE INTO {q(settings.SENSOR_ETL_WATERMARK_TABLE)} (name, low_water, high_water) "
+                "VALUES (%s, %s, %s)",
+                (settings.SENSOR_NARROW_TABLE, start, start)
+            )
+        mark = {"low_water": start, "high_water": start}
+        logger.info(f"✅ Created {settings.SENSOR_NARROW_TABLE}; watermarks start at {start}")
+    await conn.commit()
+    return mark
+
+
+async def tail(follow: bool = False):
+    """Copy rows newer than the high-water mark in SENSOR_ETL_BATCH_MINUTES windows"""
+    read_conn, write_conn = await connect(), await connect()
+    try:
+        await init(write_conn)
+        columns = await uuid_columns(read_conn)
+        batch = timedelta(minutes=settings.SENSOR_ETL_BATCH_MINUTES)
+        overlap = timedelta(seconds=settings.SENSOR_ETL_OVERLAP_SECONDS)
+        while True:
+            mark = await read_watermark(write_conn)
+            _, newest = await wide_bounds(read_conn)
+            await read_conn.commit()  # end the snapshot so the next MAX() sees new rows
+            limit = newest + timedelta(microseconds=1) if newest else mark["high_water"]
+            copied = 0
+            while mark["high_water"] < limit:
+                start = time.perf_counter()
+                hi = min(mark["high_water"] + batch, limit)
+                lo = max(mark["low_water"], mark["high_water"] - overlap)
+                copied += await copy_window(read_conn, write_conn, columns, lo, hi)
+                await move_watermark(write_conn, "high_water", hi)
+                await write_conn.commit()
+                mark["high_water"] = hi
+                logger.info(f"📦 Tail copied [{lo} → {hi}) in {time.perf_counter() - start:.2f}s")
+            if copied:
+                logger.info(f"✅ High-water mark at {mark['high_water']} ({copied} readings)")
+            if not follow:
+                break
+            await asyncio.sleep(settings.SENSOR_ETL_INTERVAL)
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+
+async def backfill(until: Optional[datetime] = None, batch_hours: Optional[int] = None):
+    """
+    Copy history below the low-water mark, newest first, in large batches
+
+    Args:
+        until: Stop once the low-water mark reaches this time (default: oldest wide row)
+        batch_hours: Hours per batch (default SENSOR_BACKFILL_BATCH_HOURS)
+    """
+    read_conn, write_conn = await connect(), await connect()
+    try:
+        mark = await init(write_conn)
+        columns = await uuid_columns(read_conn)
+        oldest, _ = await wide_bounds(read_conn)
+        floor = max(until, oldest) if until and oldest else (until or oldest)
+        if floor is None:
+            logger.info("Wide table is empty, nothing to backfill")
+            return
+        batch = timedelta(hours=batch_hours or settings.SENSOR_BACKFILL_BATCH_HOURS)
+        logger.info(f"Backfilling {settings.SENSOR_NARROW_TABLE} from {mark['low_water']} down to {floor}")
+        while mark["low_water"] > floor:
+            start = time.perf_counter()
+            hi = mark["low_water"]
+            lo = max(hi - batch, floor)
+            written = await copy_window(read_conn, write_conn, columns, lo, hi)
+            await move_watermark(write_conn, "low_water", lo)
+            await write_conn.commit()
+            mark["low_water"] = lo
+            logger.info(f"📦 Backfilled [{lo} → {hi}) {written} readings in {time.perf_counter() - start:.2f}s")
+        logger.info(f"✅ Backfill complete, narrow table covers [{mark['low_water']} → {mark['high_water']})")
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Maintain the narrow sensor readings table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="Create tables and watermarks")
+    tail_cmd = sub.add_parser("tail", help="Copy rows newer than the high-water mark")
+    tail_cmd.add_argument("--follow", action="store_true", help="Keep running every SENSOR_ETL_INTERVAL seconds")
+    backfill_cmd = sub.add_parser("backfill", help="Copy history below the low-water mark (resumable)")
+    backfill_cmd.add_argument("--until", type=datetime.fromisoformat, help="Oldest timestamp to copy (ISO)")
+    backfill_cmd.add_argument("--batch-hours", type=int, help="Hours per batch")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        conn = await connect()
+        try:
+            await init(conn)
+        finally:
+            conn.close()
+    elif args.command == "tail":
+        await tail(follow=args.follow)
+    else:
+        await backfill(until=args.until, batch_hours=args.batch_hours)
+
+
+if __name__ == "__main__":
+    # Setup basic logging if not using structured
+    import logging
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(main())
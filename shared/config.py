@@ -112,6 +112,46 @@ class Settings(BaseSettings):
     MYSQL_USER: str = Field(default="root", description="MySQL username")
     MYSQL_PASSWORD: str = Field(default="mysql", description="MySQL password")
     MYSQL_DATABASE: str = Field(default="abacws", description="MySQL database name")
+    MYSQL_POOL_MIN_SIZE: int = Field(default=1, description="Minimum pooled MySQL connections")
+    MYSQL_POOL_MAX_SIZE: int = Field(default=10, description="Maximum pooled MySQL connections")
+    MYSQL_POOL_RECYCLE: int = Field(default=3600, description="Recycle pooled MySQL connections older than this (seconds)")
+    MYSQL_POOL_PING_INTERVAL: int = Field(default=30, description="Ping pooled connections idle longer than this before use (seconds)")
+    MYSQL_CONNECT_TIMEOUT: int = Field(default=10, description="MySQL connect timeout (seconds)")
+    MYSQL_QUERY_TIMEOUT: float = Field(default=30.0, description="Per-query MySQL timeout (seconds)")
+    MYSQL_SLOW_QUERY_SECONDS: float = Field(default=2.0, description="Log MySQL statements slower than this (seconds)")
+    MYSQL_READ_ONLY: bool = Field(default=True, description="Open pooled MySQL sessions in read-only transaction mode")
+    MYSQL_TIMEZONE: str = Field(default="UTC", description="Time zone of naive DATETIME values stored in MySQL")
+    SENSOR_DATA_TABLE: str = Field(default="sensor_data", description="Wide time-series table (one column per sensor UUID)")
+    SQL_UUID_FETCH_LIMIT: int = Field(default=50000, description="Total readings budget for a UUID fetch (shared across batches)")
+    SQL_FETCH_MAX_BYTES: int = Field(default=67108864, description="Total in-memory bytes budget for a UUID fetch")
+    SQL_FETCH_BATCH_SIZE: int = Field(default=10, description="UUIDs per fetch batch")
+    SQL_FETCH_CONCURRENCY: int = Field(default=4, description="Max batches fetched concurrently per request (keep below MYSQL_POOL_MAX_SIZE)")
+    SQL_TARGET_POINTS: int = Field(default=500, description="Target points per sensor when a window is aggregated into time buckets")
+    SQL_RAW_WINDOW_HOURS: float = Field(default=6.0, description="Windows up to this many hours are fetched as raw rows; longer ones are bucketed")
+    SENSOR_NARROW_TABLE: str = Field(default="sensor_readings", description="Narrow (uuid, Datetime, value) table maintained by scripts/sensor_etl.py")
+    SENSOR_ETL_WATERMARK_TABLE: str = Field(default="etl_watermarks", description="Table holding the narrow-table ETL high-water marks")
+    SQL_USE_NARROW_TABLE: bool = Field(default=True, description="Read the narrow table (up to its high-water mark) when it exists")
+    SENSOR_ETL_BATCH_MINUTES: int = Field(default=60, description="Time span copied per incremental ETL batch")
+    SENSOR_ETL_OVERLAP_SECONDS: int = Field(default=300, description="Re-scan this far behind the high-water mark to pick up late rows")
+    SENSOR_ETL_INTERVAL: int = Field(default=30, description="Seconds between incremental ETL runs in --follow mode")
+    SENSOR_BACKFILL_BATCH_HOURS: int = Field(default=24, description="Time span copied per backfill batch")
+    TS_CACHE_BACKEND: str = Field(default="disk", description="Closed time-series chunk cache: disk, redis or off")
+    TS_CACHE_DIR: str = Field(default="outputs/cache/timeseries", description="Directory for the disk chunk cache")
+    TS_CACHE_CHUNK_SECONDS: int = Field(default=3600, description="Minimum cache chunk width (raw fetches use exactly this)")
+    TS_CACHE_BUCKETS_PER_CHUNK: int = Field(default=96, description="Buckets per cache chunk for aggregated fetches")
+    TS_CACHE_SETTLE_SECONDS: int = Field(default=600, description="Chunks ending at least this long ago are closed and cacheable")
+    ARCHIVE_ENABLED: bool = Field(default=True, description="Serve archived days from the Parquet cold tier")
+    ARCHIVE_DIR: str = Field(default="outputs/archive/sensor_data", description="Root of the day/group partitioned Parquet archive")
+    ARCHIVE_SENSOR_GROUPS: int = Field(default=16, description="Sensor groups (files) per archived day")
+    ARCHIVE_MIN_AGE_HOURS: int = Field(default=6, description="A day is archived once it ended at least this long ago")
+    ARCHIVE_COMPRESSION: str = Field(default="zstd", description="Parquet compression codec")
+    ARCHIVE_ROW_GROUP_SIZE: int = Field(default=100000, description="Rows per Parquet row group")
+    STORAGE_BACKENDS_FILE: str = Field(default="data/storage_backends.json", description="JSON mapping of ref:storedAt IRIs to storage backends")
+    TIME_ZONE: str = Field(default="Europe/London", description="Local zone for natural-language time expressions")
+    TIME_WINDOW_ALIGN_SECONDS: int = Field(default=60, description="Resolved time windows are snapped to multiples of this (UTC)")
+    SCHEMA_CHECK_INTERVAL: int = Field(default=60, description="Seconds between schema fingerprint checks")
+    SCHEMA_CATALOG_TTL: int = Field(default=86400, description="TTL of the cached schema catalog in Redis (seconds)")
+    SCHEMA_WIDE_TABLE_MIN_UUIDS: int = Field(default=5, description="Tables with at least this many UUID-named columns are treated as wide sensor tables")
     
     RAG_SERVICE_URL: str = Field(default="http://rag-service:8001", description="RAG service URL")
     CODE_EXECUTOR_URL: str = Field(default="http://code-executor:8002", description="Code executor URL")
@@ -128,6 +168,15 @@ class Settings(BaseSettings):
         default="http://localhost:8000",
         description="Base URL (including protocol) for serving static artifacts such as plots"
     )
+    MEDIA_DIR: str = Field(default="outputs/media", description="Content-addressed media store served at /media/{hash}")
+    MEDIA_MAX_BYTES: int = Field(default=536870912, description="Size cap of the media store; least recently served images are evicted")
+    MEDIA_THUMBNAIL_SIZE: int = Field(default=320, description="Longest side of media thumbnails (px)")
+    MEDIA_WEBP_QUALITY: int = Field(default=85, description="Quality of WebP media variants")
+    MEDIA_CACHE_MAX_AGE: int = Field(default=31536000, description="Cache-Control max-age for /media responses (seconds)")
+    CHART_PLOTLY_JS_URL: str = Field(
+        default="https://cdn.plot.ly/plotly-2.27.0.min.js",
+        description="plotly.js bundle loaded by /charts pages"
+    )
     
     # ==================== Building Configuration ====================
     BUILDING_ID: str = Field(default="bldg1", description="Building identifier (bldg1, bldg2, bldg3)")
@@ -150,8 +199,47 @@ class Settings(BaseSettings):
     
     # ==================== Security & Limits ====================
     CODE_EXECUTOR_TIMEOUT: int = Field(default=30, description="Code execution timeout in seconds")
-    CODE_EXECUTOR_MEMORY_LIMIT: str = Field(default="1g", description="Memory limit for code execution")
-    CODE_EXECUTOR_CPU_LIMIT: float = Field(default=1.0, description="CPU limit for code execution")
+    CODE_EXECUTOR_MEMORY_LIMIT: str = Field(
+        default="1g",
+        description="Address space a job may add to its worker (RLIMIT_AS), e.g. 512m, 1g"
+    )
+    CODE_EXECUTOR_CPU_LIMIT: float = Field(
+        default=1.0,
+        description="CPU cores a job may use on average over its timeout (enforced as an RLIMIT_CPU budget)"
+    )
+    CODE_EXECUTOR_CPU_SECONDS: float = Field(
+        default=0.0,
+        description="CPU-time budget per job in seconds (0 = 80% of CODE_EXECUTOR_CPU_LIMIT x the job's timeout)"
+    )
+    CODE_EXECUTOR_MAX_OUTPUT_BYTES: int = Field(default=1048576, description="Cap on captured stdout/stderr per execution")
+    CODE_EXECUTOR_WORKERS: int = Field(default=0, description="Pre-forked sandbox worker processes (0 = one per CPU)")
+    CODE_EXECUTOR_MAX_JOBS_PER_WORKER: int = Field(default=200, description="Jobs after which a sandbox worker is replaced")
+    CODE_EXECUTOR_WORKER_RECYCLE_MB: int = Field(
+        default=768,
+        description="Resident memory (MB) after which a sandbox worker is replaced once its job finishes"
+    )
+    CODE_EXECUTOR_SESSIONS: bool = Field(
+        default=True,
+        description="Run requests with a session_id in a persistent per-conversation worker"
+    )
+    CODE_EXECUTOR_MAX_SESSIONS: int = Field(
+        default=8,
+        description="Concurrent analysis sessions; opening another evicts the least recently used idle one"
+    )
+    CODE_EXECUTOR_SESSION_TTL: int = Field(default=900, description="Seconds an idle analysis session is kept")
+    CODE_EXECUTOR_SESSION_MAX_MB: int = Field(
+        default=1024,
+        description="Resident memory (MB) after which an analysis session is ended once its cell finishes"
+    )
+    CODE_EXECUTOR_ATTACHMENT_DIR: str = Field(
+        default="/app/outputs/attachments",
+        description="Shared directory for Arrow attachment artifacts (mounted in orchestrator and code executor)"
+    )
+    CODE_EXECUTOR_INLINE_ATTACHMENT_BYTES: int = Field(
+        default=1048576,
+        description="Arrow attachments up to this size travel inline in the request; larger ones as artifacts"
+    )
+    CODE_EXECUTOR_ATTACHMENT_TTL: int = Field(default=3600, description="Seconds before unused attachment artifacts are pruned")
     
     MAX_RETRY_ATTEMPTS: int = Field(default=3, description="Max retry attempts for error recovery")
     
@@ -175,6 +263,56 @@ class Settings(BaseSettings):
     )
     MAX_CONVERSATION_HISTORY: int = Field(default=20, description="Max messages to keep in conversation history")
     
+    # ==================== Response Rendering ====================
+    DETERMINISTIC_RENDERING: bool = Field(
+        default=True,
+        description="Render small/tabular SPARQL and SQL results with templates instead of an LLM call"
+    )
+    RENDER_MAX_ROWS: int = Field(default=25, description="Max rows shown by deterministic templates before truncating")
+    RENDER_MAX_COLUMNS: int = Field(default=4, description="Results with more columns than this are summarised by the LLM")
+    RENDER_NARRATIVE_PERSONAS: str = Field(
+        default="stakeholder",
+        description="Comma-separated personas that always receive an LLM-written narrative"
+    )
+    ANALYTICS_NATIVE_ENGINE: bool = Field(
+        default=True,
+        description="Answer common statistics questions in-process instead of generating code"
+    )
+    CODE_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Reuse generated analytics code that ran successfully for the same intent and data schema"
+    )
+    CODE_CACHE_TTL: int = Field(default=604800, description="TTL of cached analytics code in Redis (seconds)")
+    CHART_SPECS_ENABLED: bool = Field(
+        default=True,
+        description="Build common charts as Plotly specs from the data instead of generating matplotlib code"
+    )
+    CHART_PNG_RENDER: bool = Field(
+        default=False,
+        description="Also rasterise chart specs to PNG in the code executor (in the background)"
+    )
+    PLOT_DOWNSAMPLING: bool = Field(
+        default=True,
+        description="Reduce plotted series with LTTB (keeping the min/max envelope) before charting"
+    )
+    PLOT_TARGET_WIDTH: int = Field(default=1000, description="Target chart width in pixels, used for the plot point budget")
+    DOWNSAMPLE_POINTS_PER_PIXEL: float = Field(
+        default=2.0,
+        description="Plotted points per pixel of chart width, shared across all series of a chart"
+    )
+    DOWNSAMPLE_MIN_POINTS: int = Field(default=100, description="Minimum points kept per series, however many series are plotted")
+    
+    # ==================== Ontology Index ====================
+    CLASS_INDEX_REFRESH_INTERVAL: int = Field(
+        default=600,
+        description="Seconds between class index freshness checks (0 disables background refresh)"
+    )
+    CLASS_INDEX_SNAPSHOT_TTL: int = Field(default=604800, description="TTL of the shared class index snapshot in Redis (seconds)")
+    CLASS_INDEX_SNAPSHOT_PATH: str = Field(
+        default="outputs/cache/class_index.json",
+        description="Local mirror of the class index used for cold starts"
+    )
+    
     # ==================== Logging ====================
     LOG_LEVEL: str = Field(default="INFO", description="Logging level: DEBUG, INFO, WARNING, ERROR")
     
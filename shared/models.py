@@ -65,6 +65,17 @@ class EmbeddingRequest(BaseModel):
 
 # ==================== Code Execution Models ====================
 
+class DataAttachment(BaseModel):
+    """Named dataset exposed to sandboxed code as a pandas DataFrame"""
+    name: str = Field(..., description="Variable name the DataFrame is bound to (e.g., df)")
+    format: Literal["arrow", "artifact"] = Field(..., description="Inline Arrow IPC bytes or a shared artifact handle")
+    data: Optional[str] = Field(default=None, description="Base64 Arrow IPC stream (format=arrow)")
+    artifact: Optional[str] = Field(
+        default=None,
+        description="Arrow IPC file name in the shared attachment directory (format=artifact)"
+    )
+    rows: Optional[int] = Field(default=None, description="Row count, for logging")
+
 class CodeExecutionRequest(BaseModel):
     """Request to execute Python code in sandbox"""
     code: str = Field(..., description="Python code to execute")
@@ -73,6 +84,34 @@ class CodeExecutionRequest(BaseModel):
         default=None,
         description="Context variables to inject (e.g., df, sensor_data)"
     )
+    attachments: List[DataAttachment] = Field(
+        default_factory=list,
+        description="Datasets loaded as DataFrames before the code runs (kept out of the source)"
+    )
+    session_id: Optional[str] = Field(
+        default=None,
+        description="Conversation ID: run as the next cell of that conversation's persistent session"
+    )
+    profile_top: int = Field(
+        default=0,
+        description="Include the N functions with the most cumulative time (cProfile) in the result; 0 = off"
+    )
+
+class ExecutionProfile(BaseModel):
+    """Where one execution's time, CPU and memory went (measured in the worker)"""
+    queue_wait: Optional[float] = Field(default=None, description="Seconds from submission until a worker started the job")
+    load_time: float = Field(default=0.0, description="Seconds decoding attachments into DataFrames")
+    compile_time: float = Field(default=0.0, description="Seconds compiling the code")
+    run_time: float = Field(default=0.0, description="Seconds executing the compiled code")
+    wall_time: float = Field(default=0.0, description="Seconds from job start to result in the worker")
+    cpu_time: float = Field(default=0.0, description="CPU seconds (user + system) the worker used for the job")
+    peak_rss_delta: int = Field(default=0, description="Peak resident memory above the job's starting RSS (bytes)")
+    input_bytes: int = Field(default=0, description="Code plus attachment payload (bytes)")
+    output_bytes: int = Field(default=0, description="Captured stdout and stderr (bytes)")
+    functions: Optional[List[Dict[str, Any]]] = Field(
+        default=None,
+        description="Top functions by cumulative time, when profile_top was requested"
+    )
 
 class CodeExecutionResult(BaseModel):
     """Result from code execution"""
@@ -82,6 +121,19 @@ class CodeExecutionResult(BaseModel):
     result: Optional[Any] = Field(default=None, description="Execution result value")
     error: Optional[str] = Field(default=None, description="Error message if failed")
     execution_time: float = Field(..., description="Execution time in seconds")
+    failure_reason: Optional[Literal[
+        "forbidden_operation", "attachment_error", "exception", "timeout",
+        "cpu_limit", "memory_limit", "output_limit", "worker_crashed"
+    ]] = Field(default=None, description="Why execution failed (None on success)")
+    session_cell: Optional[int] = Field(
+        default=None,
+        description="Cell number within the session (1 = new session: no variables from earlier cells)"
+    )
+    session_variables: Optional[List[str]] = Field(
+        default=None,
+        description="Variables the session holds after this cell (attachments and pre-imported modules excluded)"
+    )
+    profile: Optional[ExecutionProfile] = Field(default=None, description="Timing and resource breakdown")
 
 # ==================== STT Models ====================
 
@@ -177,6 +229,11 @@ class ConversationState(BaseModel):
     intent: Optional[str] = Field(default=None, description="Detected user intent (preferred field)")
     intermediate_results: Dict[str, Any] = Field(default_factory=dict, description="Temporary results between agents")
     query_results: Any = Field(default_factory=dict, description="Last query results (SPARQL/SQL)")
+    query_frame: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="Columnar SeriesFrame behind query_results when they are fetched readings (in-process only, not persisted)"
+    )
     user_preferences: Dict[str, Any] = Field(default_factory=dict, description="User preferences/persona/language")
     
     # Intent understanding
@@ -0,0 +1,100 @@
+"""
+Sandbox policy shared by the code executor and the orchestrator
+Single source for what generated code may import and call.
+
+The executor enforces it at run time (CodeSandbox); the orchestrator checks
+generated code against it before any round-trip (code_validator), so code
+that passes locally is never rejected remotely.
+"""
+import ast
+from typing import List
+
+# Allowed imports - whitelist approach (submodules of these roots are allowed)
+ALLOWED_IMPORTS = {
+    'pandas',
+    'numpy',
+    'matplotlib',
+    'matplotlib.pyplot',
+    'seaborn',
+    'plotly',
+    'plotly.graph_objects',
+    'plotly.express',
+    'datetime',
+    'json',
+    'math',
+    'time',
+    'statistics',
+    'collections',
+    'itertools',
+}
+ALLOWED_ROOTS = {name.split('.')[0] for name in ALLOWED_IMPORTS}
+
+# Forbidden imports - blacklist (extra safety)
+FORBIDDEN_IMPORTS = {
+    'os',
+    'sys',
+    'subprocess',
+    'socket',
+    'requests',
+    'urllib',
+    'pickle',
+    'shelve',
+    '__import__',
+    'eval',
+    'exec',
+    'compile',
+    'open',  # File I/O
+    'file',
+}
+
+# Builtins that may not be called from generated code ('__import__' may not even be referenced)
+FORBIDDEN_CALLS = {'eval', 'exec', 'compile', 'open', 'file'}
+
+# Builtins available to generated code (everything else raises NameError)
+SAFE_BUILTIN_NAMES = {
+    'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'filter', 'float', 'int', 'len',
+    'list', 'map', 'max', 'min', 'print', 'range', 'round', 'set', 'sorted', 'str',
+    'sum', 'tuple', 'type', 'zip', 'isinstance', 'getattr', 'hasattr', 'setattr',
+    # Exception classes needed for error handling
+    'Exception', 'KeyError', 'ValueError', 'TypeError', 'IndexError', 'AttributeError',
+}
+
+# Modules bound before the code runs: module name -> alias
+PREIMPORTS = {
+    'pandas': 'pd',
+    'numpy': 'np',
+    'matplotlib.pyplot': 'plt',
+    'plotly.graph_objects': 'go',
+    'plotly.express': 'px',
+    'math': 'math',
+    'statistics': 'stats',
+}
+
+
+def import_allowed(name: str) -> bool:
+    """Whether a module (or submodule) may be imported"""
+    root = name.split('.')[0]
+    return root not in FORBIDDEN_IMPORTS and (name in ALLOWED_IMPORTS or root in ALLOWED_ROOTS)
+
+
+def policy_violations(tree: ast.AST) -> List[str]:
+    """
+    Forbidden imports and calls in parsed code
+
+    Returns:
+        Human-readable violations (empty when the code is allowed)
+    """
+    violations = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if not import_allowed(alias.name):
+                    violations.append(f"line {node.lineno}: import of '{alias.name}' is not permitted")
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or not import_allowed(node.module or ''):
+                violations.append(f"line {node.lineno}: import from '{node.module}' is not permitted")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FORBIDDEN_CALLS:
+            violations.append(f"line {node.lineno}: call to '{node.func.id}()' is not permitted")
+        elif isinstance(node, ast.Name) and node.id == '__import__':
+            violations.append(f"line {node.lineno}: '__import__' is not permitted")
+    return violations
@@ -0,0 +1,91 @@
+"""
+Unit tests for the in-process analytics engine (no services needed)
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+
+from shared.config import settings
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.analytics_engine import analytics_engine, parse_request, zone_offsets
+
+
+class TestParseRequest:
+    """Question parsing"""
+
+    @pytest.mark.parametrize("query,statistic", [
+        ("average temperature over 24 hours", "mean"),
+        ("max co2 over 12 hours", "max"),
+        ("minimum humidity over the last 7 days", "min"),
+    ])
+    def test_window_is_not_a_threshold(self, query, statistic):
+        request = parse_request(query)
+        assert request.operation == "summary"
+        assert statistic in request.statistics
+
+    @pytest.mark.parametrize("query,threshold,direction", [
+        ("how long was co2 above 1000", 1000.0, "above"),
+        ("temperature over 21 degrees", 21.0, "above"),
+        ("when was humidity below 30.5.", 30.5, "below"),
+        ("readings less than -2", -2.0, "below"),
+    ])
+    def test_threshold(self, query, threshold, direction):
+        request = parse_request(query)
+        assert request.operation == "threshold"
+        assert request.threshold == threshold
+        assert request.direction == direction
+
+    def test_rolling_window(self):
+        request = parse_request("rolling average over 3 hours")
+        assert request.operation == "rolling"
+        assert request.window_seconds == 3 * 3600
+
+    @pytest.mark.parametrize("query,bucket", [("daily average", 86400), ("mean per 15 minutes", 900)])
+    def test_resample(self, query, bucket):
+        request = parse_request(query)
+        assert request.operation == "resample"
+        assert request.bucket_seconds == bucket
+
+    def test_percentiles(self):
+        assert parse_request("95th percentile and median").percentiles == (50.0, 95.0)
+
+    @pytest.mark.parametrize("query", ["plot temperature", "forecast co2 for tomorrow", "hello"])
+    def test_needs_code_generation(self, query):
+        assert parse_request(query) is None
+
+    def test_correlation_needs_two_sensors(self):
+        assert parse_request("correlation between a and b", sensor_count=1) is None
+        assert parse_request("correlation between a and b", sensor_count=2).operation == "correlation"
+
+
+class TestResample:
+    """Daily buckets follow the local calendar"""
+
+    @pytest.fixture(autouse=True)
+    def zones(self, monkeypatch):
+        monkeypatch.setattr(settings, "MYSQL_TIMEZONE", "UTC")
+        monkeypatch.setattr(settings, "TIME_ZONE", "Europe/London")
+
+    def test_zone_offsets(self):
+        seconds = np.array(["2024-01-15T12:00", "2024-07-15T12:00"], dtype="datetime64[s]").astype(np.int64)
+        assert zone_offsets(seconds, "UTC", "Europe/London").tolist() == [0, 3600]
+
+    def test_daily_buckets_in_bst(self):
+        frame = SeriesFrame({
+            "timestamp": np.array(["2024-06-01T22:30", "2024-06-01T23:30", "2024-06-02T12:00"], dtype="datetime64[us]"),
+            "uuid": ["a", "a", "a"],
+            "value": [1.0, 2.0, 3.0],
+        })
+        result = analytics_engine.answer("daily average", frame)
+        # 23:30 UTC is 00:30 BST: it belongs to 2 June
+        assert [row["local_start"] for row in result.rows] == ["2024-06-01T00:00:00", "2024-06-02T00:00:00"]
+        assert [row["timestamp"] for row in result.rows] == ["2024-05-31T23:00:00", "2024-06-01T23:00:00"]
+        assert [row["mean"] for row in result.rows] == [1.0, 2.5]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
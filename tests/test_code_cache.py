@@ -0,0 +1,71 @@
+"""
+Unit tests for analytics code cache keys and templates (no services needed)
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from orchestrator.services.series_frame import SeriesFrame
+from orchestrator.services.code_cache import CodeCache, normalise_intent, schema_signature
+
+METADATA = {
+    "0f8fad5b-d9cb-469f-a165-70867728950e": {"label": "Zone Air Temperature 5.01"},
+    "7c9e6679-7425-40de-944b-e07fc1f90ae7": {"label": "Zone Air Temperature 5.01 Setpoint"},
+}
+OTHER_METADATA = {
+    "16fd2706-8baf-433b-82eb-8c7fada847da": {"label": "Zone CO2 Level 4.12"},
+    "886313e1-3b8a-5372-9b90-0c9aee199e5d": {"label": "Zone CO2 Level 4.12 Setpoint"},
+}
+
+
+class TestNormaliseIntent:
+    """Intent keys ignore time windows, sensors and wording"""
+
+    def test_synonyms_and_time_windows(self):
+        assert normalise_intent("What is the average temperature over the last 7 days?") == \
+            normalise_intent("avg temperature yesterday")
+
+    def test_sensor_labels_and_uuids_removed(self):
+        query = "daily max of Zone Air Temperature 5.01 (0f8fad5b-d9cb-469f-a165-70867728950e)"
+        assert normalise_intent(query, METADATA) == normalise_intent("daily maximum", METADATA)
+
+    def test_numbers_kept(self):
+        assert normalise_intent("hours above 25") != normalise_intent("hours above 30")
+
+    def test_different_analyses_differ(self):
+        assert normalise_intent("average temperature") != normalise_intent("maximum temperature")
+
+
+class TestTemplates:
+    """Stored code is a template filled with the current request's sensors"""
+
+    def test_round_trip_to_other_sensors(self):
+        cache = CodeCache()
+        code = (
+            "a = df[df.uuid == '0f8fad5b-d9cb-469f-a165-70867728950e']\n"
+            "b = df[df.uuid == '7c9e6679-7425-40de-944b-e07fc1f90ae7']\n"
+            "plt.title('Zone Air Temperature 5.01 Setpoint vs Zone Air Temperature 5.01')\n"
+            "plt.savefig('/app/outputs/plot_alice_20240601_120000.png')\n"
+        )
+        template = cache._to_template(code, METADATA)
+        assert "0f8fad5b" not in template and "Zone Air" not in template and "{{PLOT_FILE}}" in template
+
+        reused = cache._from_template(template, OTHER_METADATA, "plot_bob_20240602_090000.png")
+        assert "16fd2706-8baf-433b-82eb-8c7fada847da" in reused
+        assert "'Zone CO2 Level 4.12 Setpoint vs Zone CO2 Level 4.12'" in reused
+        assert "plot_bob_20240602_090000.png" in reused
+
+    def test_schema_signature_counts_sensors(self):
+        one = SeriesFrame.from_records([{"timestamp": "2024-06-01T00:00:00", "uuid": "a", "value": 1.0}])
+        two = SeriesFrame.from_records([
+            {"timestamp": "2024-06-01T00:00:00", "uuid": "a", "value": 1.0},
+            {"timestamp": "2024-06-01T00:00:00", "uuid": "b", "value": 2.0},
+        ])
+        assert schema_signature(one) != schema_signature(two)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
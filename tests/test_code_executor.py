@@ -1,6 +1,9 @@
 """
 Test suite for Code Executor
 """
+import json
+import uuid
+import asyncio
 import pytest
 import httpx
 
@@ -81,5 +84,277 @@ os.system('ls')
         data = response.json()
         assert data["valid"] is False
 
+    @pytest.mark.asyncio
+    async def test_arrow_attachment(self, client):
+        """Test that an Arrow attachment is bound as a DataFrame"""
+        import base64
+        import pyarrow as pa
+
+        table = pa.table({"uuid": ["a", "a", "b"], "value": [1.0, 2.0, 3.0]})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        attachment = {
+            "name": "df",
+            "format": "arrow",
+            "data": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+        }
+        code = "print(len(df), df.groupby('uuid')['value'].sum().to_dict())"
+        response = await client.post("/execute", json={"code": code, "attachments": [attachment]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert "3 {'a': 3.0, 'b': 3.0}" in data["stdout"]
+
+    @pytest.mark.asyncio
+    async def test_attachment_name_rejected(self, client):
+        """Test that attachments cannot shadow sandbox names"""
+        response = await client.post("/execute", json={
+            "code": "print(1)",
+            "attachments": [{"name": "pd", "format": "artifact", "artifact": "../x.arrow"}]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is False
+        assert "Attachment error" in data["error"]
+
+class TestWorkerPool:
+    """Test the pre-forked worker pool"""
+
+    @pytest.mark.asyncio
+    async def test_pool_metrics(self, client):
+        """Test that /metrics reports the pool"""
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        pool = response.json()["pool"]
+        assert pool["workers"] >= 1
+        for key in ("busy", "idle", "queue_depth", "utilisation", "jobs", "timeouts", "crashes"):
+            assert key in pool
+
+    @pytest.mark.asyncio
+    async def test_concurrent_executions(self, client):
+        """Test that concurrent executions each get their own output"""
+        before = (await client.get("/metrics")).json()["pool"]["jobs"]
+        responses = await asyncio.gather(*[
+            client.post("/execute", json={"code": f"import time\ntime.sleep(0.2)\nprint('job {i}')"})
+            for i in range(6)
+        ])
+        for i, response in enumerate(responses):
+            data = response.json()
+            assert data["success"] is True
+            assert data["stdout"] == f"job {i}\n"
+        after = (await client.get("/metrics")).json()["pool"]["jobs"]
+        assert after - before >= 6
+
+    @pytest.mark.asyncio
+    async def test_worker_replaced_after_timeout(self, client):
+        """Test that the pool keeps serving after a worker is killed for a timeout"""
+        response = await client.post("/execute", json={"code": "import time\ntime.sleep(10)", "timeout": 1})
+        assert response.json()["success"] is False
+        response = await client.post("/execute", json={"code": "print('still serving')"})
+        data = response.json()
+        assert data["success"] is True
+        assert "still serving" in data["stdout"]
+
+class TestLimits:
+    """Test that each limit is reported as its own failure_reason"""
+
+    @pytest.mark.asyncio
+    async def test_timeout(self, client):
+        """Test the wall-clock limit"""
+        response = await client.post("/execute", json={"code": "import time\ntime.sleep(10)", "timeout": 1})
+        data = response.json()
+        assert data["success"] is False
+        assert data["failure_reason"] == "timeout"
+
+    @pytest.mark.asyncio
+    async def test_cpu_limit(self, client):
+        """Test the CPU budget (80% of CODE_EXECUTOR_CPU_LIMIT cores x the timeout by default)"""
+        response = await client.post("/execute", json={"code": "while True:\n    pass", "timeout": 3})
+        data = response.json()
+        assert data["success"] is False
+        assert data["failure_reason"] == "cpu_limit"
+
+    @pytest.mark.asyncio
+    async def test_memory_limit(self, client):
+        """Test the address-space limit"""
+        response = await client.post("/execute", json={"code": "x = np.ones(2 ** 30)"})
+        data = response.json()
+        assert data["success"] is False
+        assert data["failure_reason"] == "memory_limit"
+        assert "MemoryError" in data["error"]
+
+    @pytest.mark.asyncio
+    async def test_output_limit(self, client):
+        """Test the captured-output cap"""
+        code = "for _ in range(5000):\n    print('x' * 1000)"
+        response = await client.post("/execute", json={"code": code})
+        data = response.json()
+        assert data["success"] is False
+        assert data["failure_reason"] == "output_limit"
+        assert len(data["stdout"]) < 5000 * 1001
+
+    @pytest.mark.asyncio
+    async def test_failures_counted(self, client):
+        """Test that /metrics counts failures by reason"""
+        await client.post("/execute", json={"code": "import time\ntime.sleep(10)", "timeout": 1})
+        failures = (await client.get("/metrics")).json()["executions"]["failures"]
+        assert failures.get("timeout", 0) >= 1
+
+class TestStreaming:
+    """Test /execute/stream"""
+
+    @staticmethod
+    async def events(client, payload):
+        """Server-sent events of one streamed execution, up to [DONE]"""
+        events = []
+        async with client.stream("POST", "/execute/stream", json=payload) as response:
+            assert response.status_code == 200
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if line == "data: [DONE]":
+                    return events
+                events.append(json.loads(line[len("data: "):]))
+        raise AssertionError("stream ended without [DONE]")
+
+    @pytest.mark.asyncio
+    async def test_output_streamed_before_result(self, client):
+        """Test that output arrives as chunks, then the complete result"""
+        code = "import time\nprint('first')\ntime.sleep(0.5)\nprint('second')"
+        events = await self.events(client, {"code": code})
+        chunks = [e for e in events if e["type"] == "stdout"]
+        assert "".join(c["content"] for c in chunks) == "first\nsecond\n"
+        assert events[-1]["type"] == "result"
+        result = events[-1]["result"]
+        assert result["success"] is True
+        assert result["stdout"] == "first\nsecond\n"
+
+    @pytest.mark.asyncio
+    async def test_failure_ends_with_result(self, client):
+        """Test that a failing execution still ends with its result"""
+        events = await self.events(client, {"code": "print('before')\nraise ValueError('boom')"})
+        assert any(e["type"] == "stdout" and "before" in e["content"] for e in events)
+        result = events[-1]["result"]
+        assert result["success"] is False
+        assert result["failure_reason"] == "exception"
+        assert "boom" in result["error"]
+
+class TestSessions:
+    """Test per-conversation analysis sessions"""
+
+    @pytest.fixture
+    async def session_id(self, client):
+        if not (await client.get("/metrics")).json()["sessions"]["enabled"]:
+            pytest.skip("CODE_EXECUTOR_SESSIONS is off")
+        session_id = f"test-{uuid.uuid4()}"
+        yield session_id
+        await client.delete(f"/sessions/{session_id}")
+
+    @pytest.mark.asyncio
+    async def test_variables_persist(self, client, session_id):
+        """Test that variables carry over from cell to cell"""
+        response = await client.post("/execute", json={"code": "x = 41\n_hidden = 1", "session_id": session_id})
+        data = response.json()
+        assert data["success"] is True
+        assert data["session_cell"] == 1
+        assert data["session_variables"] == ["x"]
+
+        response = await client.post("/execute", json={"code": "x += 1\nresult = x", "session_id": session_id})
+        data = response.json()
+        assert data["session_cell"] == 2
+        assert data["result"] == 42
+
+    @pytest.mark.asyncio
+    async def test_sessions_are_isolated(self, client, session_id):
+        """Test that another session does not see the variables"""
+        await client.post("/execute", json={"code": "x = 1", "session_id": session_id})
+        other = f"test-{uuid.uuid4()}"
+        response = await client.post("/execute", json={"code": "print(x)", "session_id": other})
+        await client.delete(f"/sessions/{other}")
+        data = response.json()
+        assert data["success"] is False
+        assert "NameError" in data["error"]
+
+    @pytest.mark.asyncio
+    async def test_end_session(self, client, session_id):
+        """Test that DELETE /sessions/{id} drops the variables"""
+        await client.post("/execute", json={"code": "x = 1", "session_id": session_id})
+        response = await client.delete(f"/sessions/{session_id}")
+        assert response.json() == {"session_id": session_id, "ended": True}
+
+        response = await client.post("/execute", json={"code": "print(x)", "session_id": session_id})
+        data = response.json()
+        assert data["success"] is False
+        assert data["session_cell"] == 1
+
+    @pytest.mark.asyncio
+    async def test_session_ends_on_timeout(self, client, session_id):
+        """Test that a timed-out cell starts the next one in a fresh session"""
+        await client.post("/execute", json={"code": "x = 1", "session_id": session_id})
+        response = await client.post("/execute", json={
+            "code": "import time\ntime.sleep(10)", "timeout": 1, "session_id": session_id
+        })
+        assert response.json()["failure_reason"] == "timeout"
+        response = await client.post("/execute", json={"code": "y = 2", "session_id": session_id})
+        assert response.json()["session_cell"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cap_when_all_sessions_busy(self, client, session_id):
+        """Test that a cell beyond CODE_EXECUTOR_MAX_SESSIONS busy sessions runs statelessly"""
+        limit = (await client.get("/metrics")).json()["sessions"]["max"]
+        ids = [session_id] + [f"test-{uuid.uuid4()}" for _ in range(limit)]
+        code = "import time\ntime.sleep(1)\nx = 1"
+        responses = await asyncio.gather(*[
+            client.post("/execute", json={"code": code, "session_id": i}) for i in ids
+        ])
+        sessions = (await client.get("/metrics")).json()["sessions"]
+        for i in ids[1:]:
+            await client.delete(f"/sessions/{i}")
+        results = [r.json() for r in responses]
+        assert all(r["success"] for r in results)
+        assert sum(r["session_cell"] is None for r in results) == 1
+        assert sessions["active"] <= limit
+        assert sessions["full"] >= 1
+
+class TestProfile:
+    """Test execution profiles"""
+
+    @pytest.mark.asyncio
+    async def test_profile_fields(self, client):
+        """Test that every result carries its time, CPU and size breakdown"""
+        code = "total = sum(i * i for i in range(200000))\nprint(total)"
+        response = await client.post("/execute", json={"code": code})
+        data = response.json()
+        assert data["success"] is True
+        profile = data["profile"]
+        assert profile["queue_wait"] is not None and profile["queue_wait"] >= 0
+        assert profile["run_time"] > 0
+        assert profile["wall_time"] >= profile["run_time"]
+        assert profile["cpu_time"] > 0
+        assert profile["peak_rss_delta"] >= 0
+        assert profile["input_bytes"] == len(code.encode("utf-8"))
+        assert profile["output_bytes"] == len(data["stdout"].encode("utf-8"))
+        assert profile["functions"] is None
+
+    @pytest.mark.asyncio
+    async def test_profile_top_functions(self, client):
+        """Test that profile_top reports the slowest functions"""
+        code = "def square_sum(n):\n    return sum(i * i for i in range(n))\nresult = square_sum(200000)"
+        response = await client.post("/execute", json={"code": code, "profile_top": 5})
+        functions = response.json()["profile"]["functions"]
+        assert 0 < len(functions) <= 5
+        assert any("square_sum" in f["function"] for f in functions)
+        assert all(f["cumulative_time"] >= f["total_time"] for f in functions)
+
+    @pytest.mark.asyncio
+    async def test_metrics_aggregate_profiles(self, client):
+        """Test that /metrics aggregates the profiles"""
+        await client.post("/execute", json={"code": "print(1)"})
+        executions = (await client.get("/metrics")).json()["executions"]
+        assert executions["executions"] >= executions["profiled"] >= 1
+        assert executions["average"]["wall_time"] is not None
+        assert executions["input_bytes"] > 0
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+"""
+Unit tests for static validation of generated code (no services needed)
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from orchestrator.services.code_validator import CodeValidator, free_names
+
+COLUMNS = ["timestamp", "uuid", "value"]
+
+
+@pytest.fixture
+def validator():
+    return CodeValidator()
+
+
+class TestPolicy:
+    """Syntax and sandbox policy"""
+
+    def test_syntax_error(self, validator):
+        result = validator.validate("result = (1 +", COLUMNS)
+        assert not result.ok
+        assert result.issues[0].startswith("SyntaxError")
+
+    def test_forbidden_import(self, validator):
+        result = validator.validate("import os\nresult = os.getcwd()", COLUMNS)
+        assert any("import of 'os' is not permitted" in issue for issue in result.issues)
+
+    def test_open_points_to_df(self, validator):
+        code = "import json\nwith open('current_data.json') as f:\n    data = json.load(f)\nresult = len(data)"
+        result = validator.validate(code, COLUMNS)
+        assert any("'open()' is not permitted" in issue for issue in result.issues)
+        assert any("DataFrame 'df'" in issue for issue in result.issues)
+        # Not rewritten: pandas would not return json.load's value for a top-level list
+        assert result.code == code and not result.fixes
+
+
+class TestNames:
+    """Undefined names and missing imports"""
+
+    def test_adds_missing_import(self, validator):
+        result = validator.validate("result = df['timestamp'].max() - timedelta(hours=1)", COLUMNS)
+        assert result.ok
+        assert result.code.startswith("from datetime import timedelta\n")
+        assert result.fixes == ["added from datetime import timedelta"]
+
+    def test_preimported_modules(self, validator):
+        result = validator.validate("result = np.mean(df['value'])", COLUMNS)
+        assert result.ok and not result.fixes
+
+    def test_undefined_name(self, validator):
+        result = validator.validate("result = daily.max()", COLUMNS)
+        assert result.issues == ["name 'daily' is used but never defined"]
+
+    def test_provided_names(self, validator):
+        assert validator.validate("result = plot_df['value'].max()", COLUMNS, provided=("plot_df",)).ok
+
+    def test_free_names(self):
+        code = "import pandas as pd\ndaily = df.resample('1D').mean()\nresult = daily.max() - peak"
+        assert free_names(code) == {"df", "peak"}
+
+
+class TestColumns:
+    """Columns read from the attached frame"""
+
+    def test_unknown_column(self, validator):
+        result = validator.validate("result = df['temperature'].mean()", COLUMNS)
+        assert result.issues == ["column 'temperature' does not exist (available: timestamp, uuid, value)"]
+
+    def test_created_and_filtered_columns(self, validator):
+        code = (
+            "df['hour'] = df['timestamp'].dt.hour\n"
+            "subset = df[df['value'] > 20].copy()\n"
+            "result = subset[['hour', 'value']].mean()"
+        )
+        assert validator.validate(code, COLUMNS).ok
+
+    def test_columns_not_checked_without_schema(self, validator):
+        assert validator.validate("result = df['anything'].mean()").ok
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
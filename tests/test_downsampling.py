@@ -0,0 +1,60 @@
+"""
+Unit tests for plot downsampling (no services needed)
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+
+from shared.config import settings
+from orchestrator.services.downsampling import lttb_indices, point_budget
+
+
+def series(n=1000):
+    x = np.arange(n, dtype=np.int64) * 60_000_000
+    y = np.sin(np.linspace(0, 6 * np.pi, n))
+    return x, y
+
+
+class TestLTTB:
+    """Largest-Triangle-Three-Buckets selection"""
+
+    def test_short_series_kept(self):
+        x, y = series(50)
+        assert lttb_indices(x, y, 100).tolist() == list(range(50))
+
+    def test_first_last_and_extremes_kept(self):
+        x, y = series()
+        y[123], y[877] = 5.0, -5.0
+        keep = lttb_indices(x, y, 100)
+        assert len(keep) == 100
+        assert keep[0] == 0 and keep[-1] == len(x) - 1
+        assert {123, 877} <= set(keep.tolist())
+
+    def test_extremes_in_same_bucket(self):
+        # A spike pair 3 samples apart: both land in one ~10-sample bucket
+        x, y = series()
+        y[500], y[503] = 5.0, -5.0
+        keep = lttb_indices(x, y, 100)
+        assert {500, 503} <= set(keep.tolist())
+        assert np.all(np.diff(keep) > 0)
+        assert len(keep) == 101
+
+
+class TestPointBudget:
+    """Points per series"""
+
+    def test_shared_across_series(self, monkeypatch):
+        monkeypatch.setattr(settings, "PLOT_TARGET_WIDTH", 1000)
+        monkeypatch.setattr(settings, "DOWNSAMPLE_POINTS_PER_PIXEL", 2)
+        monkeypatch.setattr(settings, "DOWNSAMPLE_MIN_POINTS", 100)
+        assert point_budget(1) == 2000
+        assert point_budget(4) == 500
+        assert point_budget(100) == 100
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -189,5 +189,16 @@ class TestOrchestrator:
             assert data["success"] is True
             assert "preferences" in data
 
+    @pytest.mark.asyncio
+    async def test_metrics(self):
+        """Test data-access metrics endpoint"""
+        async with httpx.AsyncClient(base_url=BASE_URL, timeout=300.0) as client:
+            response = await client.get("/metrics")
+            assert response.status_code == 200
+            data = response.json()
+            assert data["success"] is True
+            assert "pool" in data["data"]["mysql"]
+            assert "statements" in data["data"]["mysql"]
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,106 @@
+"""
+Unit tests for deterministic result rendering (no services needed)
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from shared.config import settings
+from orchestrator.services.result_renderer import ResultRenderer, name_tokens, has_hint, UUID_HINTS
+
+
+def literal(value):
+    return {"type": "literal", "value": value}
+
+
+class TestVariableHints:
+    """Variable names are matched by word, not substring"""
+
+    def test_name_tokens(self):
+        assert name_tokens("numberOfFloors") == ["number", "of", "floors"]
+        assert name_tokens("sensor_UUID") == ["sensor", "uuid"]
+
+    @pytest.mark.parametrize("name", ["uuid", "sensorUUID", "timeseriesId", "connString", "id"])
+    def test_uuid_names(self, name):
+        assert has_hint(name, UUID_HINTS)
+
+    @pytest.mark.parametrize("name", ["humidity", "width", "valid"])
+    def test_substring_is_not_uuid(self, name):
+        assert not has_hint(name, UUID_HINTS)
+
+
+class TestSingleValue:
+    """Single-value SPARQL results"""
+
+    @pytest.fixture
+    def renderer(self):
+        return ResultRenderer()
+
+    @pytest.mark.parametrize("name", ["count", "sensorCount", "total"])
+    def test_count(self, renderer, name):
+        assert renderer._render_single_value(name, literal("12"), "") == "There are **12** matching results."
+
+    @pytest.mark.parametrize("name,text", [
+        ("totalArea", "The total area is **12**."),
+        ("numberOfFloors", "The number of floors is **12**."),
+    ])
+    def test_quantity_is_not_a_count(self, renderer, name, text):
+        assert renderer._render_single_value(name, literal("12"), "") == text
+
+    @pytest.mark.parametrize("query,limit", [
+        ("list all sensors", 100),
+        ("show the full set", 100),
+        ("sensors in the hallway", None),
+        ("which sensors are installed", None),
+        ("show the playlist room", None),
+    ])
+    def test_row_limit_matches_words(self, renderer, query, limit):
+        assert renderer._row_limit(query) == (limit or settings.RENDER_MAX_ROWS)
+
+
+class TestSQLSummary:
+    """Per-sensor summaries of fetched readings"""
+
+    @pytest.fixture
+    def renderer(self):
+        return ResultRenderer()
+
+    def test_raw_readings(self, renderer):
+        rows = [
+            {"timestamp": "2024-06-01T00:00:00", "uuid": "a", "value": 1.0},
+            {"timestamp": "2024-06-01T00:01:00", "uuid": "a", "value": 3.0},
+        ]
+        text = renderer._render_summary_stats(rows, None)
+        assert text.startswith("Retrieved **2** readings:")
+        assert "| a | 2 | 2.00 | 1.00 | 3.00 |" in text
+
+    def test_bucketed_readings(self, renderer):
+        rows = [
+            {"timestamp": "2024-06-01T00:00:00", "uuid": "a", "value": 1.0, "min": 0.0, "max": 2.0, "count": 30, "last": 1.5},
+            {"timestamp": "2024-06-01T01:00:00", "uuid": "a", "value": 4.0, "min": 3.0, "max": 9.0, "count": 10, "last": 5.0},
+        ]
+        text = renderer._render_summary_stats(rows, None)
+        assert text.startswith("Retrieved **40** readings in 2 time buckets:")
+        # Count-weighted mean (1.0 x 30 + 4.0 x 10) / 40, extremes from the envelopes
+        assert "| a | 40 | 1.75 | 0.00 | 9.00 |" in text
+
+    def test_latest_bucket_uses_last(self, renderer):
+        rows = [
+            {"timestamp": "2024-06-01T00:00:00", "uuid": "a", "value": 1.0, "min": 0.0, "max": 2.0, "count": 30, "last": 1.5},
+            {"timestamp": "2024-06-01T01:00:00", "uuid": "a", "value": 4.0, "min": 3.0, "max": 9.0, "count": 10, "last": 5.0},
+        ]
+        assert "| a | **5.00** | 2024-06-01 01:00:00 |" in renderer._render_latest_readings(rows, None)
+
+
+    def test_unavailable_sensors_are_named(self, renderer):
+        metadata = {"u1": {"label": "Zone 1 Temp"}}
+        assert renderer.render_unavailable(["u1", "u2", "u1"], metadata) == (
+            "⚠️ Data for 2 sensor(s) could not be retrieved, so these results are incomplete: Zone 1 Temp, u2."
+        )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,51 @@
+"""
+Unit tests for natural-language time windows (no services needed)
+"""
+import sys
+from pathlib import Path
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from orchestrator.services.time_resolver import TimeWindowResolver
+
+
+@pytest.fixture
+def resolver():
+    return TimeWindowResolver(zone="Europe/London", align_seconds=60)
+
+
+class TestRollingWindows:
+    """'last N hours/days' is elapsed time, also across DST changes"""
+
+    # Clocks went forward on 31 March 2024 and back on 27 October 2024
+    @pytest.mark.parametrize("now", [
+        datetime(2024, 3, 31, 12, 0, tzinfo=timezone.utc),
+        datetime(2024, 10, 27, 12, 0, tzinfo=timezone.utc),
+    ])
+    @pytest.mark.parametrize("query,hours", [("last 24 hours", 24), ("over the past 2 days", 48), ("", 24)])
+    def test_elapsed_hours_on_dst_day(self, resolver, now, query, hours):
+        window = resolver.resolve(query, now=now)
+        assert window.end == now
+        assert (window.end - window.start).total_seconds() == hours * 3600
+
+    def test_relative_hint_on_dst_day(self, resolver):
+        now = datetime(2024, 3, 31, 12, 0, tzinfo=timezone.utc)
+        window = resolver.resolve("show the data", start_hint="now-1d", now=now)
+        assert (window.end - window.start).total_seconds() == 24 * 3600
+
+
+class TestCalendarWindows:
+    """Calendar days follow local midnights"""
+
+    def test_yesterday_is_a_short_day_after_spring_forward(self, resolver):
+        now = datetime(2024, 4, 1, 12, 0, tzinfo=timezone.utc)
+        window = resolver.resolve("yesterday", now=now)
+        assert window.start == datetime(2024, 3, 31, 0, 0, tzinfo=timezone.utc)
+        assert window.end == datetime(2024, 3, 31, 23, 0, tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])